@@ -7,3 +7,4 @@ from . import models
 
 
 admin.site.register(models.History)
+admin.site.register(models.Job)
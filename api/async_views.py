@@ -0,0 +1,323 @@
+import asyncio
+import base64
+import functools
+import os
+import tempfile
+import weakref
+
+from asgiref.sync import sync_to_async
+from decouple import config
+from django.http import JsonResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from api import metrics, upstream
+from api.dedup import ImageDeduplicator
+from api.description_cache import description_cache, make_key
+from api.imaging import PayloadStats, normalize_image
+from api.ocr_planner import OcrStats, plan_page
+from api.ocr_router import ocr_router
+from api.pdf_engine import pdf_engine
+from api.quota import RequestBudget, quota_subject
+from api.views import (
+    OCR_LANGUAGES,
+    OPENAI_MODEL,
+    build_description_request,
+    convert_ppt_to_pptx,
+    extract_slides,
+    get_prompt_text,
+    mark_duplicate_images,
+    mark_duplicate_slide_images,
+    save_temporary_ppt,
+)
+
+# Upstream description calls allowed in flight per request
+ASYNC_DESCRIBE_CONCURRENCY = config('ASYNC_DESCRIBE_CONCURRENCY', default=8, cast=int)
+
+# Upstream description calls in flight per event loop, by description cache key
+_inflight = weakref.WeakKeyDictionary()
+
+
+def json_response(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={"ensure_ascii": False})
+
+
+async def run_in_executor(func, *args):
+    # CPU-bound work (PIL, fitz, tesseract) must not block the event loop
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(func, *args))
+
+
+async def describe_image_with_gpt_async(base64_image, prompt_text, mime_type="image/jpeg"):
+    headers, payload = build_description_request(base64_image, prompt_text, mime_type)
+    with metrics.stage("describe"):
+        response = await upstream.async_post(upstream.openai_url("chat/completions"), headers=headers, json=payload)
+    response.raise_for_status()
+    response_json = response.json()
+    return response_json["choices"][0]["message"]["content"]
+
+
+def lookup_description(image_bytes, prompt_text):
+    key = make_key(image_bytes, prompt_text, OPENAI_MODEL)
+    return key, description_cache.get(key)
+
+
+async def describe_image_async(image_bytes, prompt_text, semaphore, remaining_images_counter=None,
+                               payload_stats=None):
+    """Async counterpart of views.describe_image, bounded by the request's semaphore.
+
+    Concurrent requests for the same image share one upstream call; only the
+    caller that issues it is billed.
+    """
+    key, description = await sync_to_async(lookup_description)(image_bytes, prompt_text)
+    if description is not None:
+        return description, False
+
+    inflight = _inflight.setdefault(asyncio.get_running_loop(), {})
+    while key in inflight:
+        description = await asyncio.shield(inflight[key])
+        if description is not None:
+            return description, False
+        # The caller that went first had no budget left for it; try on this request's budget
+
+    # Registered before the first await, so concurrent misses wait for this call instead of making their own
+    future = asyncio.get_running_loop().create_future()
+    inflight[key] = future
+    reserved = False
+    try:
+        # Reserving can hit the quota tables, so it runs off the event loop
+        if remaining_images_counter is not None:
+            reserved = await sync_to_async(remaining_images_counter.decrement)()
+            if not reserved:
+                future.set_result(None)
+                return None, False
+        payload, mime_type = await run_in_executor(normalize_image, image_bytes)
+        if payload_stats is not None:
+            payload_stats.add(len(image_bytes), len(payload))
+
+        async with semaphore:
+            description = await describe_image_with_gpt_async(
+                base64.b64encode(payload).decode("utf-8"), prompt_text, mime_type
+            )
+        await sync_to_async(description_cache.set)(key, description)
+        future.set_result(description)
+        return description, True
+    except BaseException as e:
+        future.set_exception(e)
+        if reserved:
+            await sync_to_async(remaining_images_counter.refund)()
+        future.exception()  # waiters re-raise it; keep asyncio from logging it as unretrieved
+        raise
+    finally:
+        del inflight[key]
+
+
+def save_upload(uploaded_file, suffix):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+        for chunk in uploaded_file.chunks():
+            temp_file.write(chunk)
+        return temp_file.name
+
+
+def extract_pdf_pages(pdf_path, extract_images, render_textless=False):
+    # PyMuPDF handles are not thread-safe, so one executor call drives the whole document
+    return list(pdf_engine.iter_pages(pdf_path, extract_images, render_textless=render_textless))
+
+
+def remove_files(*paths):
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class DescribeImageAsyncView(View):
+    async def post(self, request):
+        image_files = request.FILES.getlist("images")
+        language = request.POST.get("language", "English")
+        if not image_files:
+            return json_response({"error": "At least one image file is required."}, status=400)
+
+        prompt_text = get_prompt_text(language)
+        semaphore = asyncio.Semaphore(ASYNC_DESCRIBE_CONCURRENCY)
+        payload_stats = PayloadStats()
+        budget = RequestBudget(await sync_to_async(quota_subject)(request), len(image_files))
+
+        async def describe_file(image_file):
+            image_bytes = await run_in_executor(image_file.read)
+            description, _ = await describe_image_async(image_bytes, prompt_text, semaphore, budget, payload_stats)
+            return {"filename": image_file.name, "description": description}
+
+        try:
+            descriptions = await asyncio.gather(*(describe_file(image_file) for image_file in image_files))
+            return json_response({
+                "descriptions": list(descriptions),
+                "bytes_saved": payload_stats.bytes_saved,
+                "quota": await sync_to_async(budget.report)(),
+            })
+
+        except Exception as e:
+            return json_response({"error": str(e)}, status=500)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ExtractTextFromPDFAsyncView(View):
+    async def post(self, request):
+        pdf_file = request.FILES.get("pdf_file")
+        ocr_option = str(request.POST.get("ocr", "false")).lower() == "true"
+        image_description_option = str(request.POST.get("image_description", "false")).lower() == "true"
+        remaining_images = int(request.POST.get("rImages", 25))
+        language = request.POST.get("language", "English")
+
+        if not pdf_file:
+            return json_response({"error": "PDF file is required."}, status=400)
+
+        lang_code = OCR_LANGUAGES.get(language, "eng")
+        prompt_text = get_prompt_text(language)
+        remaining_images_counter = RequestBudget(await sync_to_async(quota_subject)(request), remaining_images)
+        semaphore = asyncio.Semaphore(ASYNC_DESCRIBE_CONCURRENCY)
+        payload_stats = PayloadStats()
+        ocr_stats = OcrStats() if ocr_option else None
+
+        async def process_page(extracted_page):
+            page_number = extracted_page["page_number"]
+            indexed = [(index, image) for index, image in enumerate(extracted_page["images"])
+                       if image["duplicate_of"] is None]
+            images = [image["image"] for _, image in indexed]
+            repeated = [image for image in extracted_page["images"] if image["duplicate_of"] is not None]
+            text_content = f"Page {page_number}:\n{extracted_page['text']}\n"
+
+            async def ocr_images():
+                if not ocr_option:
+                    return None, [None] * len(images)
+                # Decoding images to plan OCR is CPU work, so it stays off the event loop
+                page_image, reasons = await run_in_executor(plan_page, extracted_page, indexed)
+                ocr_stats.record(page_number, page_image, reasons)
+                ocr_futures = {
+                    index: ocr_router.submit(image["image"], lang_code)
+                    for index, image in indexed if reasons[index] is None
+                }
+                if page_image is not None:
+                    ocr_futures["page"] = ocr_router.submit(page_image, lang_code)
+                ocr_texts = await asyncio.gather(*(asyncio.wrap_future(future) for future in ocr_futures.values()))
+                ocr_texts = dict(zip(ocr_futures, ocr_texts))
+                return ocr_texts.get("page"), [ocr_texts.get(index) for index, _ in indexed]
+
+            async def describe_images():
+                if not image_description_option:
+                    return [(None, False)] * len(images)
+                return await asyncio.gather(
+                    *(describe_image_async(image_bytes, prompt_text, semaphore, remaining_images_counter, payload_stats)
+                      for image_bytes in images)
+                )
+
+            (page_ocr_text, ocr_texts), descriptions = await asyncio.gather(ocr_images(), describe_images())
+            if page_ocr_text is not None:
+                text_content += f"\n OCR Text from page {page_number}: {page_ocr_text}\n"
+
+            image_description_count = 0
+            for ocr_text, (description, billed) in zip(ocr_texts, descriptions):
+                if ocr_text is not None:
+                    text_content += f"\n OCR Text from image on page {page_number}: {ocr_text}\n"
+                if description is not None:
+                    text_content += f"\n Image description on page {page_number}: {description}\n"
+                if billed:
+                    image_description_count += 1
+
+            for image in repeated:
+                text_content += f"\n Repeated image on page {page_number}: see page {image['duplicate_of']}\n"
+
+            return text_content, image_description_count
+
+        temp_pdf_path = None
+        try:
+            temp_pdf_path = await run_in_executor(save_upload, pdf_file, ".pdf")
+            pages = await run_in_executor(
+                extract_pdf_pages, temp_pdf_path, ocr_option or image_description_option, ocr_option
+            )
+
+            # OCR text is only reused for identical images
+            deduplicator = ImageDeduplicator(near_duplicates=not ocr_option)
+            for extracted_page in pages:
+                mark_duplicate_images(extracted_page, deduplicator)
+
+            results = await asyncio.gather(*(process_page(extracted_page) for extracted_page in pages))
+            text_content = "".join(page_text for page_text, _ in results)
+            image_description_count = sum(img_count for _, img_count in results)
+
+            data = {
+                "text_content": text_content,
+                "count": image_description_count,
+                "bytes_saved": payload_stats.bytes_saved,
+                "quota": await sync_to_async(remaining_images_counter.report)(),
+            }
+            if ocr_stats is not None:
+                data["ocr"] = ocr_stats.report()
+            return json_response(data)
+
+        except Exception as e:
+            return json_response({"error": str(e)}, status=500)
+
+        finally:
+            await run_in_executor(remove_files, temp_pdf_path)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class PptxProcessorAsyncAPIView(View):
+    async def post(self, request, *args, **kwargs):
+        pptx_file = request.FILES.get("file")
+        language = request.POST.get("language", "English")
+        image_description = str(request.POST.get("image_description", "true")).lower() == "true"
+        remaining_images = int(request.POST.get("rImages", 25))
+
+        if not pptx_file:
+            return json_response({"error": "No file uploaded."}, status=400)
+
+        prompt_text = get_prompt_text(language)
+        remaining_images_counter = RequestBudget(await sync_to_async(quota_subject)(request), remaining_images)
+        semaphore = asyncio.Semaphore(ASYNC_DESCRIBE_CONCURRENCY)
+        payload_stats = PayloadStats()
+
+        async def process_slide(slide_content):
+            if not image_description:
+                slide_content.pop("images", None)
+                return slide_content, 0
+
+            async def describe_slide_image(image):
+                if image["duplicate_of"] is not None:
+                    return f"(same image as slide {image['duplicate_of']})", False
+                return await describe_image_async(
+                    image["image"], prompt_text, semaphore, remaining_images_counter, payload_stats
+                )
+
+            results = await asyncio.gather(*(describe_slide_image(image) for image in slide_content["images"]))
+            slide_content["images"] = [description for description, _ in results if description is not None]
+            return slide_content, sum(1 for _, billed in results if billed)
+
+        temp_file_path = pptx_file_path = None
+        try:
+            temp_file_path = await run_in_executor(save_temporary_ppt, pptx_file)
+            pptx_file_path = temp_file_path
+            if pptx_file.name.lower().endswith(".ppt"):
+                pptx_file_path = await run_in_executor(convert_ppt_to_pptx, temp_file_path)
+
+            slides = await run_in_executor(extract_slides, pptx_file_path, image_description)
+            if image_description:
+                await run_in_executor(mark_duplicate_slide_images, slides)
+            results = await asyncio.gather(*(process_slide(slide_content) for slide_content in slides))
+
+            slides_content = [slide_content for slide_content, _ in results]
+            image_description_count = sum(billed_count for _, billed_count in results)
+            return json_response({
+                "slides": slides_content,
+                "count": image_description_count,
+                "bytes_saved": payload_stats.bytes_saved,
+                "quota": await sync_to_async(remaining_images_counter.report)(),
+            })
+
+        except Exception as e:
+            return json_response({"error": str(e)}, status=500)
+
+        finally:
+            await run_in_executor(remove_files, temp_file_path, pptx_file_path)
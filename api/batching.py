@@ -0,0 +1,267 @@
+"""Batched image descriptions: several images in one chat-completions request.
+
+A batch asks the model for a JSON object with one description per image, in
+order. A reply that does not split into exactly that many descriptions falls
+back to one request per image, so a batch never costs more than the images
+would have cost on their own, apart from the failed request itself.
+"""
+import base64
+import functools
+import io
+import json
+import logging
+from concurrent.futures import Future, InvalidStateError
+
+from decouple import config
+
+from api import deadlines, metrics, upstream
+from api.description_cache import description_cache, make_key
+from api.imaging import normalize_image
+
+# Most images packed into one request; 1 sends every image on its own
+DESCRIBE_BATCH_MAX_IMAGES = config('DESCRIBE_BATCH_MAX_IMAGES', default=8, cast=int)
+
+# Limits on the images of one request after normalization: pixels drive the model's
+# image tokens, bytes the request size
+DESCRIBE_BATCH_MAX_PIXELS = config('DESCRIBE_BATCH_MAX_PIXELS', default=8 * 1024 * 1024, cast=int)
+DESCRIBE_BATCH_MAX_BYTES = config('DESCRIBE_BATCH_MAX_BYTES', default=4 * 1024 * 1024, cast=int)
+
+# Completion tokens per image, as for a single description
+TOKENS_PER_IMAGE = 325
+
+logger = logging.getLogger(__name__)
+
+
+def prepare(image_bytes):
+    """Normalizes an image for upload; returns (payload, mime_type, pixels)."""
+    from PIL import Image
+
+    with metrics.stage("normalize"):
+        payload, mime_type = normalize_image(image_bytes)
+    try:
+        with Image.open(io.BytesIO(payload)) as image:
+            pixels = image.width * image.height
+    except (OSError, ValueError, Image.DecompressionBombError):
+        pixels = 0
+    return payload, mime_type, pixels
+
+
+def plan_batches(sizes, max_images=None, max_pixels=None, max_bytes=None):
+    """Groups consecutive (pixels, bytes) sizes into batches; returns lists of positions.
+
+    An image over a budget on its own still gets a batch, by itself.
+    """
+    max_images = max_images or DESCRIBE_BATCH_MAX_IMAGES
+    max_pixels = max_pixels or DESCRIBE_BATCH_MAX_PIXELS
+    max_bytes = max_bytes or DESCRIBE_BATCH_MAX_BYTES
+
+    batches = []
+    batch, pixels, size = [], 0, 0
+    for position, (image_pixels, image_size) in enumerate(sizes):
+        if batch and (len(batch) >= max_images or pixels + image_pixels > max_pixels or size + image_size > max_bytes):
+            batches.append(batch)
+            batch, pixels, size = [], 0, 0
+        batch.append(position)
+        pixels += image_pixels
+        size += image_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def build_batch_request(images, prompt_text):
+    """Builds one request for [(payload, mime_type)], asking for a description of each."""
+    from api.views import OPENAI_MODEL, openai_headers
+
+    count = len(images)
+    instructions = (
+        f"{prompt_text}\n\nThere are {count} images, labelled Image 1 to Image {count}. "
+        f"Describe each image on its own. Answer with only a JSON object of the form "
+        f'{{"descriptions": ["<description of image 1>", ...]}} holding exactly {count} strings, '
+        f"in image order."
+    )
+    content = [{"type": "text", "text": instructions}]
+    for number, (image_payload, mime_type) in enumerate(images, start=1):
+        content.append({"type": "text", "text": f"Image {number}:"})
+        content.append({
+            "type": "image_url",
+            "image_url": {"url": f"data:{mime_type};base64,{base64.b64encode(image_payload).decode('utf-8')}"},
+        })
+    payload = {
+        "model": OPENAI_MODEL,
+        "messages": [{"role": "user", "content": content}],
+        "max_tokens": TOKENS_PER_IMAGE * count,
+        "response_format": {"type": "json_object"},
+    }
+    return openai_headers(), payload
+
+
+def parse_batch_response(content, count):
+    """Splits a batch reply into count descriptions, or returns None if it does not fit."""
+    text = (content or "").strip()
+    if text.startswith("```"):
+        # Some replies wrap the JSON in a fenced block despite the response format
+        text = text.strip("`").strip()
+        if text.startswith("json"):
+            text = text[4:]
+    try:
+        descriptions = json.loads(text)
+    except ValueError:
+        return None
+    if isinstance(descriptions, dict):
+        descriptions = descriptions.get("descriptions")
+    if not isinstance(descriptions, list) or len(descriptions) != count:
+        return None
+    if not all(isinstance(description, str) and description.strip() for description in descriptions):
+        return None
+    return [description.strip() for description in descriptions]
+
+
+def describe_batch(images, prompt_text):
+    """Describes [(payload, mime_type)] in one request; returns the descriptions or None."""
+    headers, payload = build_batch_request(images, prompt_text)
+    with metrics.stage("describe"):
+        response = upstream.post(upstream.openai_url("chat/completions"), headers=headers, json=payload)
+    response.raise_for_status()
+    return parse_batch_response(response.json()["choices"][0]["message"]["content"], len(images))
+
+
+def settle(future, result=None, error=None):
+    # The caller may have given up on the future (e.g. at its deadline) and cancelled it
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def refund(batch, budget):
+    # Nothing was described, so the budget reserved for every image goes back
+    if budget is not None:
+        for _ in batch:
+            budget.refund()
+
+
+class PendingImage:
+    def __init__(self, key, image_bytes):
+        self.key = key
+        self.image_bytes = image_bytes
+        self.payload = None
+        self.mime_type = None
+        # Futures of every copy of this image in the call; the first one is billed
+        self.futures = []
+
+    def resolve(self, description):
+        description_cache.set(self.key, description)
+        for index, future in enumerate(self.futures):
+            settle(future, (description, index == 0))
+
+    def fail(self, error):
+        for future in self.futures:
+            settle(future, error=error)
+
+    def cancel(self):
+        for future in self.futures:
+            future.cancel()
+
+
+def cancel_batch(batch, budget):
+    # Refunds come first, so a caller's future being done already cannot keep one back
+    refund(batch, budget)
+    for item in batch:
+        item.cancel()
+
+
+def fail_batch(batch, budget, error):
+    refund(batch, budget)
+    for item in batch:
+        item.fail(error)
+
+
+def cancel_unsent(batch, budget, task):
+    # A batch cancelled before it ran must not leave callers waiting on its images
+    if task.cancelled():
+        cancel_batch(batch, budget)
+
+
+def run_batch(batch, prompt_text, budget):
+    from api.views import describe_image_with_gpt
+
+    if deadlines.expired():
+        # The request has given up on these images; do not spend upstream quota on them
+        cancel_batch(batch, budget)
+        return
+
+    metrics.DESCRIBE_BATCH_IMAGES.observe(len(batch))
+    descriptions = None
+    if len(batch) > 1:
+        try:
+            descriptions = describe_batch([(item.payload, item.mime_type) for item in batch], prompt_text)
+        except Exception as e:
+            fail_batch(batch, budget, e)
+            return
+        if descriptions is None:
+            metrics.DESCRIBE_BATCH_FALLBACKS.inc()
+            logger.warning("Batched description reply did not parse; describing %d images one by one", len(batch))
+
+    for position, item in enumerate(batch):
+        if descriptions is not None:
+            item.resolve(descriptions[position])
+            continue
+        if deadlines.expired():
+            cancel_batch([item], budget)
+            continue
+        try:
+            encoded = base64.b64encode(item.payload).decode("utf-8")
+            description = describe_image_with_gpt(encoded, prompt_text, item.mime_type)
+        except Exception as e:
+            fail_batch([item], budget, e)
+            continue
+        item.resolve(description)
+
+
+def submit_descriptions(executor, images, prompt_text, budget=None, payload_stats=None, deadline=None):
+    """Describes image bytes in batched upstream requests run on executor.
+
+    Returns one future per image resolving to (description, billed), as
+    views.describe_image returns. Cache hits and repeats of an image within the
+    call are not billed, and description is None once the budget runs out.
+    Budget is reserved here, in image order, before any request is sent.
+    Batches not sent by the deadline are cancelled and their budget refunded.
+    """
+    from api.views import OPENAI_MODEL
+
+    futures = [Future() for _ in images]
+    pending = {}
+    for image_bytes, future in zip(images, futures):
+        key = make_key(image_bytes, prompt_text, OPENAI_MODEL)
+        if key in pending:
+            pending[key].futures.append(future)
+            continue
+        description = description_cache.get(key)
+        if description is not None:
+            future.set_result((description, False))
+            continue
+        if budget is not None and not budget.decrement():
+            future.set_result((None, False))
+            continue
+        pending[key] = PendingImage(key, image_bytes)
+        pending[key].futures.append(future)
+
+    pending = list(pending.values())
+    prepared = list(executor.map(metrics.bind(prepare), [item.image_bytes for item in pending]))
+    sizes = []
+    for item, (payload, mime_type, pixels) in zip(pending, prepared):
+        if payload_stats is not None:
+            payload_stats.add(len(item.image_bytes), len(payload))
+        metrics.BYTES_PROCESSED.inc(len(payload), kind="upstream_payload")
+        item.payload, item.mime_type = payload, mime_type
+        sizes.append((pixels, len(payload)))
+
+    for positions in plan_batches(sizes):
+        batch = [pending[position] for position in positions]
+        task = executor.submit(deadlines.bind(metrics.bind(run_batch), deadline), batch, prompt_text, budget)
+        task.add_done_callback(functools.partial(cancel_unsent, batch, budget))
+    return futures
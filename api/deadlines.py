@@ -0,0 +1,154 @@
+"""Per-request time budgets.
+
+A view creates a Deadline from the request's "deadline" field (seconds) or
+REQUEST_DEADLINE_SECONDS. Worker threads run under it with bind() or applied(),
+which lets upstream.post shorten its timeouts and refuse to start calls once it
+has expired. Work that did not finish in time is recorded on the deadline and
+reported next to the partial result.
+"""
+import concurrent.futures
+import contextlib
+import contextvars
+import threading
+import time
+
+from decouple import config
+
+# Default time budget for a synchronous request in seconds; 0 means none
+REQUEST_DEADLINE_SECONDS = config('REQUEST_DEADLINE_SECONDS', default=120.0, cast=float)
+
+# Largest budget a client may ask for
+REQUEST_DEADLINE_MAX_SECONDS = config('REQUEST_DEADLINE_MAX_SECONDS', default=600.0, cast=float)
+
+# Once the budget runs out, work already under way gets this long to wrap up
+DEADLINE_GRACE_SECONDS = config('DEADLINE_GRACE_SECONDS', default=0.5, cast=float)
+
+# Skipped items listed one by one in a response; the count always covers all of them
+SKIP_REPORT_LIMIT = 100
+
+current_deadline = contextvars.ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """A request's time budget and the work skipped when it ran out.
+
+    unit names what the request is made of ("pages", "slides"); skipped units are
+    reported as ranges, anything finer (an image's OCR, a description) as items.
+    """
+
+    def __init__(self, seconds, unit=None):
+        self.seconds = seconds
+        self.unit = unit
+        self.expires_at = time.monotonic() + seconds
+        self.lock = threading.Lock()
+        self.skipped_units = set()
+        self.skipped_items = []
+        self.skipped_item_count = 0
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def skip(self, number):
+        with self.lock:
+            self.skipped_units.add(number)
+
+    def skip_item(self, **item):
+        with self.lock:
+            self.skipped_item_count += 1
+            if len(self.skipped_items) < SKIP_REPORT_LIMIT:
+                self.skipped_items.append(item)
+
+    def partial(self):
+        with self.lock:
+            return bool(self.skipped_units or self.skipped_item_count)
+
+    def report(self):
+        from api.ranges import format_ranges
+
+        with self.lock:
+            report = {"seconds": self.seconds, "expired": self.expired()}
+            if self.unit is not None:
+                report[f"skipped_{self.unit}"] = format_ranges(sorted(self.skipped_units))
+            report["skipped"] = sorted(self.skipped_items, key=lambda item: [str(value) for value in item.values()])
+            report["skipped_count"] = self.skipped_item_count
+            return report
+
+
+def requested_deadline(data, unit=None):
+    """Returns the Deadline a request asks for, or None for no budget; raises ValueError if malformed."""
+    value = data.get("deadline")
+    if value in (None, ""):
+        seconds = REQUEST_DEADLINE_SECONDS
+    else:
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            raise ValueError("deadline must be a number of seconds.")
+        if not 0 < seconds <= REQUEST_DEADLINE_MAX_SECONDS:
+            raise ValueError(f"deadline must be between 0 and {REQUEST_DEADLINE_MAX_SECONDS:g} seconds.")
+    return Deadline(seconds, unit) if seconds > 0 else None
+
+
+@contextlib.contextmanager
+def applied(deadline):
+    token = current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def bind(func, deadline):
+    """Wraps func to run under deadline; executor threads do not inherit it."""
+    if deadline is None:
+        return func
+
+    def run(*args, **kwargs):
+        with applied(deadline):
+            return func(*args, **kwargs)
+
+    return run
+
+
+def expired():
+    deadline = current_deadline.get()
+    return deadline is not None and deadline.expired()
+
+
+def remaining():
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline.remaining()
+
+
+def skip_item(**item):
+    deadline = current_deadline.get()
+    if deadline is not None:
+        deadline.skip_item(**item)
+
+
+def result(future, deadline=None, grace=0.0):
+    """future.result(), bounded by the deadline (the current one by default) plus grace.
+
+    The grace period counts from the deadline, so waiting on many futures in turn
+    never runs past expiry plus grace. On timeout the future is cancelled, if it
+    has not started, and DeadlineExceeded is raised. A cancelled future raises
+    DeadlineExceeded too.
+    """
+    deadline = deadline or current_deadline.get()
+    timeout = None if deadline is None else max(0.0, deadline.expires_at + grace - time.monotonic())
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise DeadlineExceeded()
+    except concurrent.futures.CancelledError:
+        if deadline is None:
+            raise
+        raise DeadlineExceeded()
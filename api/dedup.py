@@ -0,0 +1,104 @@
+import hashlib
+import io
+
+from decouple import config
+
+# Max differing bits between two 1024-bit difference hashes for images to count as the same;
+# pages of different text typically differ in 90 or more, re-encoded copies of an image in under 30
+DEDUP_HASH_DISTANCE = config('DEDUP_HASH_DISTANCE', default=32, cast=int)
+
+# Max per-channel difference of the mean colour; dHash alone cannot tell flat images apart
+DEDUP_COLOR_DISTANCE = config('DEDUP_COLOR_DISTANCE', default=16, cast=int)
+
+# Near duplicates must have about the same aspect ratio, and be at most this many times larger
+DEDUP_ASPECT_TOLERANCE = 0.05
+DEDUP_MAX_SCALE = 4
+
+# The difference hash compares HASH_SIZE + 1 columns in each of HASH_SIZE rows
+HASH_SIZE = 32
+
+
+def image_signature(image_bytes):
+    """Returns (digest, dhash, mean_rgb, size) for duplicate matching.
+
+    digest identifies the exact bytes; the rest is for near duplicates and is
+    None when PIL cannot decode the image.
+    """
+    from PIL import Image
+
+    digest = hashlib.sha1(image_bytes).digest()
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            size = image.size
+            image.draft("RGB", (HASH_SIZE * 8, HASH_SIZE * 8))
+            image = image.convert("RGB")
+            mean_rgb = image.resize((1, 1), Image.BOX).getpixel((0, 0))
+            pixels = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS).tobytes()
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return digest, None, None, None
+
+    dhash = 0
+    for row in range(HASH_SIZE):
+        for col in range(HASH_SIZE):
+            position = row * (HASH_SIZE + 1) + col
+            dhash = (dhash << 1) | (pixels[position] > pixels[position + 1])
+    return digest, dhash, mean_rgb, size
+
+
+def signatures_match(first, second):
+    """True if two signatures look like the same picture, re-encoded or rescaled."""
+    _, first_hash, first_rgb, first_size = first
+    _, second_hash, second_rgb, second_size = second
+    if first_hash is None or second_hash is None:
+        return False
+
+    first_aspect = first_size[0] / max(1, first_size[1])
+    second_aspect = second_size[0] / max(1, second_size[1])
+    if abs(first_aspect - second_aspect) > DEDUP_ASPECT_TOLERANCE * max(first_aspect, second_aspect):
+        return False
+    first_pixels = max(1, first_size[0] * first_size[1])
+    second_pixels = max(1, second_size[0] * second_size[1])
+    if max(first_pixels, second_pixels) > DEDUP_MAX_SCALE ** 2 * min(first_pixels, second_pixels):
+        return False
+
+    if bin(first_hash ^ second_hash).count("1") > DEDUP_HASH_DISTANCE:
+        return False
+    return all(abs(a - b) <= DEDUP_COLOR_DISTANCE for a, b in zip(first_rgb, second_rgb))
+
+
+class ImageDeduplicator:
+    """Tracks the images already seen in one document.
+
+    Feed images in document order. check() returns the reference of the first
+    matching image, or None after recording this one as an original. Images
+    match on their key (xref, part hash) or their exact bytes, and with
+    near_duplicates also when they look the same. OCR must only reuse results
+    for exact matches: near-duplicate text images can hold different text.
+    """
+
+    def __init__(self, near_duplicates=True):
+        self.near_duplicates = near_duplicates
+        self.by_key = {}
+        self.by_digest = {}
+        self.signatures = []
+
+    def check(self, key, signature, ref):
+        if key is not None and key in self.by_key:
+            return self.by_key[key]
+
+        original = None
+        if signature is not None:
+            original = self.by_digest.get(signature[0])
+            if original is None and self.near_duplicates:
+                for seen_signature, seen_ref in self.signatures:
+                    if signatures_match(signature, seen_signature):
+                        original = seen_ref
+                        break
+            if original is None:
+                self.by_digest[signature[0]] = ref
+                if self.near_duplicates:
+                    self.signatures.append((signature, ref))
+
+        if key is not None:
+            self.by_key[key] = original if original is not None else ref
+        return original
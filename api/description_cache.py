@@ -0,0 +1,120 @@
+import datetime
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from decouple import config
+from django.db import DatabaseError
+from django.utils import timezone
+
+from api import metrics, models
+
+# In-process LRU size, persistent TTL (seconds) and persistent row cap
+DESCRIPTION_CACHE_SIZE = config('DESCRIPTION_CACHE_SIZE', default=1024, cast=int)
+DESCRIPTION_CACHE_TTL = config('DESCRIPTION_CACHE_TTL', default=60 * 60 * 24 * 30, cast=int)
+DESCRIPTION_CACHE_MAX_ROWS = config('DESCRIPTION_CACHE_MAX_ROWS', default=100000, cast=int)
+
+# Run the persistent eviction pass once every this many writes
+EVICTION_INTERVAL = 200
+
+
+def make_key(image_bytes, prompt_text, model):
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(image_bytes).digest())
+    digest.update(prompt_text.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(model.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class DescriptionCache:
+    def __init__(self, max_entries, ttl, max_rows):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                description, stored_at = entry
+                if now - stored_at < self.ttl:
+                    self.entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return description
+                del self.entries[key]
+
+        description = self._get_persistent(key)
+
+        with self.lock:
+            if description is None:
+                self.misses += 1
+                return None
+            self.persistent_hits += 1
+            self._remember(key, description, now)
+        return description
+
+    def set(self, key, description):
+        with self.lock:
+            self._remember(key, description, time.monotonic())
+            self.writes += 1
+            evict = self.writes % EVICTION_INTERVAL == 0
+
+        try:
+            models.ImageDescription.objects.update_or_create(
+                key=key, defaults={"description": description, "created_at": timezone.now()}
+            )
+            if evict:
+                self.evict()
+        except DatabaseError:
+            pass
+
+    def evict(self):
+        cutoff = timezone.now() - datetime.timedelta(seconds=self.ttl)
+        models.ImageDescription.objects.filter(created_at__lt=cutoff).delete()
+
+        stale = models.ImageDescription.objects.order_by("-last_used_at").values_list("id", flat=True)[self.max_rows:]
+        stale_ids = list(stale)
+        if stale_ids:
+            models.ImageDescription.objects.filter(id__in=stale_ids).delete()
+
+    def stats(self):
+        with self.lock:
+            hits = self.memory_hits + self.persistent_hits
+            lookups = hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "persistent_hits": self.persistent_hits,
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self.entries),
+            }
+
+    def _get_persistent(self, key):
+        cutoff = timezone.now() - datetime.timedelta(seconds=self.ttl)
+        try:
+            rows = models.ImageDescription.objects.filter(key=key, created_at__gte=cutoff)
+            description = rows.values_list("description", flat=True).first()
+            if description is not None:
+                rows.update(last_used_at=timezone.now())
+            return description
+        except DatabaseError:
+            return None
+
+    def _remember(self, key, description, stored_at):
+        self.entries[key] = (description, stored_at)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+
+description_cache = DescriptionCache(DESCRIPTION_CACHE_SIZE, DESCRIPTION_CACHE_TTL, DESCRIPTION_CACHE_MAX_ROWS)
+metrics.track_stats(metrics.CACHE_STATS, description_cache.stats, cache="description")
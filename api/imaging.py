@@ -0,0 +1,96 @@
+import io
+import threading
+
+from decouple import config
+
+# Longest edge sent to the vision model; gpt-4o scales anything larger down to fit 2048x2048
+IMAGE_MAX_EDGE = config('IMAGE_MAX_EDGE', default=2048, cast=int)
+
+# Target payload size per image in bytes, before base64
+IMAGE_BYTE_BUDGET = config('IMAGE_BYTE_BUDGET', default=512 * 1024, cast=int)
+
+# Never downscale below this edge while trying to meet the byte budget
+IMAGE_MIN_EDGE = 512
+
+JPEG_QUALITIES = (85, 75, 60, 45)
+
+# Formats the vision model accepts as-is, by PIL format name
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+
+class PayloadStats:
+    def __init__(self):
+        self.original_bytes = 0
+        self.sent_bytes = 0
+        self.lock = threading.Lock()
+
+    def add(self, original_size, sent_size):
+        with self.lock:
+            self.original_bytes += original_size
+            self.sent_bytes += sent_size
+
+    @property
+    def bytes_saved(self):
+        with self.lock:
+            return self.original_bytes - self.sent_bytes
+
+
+def to_rgb(image):
+    if image.mode == "P":
+        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+    if image.mode in ("RGBA", "LA", "PA"):
+        from PIL import Image
+
+        # Flatten transparency onto white, JPEG has no alpha channel
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.convert("RGBA").getchannel("A"))
+        return background
+
+    if image.mode not in ("RGB", "L"):
+        return image.convert("RGB")
+    return image
+
+
+def encode_jpeg(image):
+    for quality in JPEG_QUALITIES:
+        buffered = io.BytesIO()
+        image.save(buffered, format="JPEG", quality=quality, optimize=True)
+        if buffered.tell() <= IMAGE_BYTE_BUDGET:
+            break
+    return buffered.getvalue()
+
+
+def normalize_image(image_bytes):
+    """Prepares image bytes for the vision model.
+
+    Returns (payload_bytes, mime_type). Compact images in a format the model
+    accepts are passed through untouched; everything else is flattened to RGB,
+    capped at IMAGE_MAX_EDGE and re-encoded as JPEG within IMAGE_BYTE_BUDGET.
+    """
+    # PIL loads on the first image rather than at worker startup
+    from PIL import Image
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        fits = max(image.size) <= IMAGE_MAX_EDGE and len(image_bytes) <= IMAGE_BYTE_BUDGET
+        if fits and image.format in PASSTHROUGH_FORMATS and image.mode in ("RGB", "L", "RGBA", "P"):
+            return image_bytes, PASSTHROUGH_FORMATS[image.format]
+
+        # Let the JPEG decoder skip detail we would throw away anyway
+        image.draft("RGB", (IMAGE_MAX_EDGE, IMAGE_MAX_EDGE))
+        image = to_rgb(image)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        # Formats PIL cannot decode go upstream as they are
+        return image_bytes, "image/jpeg"
+
+    if max(image.size) > IMAGE_MAX_EDGE:
+        image.thumbnail((IMAGE_MAX_EDGE, IMAGE_MAX_EDGE), Image.LANCZOS)
+
+    encoded = encode_jpeg(image)
+    while len(encoded) > IMAGE_BYTE_BUDGET and max(image.size) * 3 // 4 >= IMAGE_MIN_EDGE:
+        edge = max(image.size) * 3 // 4
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        encoded = encode_jpeg(image)
+
+    return encoded, "image/jpeg"
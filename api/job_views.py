@@ -0,0 +1,83 @@
+import time
+
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from api.jobs import JOB_POLL_INTERVAL, job_page_event, job_runner, job_status
+from api.models import Job
+from api.quota import quota_subject
+from api.streaming import requested_stream_format, streaming_response
+
+
+def submit_job(kind, document, options):
+    job = Job.objects.create(kind=kind, document=document, options=options)
+    job_runner.start()
+    job_runner.notify()
+    return Response(job_status(job), status=status.HTTP_202_ACCEPTED)
+
+
+def iter_job_events(job_id):
+    last_number = None
+    while True:
+        # Read the job before its pages, so a finished job's pages are all visible
+        job = Job.objects.get(pk=job_id)
+        pages = job.pages.all() if last_number is None else job.pages.filter(number__gt=last_number)
+        for page in pages:
+            last_number = page.number
+            yield job_page_event(job, page)
+
+        if job.status == Job.DONE:
+            yield "summary", {"count": job.count, "bytes_saved": job.bytes_saved}
+            return
+        if job.status == Job.FAILED:
+            yield "error", {"error": job.error}
+            return
+        time.sleep(JOB_POLL_INTERVAL)
+
+
+class PdfJobView(APIView):
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        pdf_file = request.FILES.get("pdf_file")
+        if not pdf_file:
+            return Response({"error": "PDF file is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return submit_job(Job.KIND_PDF, pdf_file, {
+            "ocr": str(request.data.get("ocr", "false")).lower() == "true",
+            "image_description": str(request.data.get("image_description", "false")).lower() == "true",
+            "rImages": int(request.data.get("rImages", 25)),
+            "language": request.data.get("language", "English"),
+            "quota_subject": quota_subject(request),
+        })
+
+
+class PptxJobView(APIView):
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        pptx_file = request.FILES.get("file")
+        if not pptx_file:
+            return Response({"error": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return submit_job(Job.KIND_PPTX, pptx_file, {
+            "image_description": str(request.data.get("image_description", "true")).lower() == "true",
+            "rImages": int(request.data.get("rImages", 25)),
+            "language": request.data.get("language", "English"),
+            "quota_subject": quota_subject(request),
+        })
+
+
+class JobDetailView(APIView):
+    def get(self, request, pk):
+        job = get_object_or_404(Job, pk=pk)
+        # Picks up jobs left behind by a previous process
+        job_runner.start()
+
+        stream_format = requested_stream_format(request)
+        if stream_format:
+            return streaming_response(stream_format, iter_job_events(job.pk))
+        return Response(job_status(job), status=status.HTTP_200_OK)
@@ -0,0 +1,268 @@
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from decouple import config
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from api import metrics
+from api.imaging import PayloadStats
+from api.models import Job, JobPage
+from api.pdf_engine import page_count
+from api.quota import RequestBudget
+from api.views import (ThreadSafeCounter, convert_ppt_to_pptx, extract_slides, iter_processed_pages,
+                       iter_processed_slides)
+
+# Runner threads started inside the web process; set to 0 when jobs run under `manage.py run_jobs`
+JOB_WORKERS = config('JOB_WORKERS', default=2, cast=int)
+
+# Seconds an idle runner waits before checking the job table again
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', default=2.0, cast=float)
+
+# A running job whose heartbeat is older than this is treated as orphaned and picked up again
+JOB_LEASE_SECONDS = config('JOB_LEASE_SECONDS', default=300, cast=int)
+
+logger = logging.getLogger(__name__)
+
+
+class JobLost(Exception):
+    """Raised when another runner has taken over a job this runner was working on."""
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def release_orphaned_jobs():
+    """Requeues jobs held by runners of this host whose process is gone, without waiting out the lease."""
+    if os.name == 'nt':
+        # os.kill(pid, 0) terminates the process on Windows; rely on the lease there
+        return 0
+
+    prefix = f"{socket.gethostname()}:"
+    released = 0
+    for pk, locked_by in Job.objects.filter(status=Job.RUNNING, locked_by__startswith=prefix).values_list("pk", "locked_by"):
+        pid = int(locked_by.split(":")[1])
+        if pid != os.getpid() and not process_alive(pid):
+            released += Job.objects.filter(pk=pk, locked_by=locked_by).update(status=Job.QUEUED, locked_by="")
+    return released
+
+
+def claim_next_job(worker_id):
+    now = timezone.now()
+    stale = now - timedelta(seconds=JOB_LEASE_SECONDS)
+    candidates = (
+        Job.objects.filter(Q(status=Job.QUEUED) | Q(status=Job.RUNNING, heartbeat_at__lt=stale))
+        .order_by("created_at")
+        .values_list("pk", "status", "heartbeat_at")[:10]
+    )
+    for pk, job_status, heartbeat_at in candidates:
+        # Status and heartbeat act as a version check, so only one runner wins the update
+        claimed = Job.objects.filter(pk=pk, status=job_status, heartbeat_at=heartbeat_at).update(
+            status=Job.RUNNING, locked_by=worker_id, heartbeat_at=now
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+class Lease:
+    """Renews a running job's heartbeat from a background thread.
+
+    Pages are stored only once they are finished, and a single page (OCR, an
+    Office conversion) can take longer than JOB_LEASE_SECONDS, so the heartbeat
+    cannot wait for them. lost is set once the job is no longer this runner's.
+    """
+
+    def __init__(self, owned, interval):
+        self.owned = owned
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lost = threading.Event()
+        self.thread = threading.Thread(target=self.renew, name="job-lease", daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.thread.join()
+
+    def renew(self):
+        try:
+            while not self.stopped.wait(self.interval):
+                if not self.owned.update(heartbeat_at=timezone.now()):
+                    self.lost.set()
+                    return
+        except Exception:
+            # The next renewal or stored page tells whether the job is still ours
+            logger.exception("Could not renew the job lease")
+        finally:
+            connection.close()
+
+
+def iter_job_units(job, skip, remaining_images_counter, payload_stats):
+    """Yields (number, content, count) for the pages or slides of a job that are not in skip."""
+    options = job.options
+    path = job.document.path
+
+    if job.kind == Job.KIND_PDF:
+        Job.objects.filter(pk=job.pk).update(total_units=page_count(path))
+        pages = iter_processed_pages(
+            path, options.get("ocr", False), options.get("image_description", False), options.get("language", "English"),
+            remaining_images_counter, payload_stats, skip_pages=skip
+        )
+        try:
+            yield from pages
+        finally:
+            pages.close()
+        return
+
+    pptx_path = convert_ppt_to_pptx(path) if path.lower().endswith(".ppt") else path
+    try:
+        slides = extract_slides(pptx_path, options.get("image_description", True))
+    finally:
+        if pptx_path != path and os.path.exists(pptx_path):
+            os.remove(pptx_path)
+
+    Job.objects.filter(pk=job.pk).update(total_units=len(slides))
+    processed_slides = iter_processed_slides(
+        slides, options.get("image_description", True), options.get("language", "English"),
+        remaining_images_counter, payload_stats, skip_slides=skip
+    )
+    try:
+        for slide_content, billed_count in processed_slides:
+            yield slide_content["slide_number"], json.dumps(slide_content, ensure_ascii=False), billed_count
+    finally:
+        processed_slides.close()
+
+
+def run_job(job, worker_id):
+    """Runs a claimed job to completion, resuming after the pages it already has."""
+    done = set(job.pages.values_list("number", flat=True))
+    # Descriptions billed before a restart count against the same budget
+    remaining_images = max(0, job.options.get("rImages", 25) - job.count)
+    subject = job.options.get("quota_subject")
+    # Jobs queued before quotas existed only have their own cap
+    remaining_images_counter = RequestBudget(subject, remaining_images) if subject else ThreadSafeCounter(remaining_images)
+    payload_stats = PayloadStats()
+    owned = Job.objects.filter(pk=job.pk, status=Job.RUNNING, locked_by=worker_id)
+
+    units = iter_job_units(job, done, remaining_images_counter, payload_stats)
+    try:
+        with Lease(owned, JOB_LEASE_SECONDS / 3) as lease:
+            for number, content, count in units:
+                if lease.lost.is_set():
+                    raise JobLost(job.pk)
+                with transaction.atomic():
+                    JobPage.objects.create(job=job, number=number, content=content, count=count)
+                    updated = owned.update(
+                        completed_units=F("completed_units") + 1,
+                        count=F("count") + count,
+                        bytes_saved=job.bytes_saved + payload_stats.bytes_saved,
+                        heartbeat_at=timezone.now(),
+                    )
+                    if not updated:
+                        raise JobLost(job.pk)
+        finished = owned.update(status=Job.DONE, locked_by="", finished_at=timezone.now())
+    except JobLost:
+        return
+    except Exception as e:
+        finished = owned.update(status=Job.FAILED, error=str(e), locked_by="", finished_at=timezone.now())
+    finally:
+        units.close()
+
+    if finished:
+        # Done or failed, the job never reads its upload again
+        job.document.delete(save=False)
+
+
+def job_page_event(job, page):
+    if job.kind == Job.KIND_PDF:
+        return "page", {"page_number": page.number, "text": page.content, "count": page.count}
+    return "slide", {**json.loads(page.content), "count": page.count}
+
+
+def job_status(job):
+    data = {
+        "job_id": str(job.pk),
+        "kind": job.kind,
+        "status": job.status,
+        "progress": {"completed": job.completed_units, "total": job.total_units},
+        "count": job.count,
+        "bytes_saved": job.bytes_saved,
+    }
+    if job.status == Job.FAILED:
+        data["error"] = job.error
+    if job.status == Job.DONE:
+        # Same shape as the synchronous endpoints
+        if job.kind == Job.KIND_PDF:
+            data["text_content"] = "".join(job.pages.values_list("content", flat=True))
+        else:
+            data["slides"] = [json.loads(content) for content in job.pages.values_list("content", flat=True)]
+    return data
+
+
+class JobRunner:
+    """Threads that claim jobs from the job table and run them, one job per thread at a time."""
+
+    def __init__(self, max_workers, poll_interval):
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.threads = []
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+
+    def start(self, daemon=True):
+        with self.lock:
+            if self.threads or self.max_workers <= 0:
+                return
+            release_orphaned_jobs()
+            for index in range(self.max_workers):
+                worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+                thread = threading.Thread(target=self.run_forever, args=(worker_id,), name=f"job-runner-{index}", daemon=daemon)
+                thread.start()
+                self.threads.append(thread)
+
+    def notify(self):
+        self.wakeup.set()
+
+    def run_forever(self, worker_id):
+        try:
+            while not self.stopping.is_set():
+                close_old_connections()
+                try:
+                    job = claim_next_job(worker_id)
+                    if job is not None:
+                        run_job(job, worker_id)
+                        continue
+                except Exception:
+                    # e.g. the database is locked; keep the runner alive and try again
+                    logger.exception("Job runner %s failed", worker_id)
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join()
+
+
+job_runner = JobRunner(JOB_WORKERS, JOB_POLL_INTERVAL)
+metrics.QUEUE_DEPTH.track(lambda: Job.objects.filter(status=Job.QUEUED).count(), executor="jobs")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import models, search
+
+
+class Command(BaseCommand):
+    help = "Adds History rows that are not in the search index yet; --rebuild reindexes everything."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Drop the index and rebuild it from scratch")
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        if not search.search_available():
+            raise CommandError("Search needs the SQLite database.")
+
+        if options["rebuild"]:
+            search.clear_index()
+
+        pending_ids = list(models.History.objects.filter(segments__isnull=True).order_by("pk").values_list("pk", flat=True))
+        indexed = 0
+        for start in range(0, len(pending_ids), options["batch_size"]):
+            batch = models.History.objects.filter(pk__in=pending_ids[start:start + options["batch_size"]])
+            # One commit per batch; a commit per row is dominated by fsync on SQLite
+            with transaction.atomic():
+                for history in batch:
+                    search.index_history(history)
+                    indexed += 1
+            self.stdout.write(f"Indexed {indexed} rows")
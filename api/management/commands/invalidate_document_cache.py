@@ -0,0 +1,30 @@
+import hashlib
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.result_cache import document_cache
+
+
+class Command(BaseCommand):
+    help = "Deletes cached whole-document results for one document, one kind, or everything."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="Path of the document whose results should be dropped")
+        parser.add_argument("--hash", help="sha256 of the document whose results should be dropped")
+        parser.add_argument("--kind", choices=["pdf", "pptx"])
+        parser.add_argument("--all", action="store_true", help="Drop every cached result")
+
+    def handle(self, *args, **options):
+        file_hash = options["hash"]
+        if options["file"]:
+            digest = hashlib.sha256()
+            with open(options["file"], "rb") as document:
+                for chunk in iter(lambda: document.read(1024 * 1024), b""):
+                    digest.update(chunk)
+            file_hash = digest.hexdigest()
+
+        if file_hash is None and options["kind"] is None and not options["all"]:
+            raise CommandError("Pass --file, --hash, --kind or --all")
+
+        deleted = document_cache.invalidate(file_hash=file_hash, kind=options["kind"])
+        self.stdout.write(f"Deleted {deleted} cached results")
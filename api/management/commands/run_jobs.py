@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.jobs import JOB_POLL_INTERVAL, JOB_WORKERS, JobRunner
+
+
+class Command(BaseCommand):
+    help = "Runs queued document jobs in the foreground, resuming any that were interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=max(1, JOB_WORKERS))
+
+    def handle(self, *args, **options):
+        runner = JobRunner(options["workers"], JOB_POLL_INTERVAL)
+        runner.start(daemon=False)
+        self.stdout.write(f"Running jobs with {options['workers']} workers")
+        try:
+            for thread in runner.threads:
+                thread.join()
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping, jobs in progress resume on the next start")
+            runner.stop()
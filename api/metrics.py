@@ -0,0 +1,413 @@
+"""Per-stage timings, upstream and executor metrics, and their Prometheus endpoint.
+
+Metrics live in the worker process that records them, like the cache and
+conversion stats; scrape every worker (or run one) to see the whole picture.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from decouple import config
+from django.http import HttpResponse
+
+# Requests slower than this many seconds log their full stage trace; 0 turns trace dumps off
+SLOW_REQUEST_SECONDS = config('SLOW_REQUEST_SECONDS', default=0.0, cast=float)
+
+# When set, /metrics/ requires "Authorization: Bearer <token>"
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Histogram buckets in seconds, from a cached lookup up to a slow conversion
+TIME_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger(__name__)
+
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            values = sorted(self.values.items())
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}" for key, value in values]
+
+
+class Gauge(Metric):
+    """A gauge set directly, or read from callbacks registered with track() at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = {}
+        self.callbacks = {}
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def track(self, func, **labels):
+        with self.lock:
+            self.callbacks[self.key(labels)] = func
+
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+            callbacks = list(self.callbacks.items())
+        for key, func in callbacks:
+            try:
+                values[key] = func()
+            except Exception:
+                # A broken source must not take the whole scrape down
+                continue
+        return [f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=TIME_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0.0))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        with self.lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self.values.items())
+        lines = []
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = format_labels(self.labelnames, key, [("le", format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+REQUEST_SECONDS = Histogram("scribe_request_seconds", "Request duration by view.", ["view"])
+REQUESTS = Counter("scribe_requests_total", "Requests by view and status code.", ["view", "status"])
+STAGE_SECONDS = Histogram("scribe_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+UPSTREAM_SECONDS = Histogram("scribe_upstream_seconds", "Upstream call duration, retries included.", ["service"])
+UPSTREAM_REQUESTS = Counter(
+    "scribe_upstream_requests_total", "Upstream calls by outcome (status class or error).", ["service", "outcome"]
+)
+UPSTREAM_RETRIES = Counter("scribe_upstream_retries_total", "Upstream retries.", ["service"])
+BYTES_PROCESSED = Counter(
+    "scribe_bytes_processed_total",
+    "Bytes handled: uploads, extracted images and image payloads sent upstream.",
+    ["kind"],
+)
+DESCRIBE_BATCH_IMAGES = Histogram(
+    "scribe_describe_batch_images", "Images per description request sent by the batcher.", buckets=(1, 2, 4, 8, 16, 32)
+)
+DESCRIBE_BATCH_FALLBACKS = Counter(
+    "scribe_describe_batch_fallbacks_total", "Batched description replies that did not parse and were retried one by one."
+)
+OCR_REQUESTS = Counter("scribe_ocr_requests_total", "Images sent to OCR by the backend chosen for them.", ["backend"])
+OCR_FALLBACKS = Counter("scribe_ocr_fallbacks_total", "Azure Read OCR that failed or timed out and ran locally instead.")
+CACHE_STATS = Gauge(
+    "scribe_cache_stats", "Description and document result cache hits, misses and hit rate since start.",
+    ["cache", "stat"],
+)
+OFFICE_STATS = Gauge("scribe_office_stats", "Office conversion counts, restarts and timings since start.", ["stat"])
+QUEUE_DEPTH = Gauge("scribe_executor_queue_depth", "Work items queued or running per executor.", ["executor"])
+
+
+class RequestTrace:
+    """Stage spans of one request, collected from every thread working on it."""
+
+    def __init__(self, method, path):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def add(self, stage_name, started, duration):
+        with self.lock:
+            self.spans.append((stage_name, started - self.started, duration, threading.current_thread().name))
+
+    def totals(self):
+        totals = {}
+        with self.lock:
+            for stage_name, _, duration, _ in self.spans:
+                seconds, count = totals.get(stage_name, (0.0, 0))
+                totals[stage_name] = (seconds + duration, count + 1)
+        return totals
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        # Stage times are summed over threads, so together they can exceed "total"
+        entries = [
+            f'{stage_name};dur={seconds * 1000:.1f};desc="x{count}"'
+            for stage_name, (seconds, count) in sorted(self.totals().items())
+        ]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def as_dict(self, status_code):
+        with self.lock:
+            spans = sorted(self.spans, key=lambda span: span[1])
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": status_code,
+            "seconds": round(self.elapsed(), 4),
+            "stages": {name: round(seconds, 4) for name, (seconds, _) in self.totals().items()},
+            "spans": [
+                {"stage": name, "start": round(start, 4), "seconds": round(duration, 4), "thread": thread}
+                for name, start, duration, thread in spans
+            ],
+        }
+
+
+def record_stage(stage_name, started, duration, trace=None):
+    STAGE_SECONDS.observe(duration, stage=stage_name)
+    trace = trace or current_trace.get()
+    if trace is not None:
+        trace.add(stage_name, started, duration)
+
+
+@contextlib.contextmanager
+def stage(stage_name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage_name, started, time.perf_counter() - started)
+
+
+def timed_iter(stage_name, iterator):
+    """Yields from iterator, recording the time spent waiting for each item as stage_name."""
+    iterator = iter(iterator)
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                record_stage(stage_name, started, time.perf_counter() - started)
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            close()
+
+
+def bind(func):
+    """Wraps func to run under the calling request's trace; executor threads do not inherit it."""
+    trace = current_trace.get()
+
+    def run(*args, **kwargs):
+        token = current_trace.set(trace)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            current_trace.reset(token)
+
+    return run
+
+
+def track_future(future, executor_name, stage_name=None):
+    """Counts a submitted future in the executor's queue depth until it finishes.
+
+    With stage_name, the time from submission to completion (queueing included)
+    is recorded as that stage on the submitting request's trace.
+    """
+    trace = current_trace.get()
+    started = time.perf_counter()
+    QUEUE_DEPTH.inc(executor=executor_name)
+
+    def done(_):
+        QUEUE_DEPTH.dec(executor=executor_name)
+        if stage_name is not None:
+            record_stage(stage_name, started, time.perf_counter() - started, trace)
+
+    future.add_done_callback(done)
+    return future
+
+
+def track_stats(gauge, stats, **labels):
+    """Exposes every value of the dict stats() returns as gauge{stat=<key>}, read at scrape time."""
+    for name in stats():
+        gauge.track(lambda name=name: stats()[name], stat=name, **labels)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def finish_request(request, trace, status_code):
+    view = request.resolver_match.url_name if request.resolver_match else "unmatched"
+    elapsed = trace.elapsed()
+    REQUEST_SECONDS.observe(elapsed, view=view or "unnamed")
+    REQUESTS.inc(view=view or "unnamed", status=status_code)
+    if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+        logger.warning("Slow request: %s", json.dumps(trace.as_dict(status_code)))
+
+
+def traced_stream(chunks, trace, on_close):
+    # Streaming bodies are produced after the middleware returns, so the trace is re-entered per chunk
+    try:
+        while True:
+            token = current_trace.set(trace)
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                return
+            finally:
+                current_trace.reset(token)
+            yield chunk
+    finally:
+        on_close()
+
+
+async def traced_async_stream(chunks, trace, on_close):
+    try:
+        while True:
+            token = current_trace.set(trace)
+            try:
+                chunk = await anext(chunks)
+            except StopAsyncIteration:
+                return
+            finally:
+                current_trace.reset(token)
+            yield chunk
+    finally:
+        on_close()
+
+
+class MetricsMiddleware:
+    """Times every request, collects its stage trace and adds a Server-Timing header.
+
+    Streaming responses get the header before their body is produced, so it only
+    covers the work done up to the first byte; the request metrics and the slow
+    request trace are recorded once the stream is exhausted.
+
+    Works in both modes, so under ASGI the async views are not pushed into a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        trace = RequestTrace(request.method, request.path)
+        token = current_trace.set(trace)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_trace.reset(token)
+        return self.finish(request, trace, response)
+
+    async def __acall__(self, request):
+        trace = RequestTrace(request.method, request.path)
+        token = current_trace.set(trace)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_trace.reset(token)
+        return self.finish(request, trace, response)
+
+    def finish(self, request, trace, response):
+        response["Server-Timing"] = trace.server_timing()
+        if response.streaming:
+            def on_close():
+                finish_request(request, trace, response.status_code)
+
+            if response.is_async:
+                response.streaming_content = traced_async_stream(aiter(response.streaming_content), trace, on_close)
+            else:
+                response.streaming_content = traced_stream(iter(response.streaming_content), trace, on_close)
+        else:
+            finish_request(request, trace, response.status_code)
+        return response
+
+
+def metrics_view(request):
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return HttpResponse(status=401)
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
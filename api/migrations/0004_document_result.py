@@ -0,0 +1,25 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64, unique=True)),
+                ('file_hash', models.CharField(db_index=True, max_length=64)),
+                ('kind', models.CharField(max_length=10)),
+                ('result', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.2 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_document_result'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='history',
+            index=models.Index(fields=['user', '-created_at'], name='history_user_created_idx'),
+        ),
+    ]
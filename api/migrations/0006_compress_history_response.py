@@ -0,0 +1,69 @@
+# Generated by Django 5.1.2 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+import api.storage
+
+PREVIEW_CHARS = 200
+
+
+def compress_responses(apps, schema_editor):
+    History = apps.get_model("api", "History")
+    for history in History.objects.only("id", "response").iterator(chunk_size=100):
+        History.objects.filter(pk=history.pk).update(
+            response_data=history.response,
+            response_size=len(history.response),
+            response_preview=history.response[:PREVIEW_CHARS],
+        )
+
+
+def decompress_responses(apps, schema_editor):
+    History = apps.get_model("api", "History")
+    for history in History.objects.only("id", "response_data").iterator(chunk_size=100):
+        History.objects.filter(pk=history.pk).update(response=history.response_data)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_history_user_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='history',
+            name='response_data',
+            field=api.storage.CompressedTextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='response_size',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='history',
+            name='response_preview',
+            field=models.CharField(blank=True, default='', max_length=200),
+        ),
+        # Nullable while both columns exist, so the reverse migration can re-add it to filled tables
+        migrations.AlterField(
+            model_name='history',
+            name='response',
+            field=models.TextField(null=True),
+        ),
+        migrations.RunPython(compress_responses, decompress_responses),
+        migrations.RemoveField(
+            model_name='history',
+            name='response',
+        ),
+        migrations.RenameField(
+            model_name='history',
+            old_name='response_data',
+            new_name='response',
+        ),
+        migrations.AlterField(
+            model_name='history',
+            name='response',
+            field=api.storage.CompressedTextField(),
+        ),
+    ]
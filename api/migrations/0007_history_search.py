@@ -0,0 +1,46 @@
+# Generated by Django 5.1.2 on 2026-10-18 15:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Contentless: the text itself lives compressed in api_history, the index only holds terms.
+# owner holds one token per user so searches can be scoped inside the index, and the
+# prefix indexes keep short prefix queries (e.g. "th*") from scanning every matching term.
+CREATE_FTS = """
+CREATE VIRTUAL TABLE IF NOT EXISTS api_history_fts USING fts5(
+    body, owner, content='', tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+)
+"""
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(CREATE_FTS)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS api_history_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_compress_history_response'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorySegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.PositiveIntegerField()),
+                ('label', models.IntegerField(blank=True, null=True)),
+                ('history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='api.history')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('history', 'segment'), name='unique_history_segment')],
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
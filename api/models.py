@@ -1,11 +1,98 @@
+import uuid
+
 from django.db import models
 
+from api.storage import CompressedTextField
+
+# Characters of each history response kept as its preview
+HISTORY_PREVIEW_CHARS = 200
 
 
 class History(models.Model):
     user = models.CharField(max_length=100)
     used_file = models.FileField(upload_to="history")
-    response = models.TextField()
+    response = CompressedTextField()
+    # Kept alongside the compressed body so listings never have to decode it
+    response_size = models.PositiveIntegerField(default=0)
+    response_preview = models.CharField(max_length=HISTORY_PREVIEW_CHARS, blank=True, default="")
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["user", "-created_at"], name="history_user_created_idx")]
+
+    def save(self, *args, **kwargs):
+        self.response_size = len(self.response)
+        self.response_preview = self.response[:HISTORY_PREVIEW_CHARS]
+        super().save(*args, **kwargs)
+
+
+class ImageDescription(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    description = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now=True, db_index=True)
+
+
+class Job(models.Model):
+    KIND_PDF = "pdf"
+    KIND_PPTX = "pptx"
+    KIND_CHOICES = [(KIND_PDF, "PDF"), (KIND_PPTX, "PowerPoint")]
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    document = models.FileField(upload_to="jobs")
+    options = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    total_units = models.PositiveIntegerField(null=True, blank=True)
+    completed_units = models.PositiveIntegerField(default=0)
+    count = models.PositiveIntegerField(default=0)
+    bytes_saved = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+
+class JobPage(models.Model):
+    """One finished page (PDF) or slide (PPTX) of a job; content is page text or slide JSON."""
+    job = models.ForeignKey(Job, on_delete=models.CASCADE, related_name="pages")
+    number = models.IntegerField()
+    content = models.TextField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["job", "number"], name="unique_job_page")]
+        ordering = ["number"]
+
+
+class DocumentResult(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    file_hash = models.CharField(max_length=64, db_index=True)
+    kind = models.CharField(max_length=10)
+    result = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now=True, db_index=True)
+
+
+class HistorySegment(models.Model):
+    """A page or slide of a History response; its id is the rowid of the search index entry."""
+    history = models.ForeignKey(History, on_delete=models.CASCADE, related_name="segments")
+    segment = models.PositiveIntegerField()
+    label = models.IntegerField(null=True, blank=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["history", "segment"], name="unique_history_segment")]
+
 
+class QuotaBucket(models.Model):
+    """Token bucket state; only ever changed with single conditional UPDATEs (see api/quota.py)."""
+    key = models.CharField(max_length=150, unique=True)
+    tokens = models.FloatField()
+    updated_at = models.FloatField()
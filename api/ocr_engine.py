@@ -0,0 +1,98 @@
+import atexit
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from decouple import config
+
+from api import metrics
+
+# Tesseract OCR configuration
+TESSERACT_CMD = 'C:\\Program Files\\Tesseract-OCR\\tesseract.exe' if os.name == 'nt' else '/usr/bin/tesseract'
+
+# Number of OCR worker processes, defaults to one per CPU core
+OCR_WORKERS = config('OCR_WORKERS', default=os.cpu_count() or 1, cast=int)
+
+# "spawn" keeps workers independent of the web server's threads and DB connections
+OCR_START_METHOD = config('OCR_START_METHOD', default='spawn')
+
+# Tesseract handles per language, kept loaded for the life of the process
+_local = threading.local()
+
+
+def get_tesseract_api(lang):
+    # tesserocr wraps the tesseract C API; without it we fall back to the pytesseract CLI
+    try:
+        import tesserocr
+    except ImportError:
+        return None
+
+    apis = getattr(_local, "apis", None)
+    if apis is None:
+        apis = _local.apis = {}
+    api = apis.get(lang)
+    if api is None:
+        api = apis[lang] = tesserocr.PyTessBaseAPI(lang=lang)
+    return api
+
+
+def recognize(image, lang="eng"):
+    """Runs OCR on one image, given as raw bytes or a file path, in the current process."""
+    # Imported here, so only OCR worker processes pay for PIL and pytesseract
+    from PIL import Image
+
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        image = io.BytesIO(image)
+
+    with Image.open(image) as pil_image:
+        api = get_tesseract_api(lang)
+        if api is None:
+            import pytesseract
+
+            pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+            return pytesseract.image_to_string(pil_image, lang=lang)
+        api.SetImage(pil_image)
+        return api.GetUTF8Text()
+
+
+class OcrEngine:
+    def __init__(self, max_workers, start_method):
+        self.max_workers = max_workers
+        self.start_method = start_method
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+            return self.executor
+
+    def submit(self, image, lang="eng"):
+        executor = self.get_executor()
+        try:
+            future = executor.submit(recognize, image, lang)
+        except BrokenProcessPool:
+            # A worker died (e.g. tesseract crashed on a bad image); start a fresh pool
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            future = self.get_executor().submit(recognize, image, lang)
+        # Recorded from submission, so the stage includes time queued behind other requests
+        return metrics.track_future(future, "ocr", "ocr")
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+
+ocr_engine = OcrEngine(OCR_WORKERS, OCR_START_METHOD)
+atexit.register(ocr_engine.shutdown)
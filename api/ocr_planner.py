@@ -0,0 +1,113 @@
+import io
+import threading
+
+from decouple import config
+
+# Set to false to OCR every embedded image and never OCR whole pages, as before
+OCR_PLANNER = config('OCR_PLANNER', default=True, cast=bool)
+
+# Images narrower than this, or with fewer pixels in total, are bullets, icons and rules
+OCR_MIN_IMAGE_EDGE = config('OCR_MIN_IMAGE_EDGE', default=24, cast=int)
+OCR_MIN_IMAGE_PIXELS = config('OCR_MIN_IMAGE_PIXELS', default=64 * 64, cast=int)
+
+# Text is ink on a mostly flat background: at least this share of pixels within one band
+# of grey levels, and at least this share of pixels on a sharp edge
+OCR_MIN_BACKGROUND_SHARE = config('OCR_MIN_BACKGROUND_SHARE', default=0.45, cast=float)
+OCR_MIN_EDGE_DENSITY = config('OCR_MIN_EDGE_DENSITY', default=0.02, cast=float)
+
+# Pages whose text layer has fewer non-space characters than this are rendered and OCRed whole
+OCR_PAGE_TEXT_MIN_CHARS = config('OCR_PAGE_TEXT_MIN_CHARS', default=16, cast=int)
+OCR_PAGE_DPI = config('OCR_PAGE_DPI', default=200, cast=int)
+
+# Images are analysed on a copy no larger than this
+ANALYSIS_EDGE = 256
+
+BACKGROUND_BAND = 32
+
+# Skipped items listed one by one in a response; the counts always cover all of them
+SKIP_REPORT_LIMIT = 100
+
+
+def needs_page_ocr(text):
+    return OCR_PLANNER and len("".join(text.split())) < OCR_PAGE_TEXT_MIN_CHARS
+
+
+def image_features(image_bytes):
+    """Returns (width, height, background_share, edge_density), or None if PIL cannot decode the image."""
+    from PIL import Image, ImageFilter
+
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            width, height = image.size
+            image.draft("L", (ANALYSIS_EDGE, ANALYSIS_EDGE))
+            gray = image.convert("L")
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+    gray.thumbnail((ANALYSIS_EDGE, ANALYSIS_EDGE))
+    total = gray.width * gray.height
+    histogram = gray.histogram()
+    background = max(sum(histogram[start:start + BACKGROUND_BAND]) for start in range(0, 256 - BACKGROUND_BAND + 1, 8))
+    edges = gray.filter(ImageFilter.FIND_EDGES).histogram()
+    return width, height, background / total, sum(edges[64:]) / total
+
+
+def skip_reason(image_bytes):
+    """Why an image is not worth OCRing ("too_small" or "no_text"), or None to OCR it."""
+    features = image_features(image_bytes)
+    if features is None:
+        # Let tesseract have a go at formats PIL cannot read
+        return None
+
+    width, height, background, edge_density = features
+    if min(width, height) < OCR_MIN_IMAGE_EDGE or width * height < OCR_MIN_IMAGE_PIXELS:
+        return "too_small"
+    if background < OCR_MIN_BACKGROUND_SHARE or edge_density < OCR_MIN_EDGE_DENSITY:
+        return "no_text"
+    return None
+
+
+def plan_page(extracted_page, images):
+    """Decides what to OCR on one page produced by pdf_engine.
+
+    images are the page's (index, image) pairs that are not repeats. Returns
+    (page_image, reasons): page_image is the rendered page when the page has no
+    usable text layer, and reasons maps every image index to its skip reason,
+    or None for images to OCR. A page that is OCRed whole covers its images.
+    """
+    if not OCR_PLANNER:
+        return None, {index: None for index, _ in images}
+
+    page_image = extracted_page.get("page_image")
+    if page_image is not None:
+        return page_image, {index: "page_ocr" for index, _ in images}
+    return None, {index: skip_reason(image["image"]) for index, image in images}
+
+
+class OcrStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pages = 0
+        self.images = 0
+        self.skipped_counts = {}
+        self.skipped = []
+
+    def record(self, page_number, page_image, reasons):
+        with self.lock:
+            self.pages += page_image is not None
+            for index, reason in sorted(reasons.items()):
+                if reason is None:
+                    self.images += 1
+                    continue
+                self.skipped_counts[reason] = self.skipped_counts.get(reason, 0) + 1
+                if len(self.skipped) < SKIP_REPORT_LIMIT:
+                    self.skipped.append({"page": page_number, "image": index, "reason": reason})
+
+    def report(self):
+        with self.lock:
+            return {
+                "pages_ocred": self.pages,
+                "images_ocred": self.images,
+                "skipped_counts": dict(self.skipped_counts),
+                "skipped": sorted(self.skipped, key=lambda item: (item["page"], item["image"])),
+            }
@@ -0,0 +1,296 @@
+"""Routes OCR to local Tesseract or to Azure's Read API.
+
+Languages Tesseract reads poorly (Arabic by default) go to Azure Read when a
+subscription key is configured and the image is one Azure accepts; everything
+else stays local. Read is asynchronous: each image is submitted on its own and
+returns an operation URL, and one poller thread checks every pending operation
+together each round rather than waiting on them one by one. An image Azure
+fails on, or does not finish in time, is OCRed locally instead, and Azure is
+left alone for a while after a failure.
+"""
+import atexit
+import functools
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+from decouple import Csv, config
+
+from api import deadlines, metrics, upstream
+from api.ocr_engine import ocr_engine
+
+# "auto" routes by language and image, "local" keeps all OCR on Tesseract, "azure" sends every
+# image Azure accepts to Azure Read whatever its language
+OCR_BACKEND = config('OCR_BACKEND', default='auto')
+
+# Tesseract language codes sent to Azure Read in auto mode
+OCR_AZURE_LANGUAGES = config('OCR_AZURE_LANGUAGES', default='ara', cast=Csv())
+
+# Azure Computer Vision resource; without a key all OCR stays local
+AZURE_ENDPOINT = config('AZURE_ENDPOINT', default='https://scribemeocr.cognitiveservices.azure.com/')
+AZURE_SUBSCRIPTION_KEY = config('AZURE_SUBSCRIPTION_KEY', default='')
+
+# Read operations submitted or polled at once
+AZURE_READ_CONCURRENCY = config('AZURE_READ_CONCURRENCY', default=8, cast=int)
+
+# Seconds between polling rounds, and how long an operation may take before it is OCRed locally
+AZURE_READ_POLL_INTERVAL = config('AZURE_READ_POLL_INTERVAL', default=0.5, cast=float)
+AZURE_READ_TIMEOUT = config('AZURE_READ_TIMEOUT', default=60.0, cast=float)
+
+# After a failed call, OCR stays local for this many seconds
+AZURE_READ_COOLDOWN = config('AZURE_READ_COOLDOWN', default=30.0, cast=float)
+
+# Largest image sent to Azure; 4 MB is the limit of the free tier
+AZURE_READ_MAX_BYTES = config('AZURE_READ_MAX_BYTES', default=4 * 1024 * 1024, cast=int)
+
+# Image limits of the Read API
+AZURE_READ_MIN_EDGE = 50
+AZURE_READ_MAX_EDGE = 10000
+AZURE_READ_FORMATS = {"JPEG", "PNG", "BMP", "TIFF"}
+
+# Tesseract language codes and their Read API counterparts; others let Azure detect the language
+AZURE_LANGUAGES = {"ara": "ar", "eng": "en", "spa": "es"}
+
+logger = logging.getLogger(__name__)
+
+
+class ReadError(Exception):
+    pass
+
+
+def settle(future, result=None, error=None):
+    # The caller may have cancelled the future (e.g. at its deadline) while the work ran
+    try:
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    except InvalidStateError:
+        pass
+
+
+def chain(source, target):
+    """Gives target the outcome of source, and cancels source if target is cancelled first."""
+    def copy(_):
+        if source.cancelled():
+            target.cancel()
+        elif source.exception() is not None:
+            settle(target, error=source.exception())
+        else:
+            settle(target, source.result())
+
+    def cancel(_):
+        if target.cancelled():
+            source.cancel()
+
+    target.add_done_callback(cancel)
+    source.add_done_callback(copy)
+
+
+def image_info(image):
+    """Returns (size in bytes, format, width, height) of raw bytes or a file path, or None if PIL cannot read it."""
+    from PIL import Image
+
+    size = os.path.getsize(image) if isinstance(image, (str, os.PathLike)) else len(image)
+    source = image if isinstance(image, (str, os.PathLike)) else io.BytesIO(image)
+    try:
+        with Image.open(source) as pil_image:
+            return size, pil_image.format, pil_image.width, pil_image.height
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def azure_accepts(image):
+    info = image_info(image)
+    if info is None:
+        return False
+    size, image_format, width, height = info
+    return (
+        size <= AZURE_READ_MAX_BYTES
+        and image_format in AZURE_READ_FORMATS
+        and AZURE_READ_MIN_EDGE <= min(width, height)
+        and max(width, height) <= AZURE_READ_MAX_EDGE
+    )
+
+
+def cancel_unsent(operation, task):
+    # A submission cancelled before it ran must not leave its caller waiting
+    if task.cancelled():
+        operation.future.cancel()
+
+
+def read_text(result):
+    """The text of a finished Read operation, one line per line."""
+    pages = result.get("analyzeResult", {}).get("readResults", [])
+    return "\n".join(line["text"] for page in pages for line in page.get("lines", []))
+
+
+class ReadOperation:
+    def __init__(self, image, lang, on_failure):
+        self.image = image
+        self.lang = lang
+        self.on_failure = on_failure
+        # The submitting request's deadline, applied to every call made for it
+        self.deadline = deadlines.current_deadline.get()
+        self.future = Future()
+        self.url = None
+        self.started = None
+
+
+class AzureReadBackend:
+    def __init__(self, endpoint, subscription_key, concurrency, poll_interval, timeout):
+        self.endpoint = endpoint
+        self.subscription_key = subscription_key
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.executor = None
+        self.pending = []
+        self.poller = None
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="azure-read")
+            return self.executor
+
+    def headers(self):
+        return {"Ocp-Apim-Subscription-Key": self.subscription_key}
+
+    def submit(self, image, lang, on_failure):
+        """Starts a Read operation; returns a future of its text.
+
+        Errors are passed to on_failure(operation, error), which settles the future.
+        """
+        operation = ReadOperation(image, lang, on_failure)
+        task = self.get_executor().submit(deadlines.bind(self.start, operation.deadline), operation)
+        task.add_done_callback(functools.partial(cancel_unsent, operation))
+        return operation.future
+
+    def start(self, operation):
+        if operation.future.cancelled():
+            return
+        image = operation.image
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, "rb") as image_file:
+                image = image_file.read()
+        params = {}
+        if operation.lang.split("+")[0] in AZURE_LANGUAGES:
+            params["language"] = AZURE_LANGUAGES[operation.lang.split("+")[0]]
+        try:
+            response = upstream.post(
+                f"{self.endpoint.rstrip('/')}/vision/v3.2/read/analyze", params=params,
+                headers={**self.headers(), "Content-Type": "application/octet-stream"}, data=image,
+            )
+            if response.status_code != 202 or not response.headers.get("Operation-Location"):
+                raise ReadError(f"Read request failed with status {response.status_code}")
+        except Exception as e:
+            operation.on_failure(operation, e)
+            return
+
+        operation.url = response.headers["Operation-Location"]
+        operation.started = time.monotonic()
+        with self.lock:
+            self.pending.append(operation)
+            if self.poller is None:
+                self.poller = threading.Thread(target=self.poll, name="azure-read-poller", daemon=True)
+                self.poller.start()
+
+    def poll(self):
+        # One round checks every pending operation at once; the thread exits when none are left
+        while True:
+            time.sleep(self.poll_interval)
+            with self.lock:
+                operations = list(self.pending)
+            finished = [
+                operation for operation, done in zip(operations, self.get_executor().map(self.check, operations))
+                if done
+            ]
+            with self.lock:
+                finished = set(finished)
+                self.pending = [operation for operation in self.pending if operation not in finished]
+                if not self.pending:
+                    self.poller = None
+                    return
+
+    def check(self, operation):
+        """Polls one operation; returns True once it needs no more polling."""
+        if operation.future.cancelled():
+            return True
+        try:
+            if time.monotonic() - operation.started > self.timeout:
+                raise ReadError(f"Read operation did not finish in {self.timeout:g} seconds")
+            with deadlines.applied(operation.deadline):
+                response = upstream.get(operation.url, headers=self.headers())
+            response.raise_for_status()
+            result = response.json()
+            if result.get("status") in ("notStarted", "running"):
+                return False
+            if result.get("status") != "succeeded":
+                raise ReadError(f"Read operation {result.get('status')}")
+        except Exception as e:
+            operation.on_failure(operation, e)
+            return True
+        settle(operation.future, read_text(result))
+        return True
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+
+class OcrRouter:
+    def __init__(self, backend, azure_languages, azure, cooldown):
+        self.backend = backend
+        self.azure_languages = set(azure_languages)
+        self.azure = azure
+        self.cooldown = cooldown
+        self.lock = threading.Lock()
+        self.azure_resumes_at = 0.0
+
+    def route(self, image, lang):
+        """Returns "azure" or "local" for one image."""
+        if self.backend == "local" or not self.azure.subscription_key:
+            return "local"
+        if self.backend != "azure" and lang.split("+")[0] not in self.azure_languages:
+            return "local"
+        with self.lock:
+            if time.monotonic() < self.azure_resumes_at:
+                return "local"
+        return "azure" if azure_accepts(image) else "local"
+
+    def submit(self, image, lang="eng"):
+        """OCRs one image, given as raw bytes or a file path; returns a future of its text."""
+        backend = self.route(image, lang)
+        metrics.OCR_REQUESTS.inc(backend=backend)
+        if backend == "local":
+            return ocr_engine.submit(image, lang)
+        future = self.azure.submit(image, lang, self.fall_back)
+        return metrics.track_future(future, "azure_read", "ocr")
+
+    def fall_back(self, operation, error):
+        if operation.future.cancelled():
+            return
+        if isinstance(error, deadlines.DeadlineExceeded) or (operation.deadline and operation.deadline.expired()):
+            # The caller ran out of time (timeouts are clamped to its deadline); that says
+            # nothing about Azure, and local OCR could not finish in time either
+            settle(operation.future, error=deadlines.DeadlineExceeded())
+            return
+        logger.warning("Azure Read failed, OCRing locally: %s", error)
+        metrics.OCR_FALLBACKS.inc()
+        with self.lock:
+            self.azure_resumes_at = time.monotonic() + self.cooldown
+        chain(ocr_engine.submit(operation.image, operation.lang), operation.future)
+
+
+azure_read = AzureReadBackend(
+    AZURE_ENDPOINT, AZURE_SUBSCRIPTION_KEY, AZURE_READ_CONCURRENCY, AZURE_READ_POLL_INTERVAL, AZURE_READ_TIMEOUT
+)
+ocr_router = OcrRouter(OCR_BACKEND, OCR_AZURE_LANGUAGES, azure_read, AZURE_READ_COOLDOWN)
+atexit.register(azure_read.shutdown)
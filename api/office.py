@@ -0,0 +1,323 @@
+"""A pool of LibreOffice instances converting .ppt uploads to .pptx.
+
+Instances are only kept running between conversions when LibreOffice's Python
+bridge (the python3-uno package) is importable. Without it every conversion
+starts and stops its own soffice process, and the pool only limits how many
+run at once and gives each its own user profile, which saves the profile's
+first-run setup but not the process start-up.
+"""
+import atexit
+import logging
+import os
+import pathlib
+import queue
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+
+from decouple import config
+
+from api import metrics
+
+# LibreOffice's Python bridge (python3-uno), imported by load_uno() on first use
+uno = None
+uno_checked = False
+
+OFFICE_BINARY = config(
+    'OFFICE_BINARY',
+    default="C:\\Program Files\\LibreOffice\\program\\soffice.exe" if os.name == 'nt' else "libreoffice",
+)
+
+# Number of office instances, i.e. conversions that can run at once
+OFFICE_INSTANCES = config('OFFICE_INSTANCES', default=2, cast=int)
+
+# Seconds a single conversion may take before its instance is killed and restarted
+OFFICE_CONVERSION_TIMEOUT = config('OFFICE_CONVERSION_TIMEOUT', default=120, cast=int)
+
+# Seconds a conversion may wait for a free instance
+OFFICE_QUEUE_TIMEOUT = config('OFFICE_QUEUE_TIMEOUT', default=300, cast=int)
+
+OFFICE_STARTUP_TIMEOUT = config('OFFICE_STARTUP_TIMEOUT', default=60, cast=int)
+
+OFFICE_PROFILE_ROOT = config('OFFICE_PROFILE_ROOT', default=os.path.join(tempfile.gettempdir(), "scribe-office"))
+
+PPTX_FILTER = "Impress MS PowerPoint 2007 XML"
+
+logger = logging.getLogger(__name__)
+
+
+class ConversionTimeout(RuntimeError):
+    pass
+
+
+def load_uno():
+    """Returns the uno module, or None when python3-uno is not installed."""
+    global uno, uno_checked
+    if not uno_checked:
+        try:
+            import uno as bridge
+        except ImportError:
+            bridge = None
+        uno, uno_checked = bridge, True
+    return uno
+
+
+def kill_process_tree(process):
+    # soffice is a launcher that forks soffice.bin, so kill the whole session
+    if process.poll() is not None:
+        return
+    if os.name == 'nt':
+        process.kill()
+    else:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+class ConversionStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conversions = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    def record(self, seconds, wait_seconds, failed=False, timed_out=False):
+        with self.lock:
+            self.conversions += 1
+            self.failures += failed
+            self.timeouts += timed_out
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.total_wait_seconds += wait_seconds
+
+    def record_restart(self):
+        with self.lock:
+            self.restarts += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "conversions": self.conversions,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+                "avg_seconds": self.total_seconds / self.conversions if self.conversions else 0.0,
+                "max_seconds": self.max_seconds,
+                "avg_wait_seconds": self.total_wait_seconds / self.conversions if self.conversions else 0.0,
+            }
+
+
+class OfficeInstance:
+    """One headless office slot with its own user profile, so slots never share a profile lock.
+
+    With UNO available the soffice process stays up between conversions. Without it
+    nothing stays running: every conversion starts a new soffice process against the
+    slot's profile, so only the profile is reused.
+
+    The profile and pipe are named after the process that uses them, not the one
+    that created the pool: with gunicorn --preload the pool is created in the
+    master, and every forked worker needs profiles of its own.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.pid = None
+        self.profile_dir = None
+        self.profile_url = None
+        self.pipe_name = None
+        self.process = None
+        self.desktop = None
+
+    def owned(self):
+        return self.pid == os.getpid()
+
+    def bind(self):
+        """Points the instance at this process's profile and pipe."""
+        if self.owned():
+            return
+        # Anything set up before a fork belongs to the parent, which also cleans it up
+        self.process = None
+        self.desktop = None
+        self.pid = os.getpid()
+        self.profile_dir = os.path.join(OFFICE_PROFILE_ROOT, f"{self.pid}-{self.index}")
+        self.profile_url = pathlib.Path(self.profile_dir).as_uri()
+        self.pipe_name = f"scribe-office-{self.pid}-{self.index}"
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self.process = subprocess.Popen(
+            [
+                OFFICE_BINARY, "--headless", "--invisible", "--nologo", "--norestore", "--nodefault",
+                f"-env:UserInstallation={self.profile_url}",
+                f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+
+        local_context = load_uno().getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local_context
+        )
+        deadline = time.monotonic() + OFFICE_STARTUP_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(
+                    f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"
+                )
+                break
+            except Exception:
+                if not self.running() or time.monotonic() > deadline:
+                    self.stop()
+                    raise RuntimeError("LibreOffice instance failed to start")
+                time.sleep(0.25)
+
+        self.desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+
+    def stop(self):
+        if not self.owned():
+            return
+        self.desktop = None
+        if self.process is not None:
+            kill_process_tree(self.process)
+            self.process.wait()
+            self.process = None
+
+    def convert(self, ppt_path, pptx_path, timeout):
+        self.bind()
+        if load_uno() is None:
+            return self.convert_with_cli(ppt_path, pptx_path, timeout)
+
+        if not self.running():
+            self.start()
+
+        # UNO calls cannot be interrupted, so a hung conversion is ended by killing the instance
+        timer = threading.Timer(timeout, kill_process_tree, args=(self.process,))
+        timer.start()
+        try:
+            document = self.desktop.loadComponentFromURL(
+                pathlib.Path(ppt_path).as_uri(), "_blank", 0, (property_value("Hidden", True),)
+            )
+            try:
+                document.storeToURL(pathlib.Path(pptx_path).as_uri(), (property_value("FilterName", PPTX_FILTER),))
+            finally:
+                document.close(True)
+        except Exception:
+            if not timer.is_alive():
+                raise ConversionTimeout(f"Conversion took longer than {timeout}s")
+            raise
+        finally:
+            timer.cancel()
+
+    def convert_with_cli(self, ppt_path, pptx_path, timeout):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        command = [
+            OFFICE_BINARY, "--headless", "--norestore",
+            f"-env:UserInstallation={self.profile_url}",
+            "--convert-to", "pptx",
+            "--outdir", os.path.dirname(pptx_path),
+            ppt_path,
+        ]
+        process = subprocess.Popen(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True
+        )
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            kill_process_tree(process)
+            process.wait()
+            raise ConversionTimeout(f"Conversion took longer than {timeout}s")
+        if process.returncode != 0:
+            raise RuntimeError(f"LibreOffice exited with status {process.returncode}")
+
+    def remove_profile(self):
+        if self.owned():
+            shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+
+def property_value(name, value):
+    from com.sun.star.beans import PropertyValue
+
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
+
+
+class OfficePool:
+    def __init__(self, size):
+        self.instances = [OfficeInstance(index) for index in range(size)]
+        self.idle = queue.Queue()
+        for instance in self.instances:
+            self.idle.put(instance)
+        self.stats = ConversionStats()
+        self.warned = False
+
+    def convert(self, ppt_path, timeout=None):
+        """Converts a .ppt file to .pptx next to it and returns the new path.
+
+        Waits up to OFFICE_QUEUE_TIMEOUT for a free instance.
+        """
+        timeout = timeout or OFFICE_CONVERSION_TIMEOUT
+        pptx_path = os.path.splitext(ppt_path)[0] + ".pptx"
+        if load_uno() is None and not self.warned:
+            self.warned = True
+            logger.warning("python3-uno is not installed; every conversion starts its own soffice process")
+
+        queued_at = time.monotonic()
+        metrics.QUEUE_DEPTH.inc(executor="office")
+        try:
+            return self.convert_on_instance(ppt_path, pptx_path, timeout, queued_at)
+        finally:
+            metrics.QUEUE_DEPTH.dec(executor="office")
+
+    def convert_on_instance(self, ppt_path, pptx_path, timeout, queued_at):
+        try:
+            instance = self.idle.get(timeout=OFFICE_QUEUE_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError("No LibreOffice instance became free in time")
+
+        started_at = time.monotonic()
+        failed = timed_out = False
+        try:
+            if uno is not None and instance.owned() and instance.process is not None and not instance.running():
+                # Crashed since its last conversion
+                self.stats.record_restart()
+            instance.convert(ppt_path, pptx_path, timeout)
+        except Exception as e:
+            failed = True
+            timed_out = isinstance(e, ConversionTimeout)
+            if uno is not None:
+                # A failed load can leave the instance wedged; the next conversion starts a fresh one
+                instance.stop()
+                self.stats.record_restart()
+            raise
+        finally:
+            self.stats.record(time.monotonic() - started_at, started_at - queued_at, failed, timed_out)
+            self.idle.put(instance)
+
+        if not os.path.exists(pptx_path):
+            raise RuntimeError(f"Conversion failed: .pptx file not found at {pptx_path}")
+        return pptx_path
+
+    def shutdown(self):
+        for instance in self.instances:
+            instance.stop()
+            instance.remove_profile()
+
+
+office_pool = OfficePool(OFFICE_INSTANCES)
+metrics.track_stats(metrics.OFFICE_STATS, office_pool.stats.snapshot)
+atexit.register(office_pool.shutdown)
@@ -0,0 +1,26 @@
+from decouple import config
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+HISTORY_PAGE_SIZE = config('HISTORY_PAGE_SIZE', default=20, cast=int)
+
+
+class HistoryCursorPagination(CursorPagination):
+    # Matches the (user, -created_at) index, so each page is an index range scan
+    ordering = "-created_at"
+    page_size = HISTORY_PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is not None and cursor.position is not None:
+            # A well-formed cursor whose position is not a timestamp would fail in the query
+            try:
+                valid = parse_datetime(cursor.position) is not None
+            except ValueError:
+                valid = False
+            if not valid:
+                raise NotFound(self.invalid_cursor_message)
+        return cursor
@@ -0,0 +1,151 @@
+import atexit
+import collections
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from decouple import config
+
+from api import metrics
+from api.dedup import image_signature
+from api.ocr_planner import OCR_PAGE_DPI, needs_page_ocr
+
+# Number of extraction worker processes, defaults to one per CPU core
+PDF_WORKERS = config('PDF_WORKERS', default=os.cpu_count() or 1, cast=int)
+
+# Documents shorter than this are extracted in the calling process
+PDF_MIN_PAGES_FOR_POOL = config('PDF_MIN_PAGES_FOR_POOL', default=24, cast=int)
+
+# Upper bound on pages per shard, keeps shards small enough to balance across workers
+PDF_MAX_SHARD_PAGES = config('PDF_MAX_SHARD_PAGES', default=32, cast=int)
+
+PDF_START_METHOD = config('PDF_START_METHOD', default='spawn')
+
+
+def open_pdf(pdf_path):
+    # PyMuPDF is imported on first use; most management commands and idle workers never need it
+    import fitz
+
+    return fitz.open(pdf_path)
+
+
+def extract_page(page, page_number, extract_images, seen_xrefs, render_textless=False):
+    images = []
+    if extract_images:
+        for img in page.get_images(full=True):
+            xref = img[0]
+            if xref in seen_xrefs:
+                # Already extracted earlier in this shard; dedup resolves it by xref
+                images.append({"xref": xref, "image": None, "signature": None})
+                continue
+            seen_xrefs.add(xref)
+            image_bytes = page.parent.extract_image(xref)["image"]
+            images.append({"xref": xref, "image": image_bytes, "signature": image_signature(image_bytes)})
+
+    text = page.get_text("text")
+    page_image = None
+    if render_textless and needs_page_ocr(text):
+        # Scans and outlined text have no usable text layer; OCR sees the page as printed
+        import fitz
+
+        page_image = page.get_pixmap(dpi=OCR_PAGE_DPI, colorspace=fitz.csGRAY).tobytes("png")
+    return {"page_number": page_number, "text": text, "images": images, "page_image": page_image}
+
+
+def extract_pages(pdf_path, indices, extract_images, render_textless=False):
+    # Runs in a worker process with its own document handle; PyMuPDF handles must not be shared
+    seen_xrefs = set()
+    with open_pdf(pdf_path) as pdf_document:
+        return [
+            extract_page(pdf_document[index], index + 1, extract_images, seen_xrefs, render_textless)
+            for index in indices
+        ]
+
+
+def page_count(pdf_path):
+    with open_pdf(pdf_path) as pdf_document:
+        return len(pdf_document)
+
+
+def shard_pages(indices, workers):
+    shard_size = max(1, min(PDF_MAX_SHARD_PAGES, -(-len(indices) // workers)))
+    return [indices[start:start + shard_size] for start in range(0, len(indices), shard_size)]
+
+
+class PdfEngine:
+    def __init__(self, max_workers, min_pages_for_pool, start_method):
+        self.max_workers = max_workers
+        self.min_pages_for_pool = min_pages_for_pool
+        self.start_method = start_method
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context(self.start_method),
+                )
+            return self.executor
+
+    def submit_shard(self, pdf_path, indices, extract_images, render_textless=False):
+        executor = self.get_executor()
+        try:
+            future = executor.submit(extract_pages, pdf_path, indices, extract_images, render_textless)
+        except BrokenProcessPool:
+            # A worker died on an earlier document; start a fresh pool
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = None
+            future = self.get_executor().submit(extract_pages, pdf_path, indices, extract_images, render_textless)
+        return metrics.track_future(future, "pdf")
+
+    def iter_pages(self, pdf_path, extract_images, render_textless=False, pages=None):
+        """Yields extracted pages in page order.
+
+        Each page is {"page_number", "text", "images", "page_image"}, with every
+        image as {"xref", "image", "signature"}. Repeats of an xref carry no bytes,
+        so callers must run pages through an ImageDeduplicator in order.
+        With render_textless, pages without a usable text layer come with a
+        grayscale PNG of the whole page in page_image, for OCR.
+        pages limits extraction to those (sorted, 1-based) page numbers; the rest
+        of the document is never loaded.
+        """
+        indices = [page - 1 for page in pages] if pages is not None else list(range(page_count(pdf_path)))
+
+        if self.max_workers <= 1 or len(indices) < self.min_pages_for_pool:
+            seen_xrefs = set()
+            with open_pdf(pdf_path) as pdf_document:
+                for index in indices:
+                    yield extract_page(pdf_document[index], index + 1, extract_images, seen_xrefs, render_textless)
+            return
+
+        # Only a couple of shards per worker are in flight, so memory stays bounded
+        # when the consumer is slower than extraction
+        shards = iter(shard_pages(indices, self.max_workers))
+        pending = collections.deque()
+        try:
+            for shard in itertools.islice(shards, self.max_workers * 2):
+                pending.append(self.submit_shard(pdf_path, shard, extract_images, render_textless))
+            while pending:
+                extracted = pending.popleft().result()
+                for shard in itertools.islice(shards, 1):
+                    pending.append(self.submit_shard(pdf_path, shard, extract_images, render_textless))
+                yield from extracted
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+
+
+pdf_engine = PdfEngine(PDF_WORKERS, PDF_MIN_PAGES_FOR_POOL, PDF_START_METHOD)
+atexit.register(pdf_engine.shutdown)
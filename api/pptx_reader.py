@@ -0,0 +1,157 @@
+"""Slide text and images read straight from a .pptx package.
+
+python-pptx builds an object model of the whole deck before the first slide can
+be read. This reader parses presentation.xml for the slide order and then one
+slide's XML at a time, and reads a media part only when images are wanted,
+once however many slides use it. The output matches extract_content_from_slide:
+text of the slide's top-level text shapes, and its top-level pictures (not
+movies) keyed by the sha1 of their bytes.
+"""
+import hashlib
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+from decouple import config
+
+# Set to false to read every deck with python-pptx, as before
+PPTX_FAST_EXTRACTOR = config('PPTX_FAST_EXTRACTOR', default=True, cast=bool)
+
+P = "{http://schemas.openxmlformats.org/presentationml/2006/main}"
+A = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+R = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PR = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+PRESENTATION_PART = "ppt/presentation.xml"
+
+
+class PackageError(Exception):
+    """The package is not a deck this reader understands; python-pptx may still read it."""
+
+
+def rels_name(part_name):
+    directory, name = posixpath.split(part_name)
+    return posixpath.join(directory, "_rels", name + ".rels")
+
+
+class PptxPackage:
+    def __init__(self, pptx_path):
+        try:
+            self.zip = zipfile.ZipFile(pptx_path)
+        except (OSError, zipfile.BadZipFile) as e:
+            raise PackageError(str(e)) from e
+        self.media = {}
+        try:
+            self.slide_parts = self.read_slide_parts()
+        except Exception:
+            self.zip.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.zip.close()
+
+    def __len__(self):
+        return len(self.slide_parts)
+
+    def read(self, part_name):
+        try:
+            return self.zip.read(part_name)
+        except (KeyError, zipfile.BadZipFile, OSError) as e:
+            raise PackageError(f"Cannot read {part_name}: {e}") from e
+
+    def parse(self, part_name):
+        try:
+            return ET.fromstring(self.read(part_name))
+        except ET.ParseError as e:
+            raise PackageError(f"Cannot parse {part_name}: {e}") from e
+
+    def relationships(self, part_name):
+        """Maps the rIds of a part's internal relationships to the part names they point at."""
+        if rels_name(part_name) not in self.zip.NameToInfo:
+            return {}
+        targets = {}
+        directory = posixpath.dirname(part_name)
+        for rel in self.parse(rels_name(part_name)).iter(f"{PR}Relationship"):
+            target = rel.get("Target")
+            if rel.get("TargetMode") == "External" or not target:
+                continue
+            if target.startswith("/"):
+                targets[rel.get("Id")] = target[1:]
+            else:
+                targets[rel.get("Id")] = posixpath.normpath(posixpath.join(directory, target))
+        return targets
+
+    def read_slide_parts(self):
+        # Slide order is the order of sldIdLst, not of the part names
+        targets = self.relationships(PRESENTATION_PART)
+        slide_ids = self.parse(PRESENTATION_PART).find(f"{P}sldIdLst")
+        if slide_ids is None:
+            return []
+        try:
+            return [targets[slide_id.get(f"{R}id")] for slide_id in slide_ids.iter(f"{P}sldId")]
+        except KeyError as e:
+            raise PackageError(f"Slide relationship {e} is missing") from e
+
+    def image(self, part_name):
+        """Returns {"key", "image"} for a media part, reading it on first use."""
+        if part_name not in self.media:
+            blob = self.read(part_name)
+            self.media[part_name] = {"key": hashlib.sha1(blob).hexdigest(), "image": blob}
+        return dict(self.media[part_name])
+
+    def slide(self, index, load_images=True):
+        """Content of the slide at index (from 0); images are left empty unless load_images."""
+        part_name = self.slide_parts[index]
+        shapes = self.parse(part_name).find(f"{P}cSld/{P}spTree")
+        content = {"slide_number": index, "texts": "", "images": []}
+        if shapes is None:
+            return content
+
+        targets = self.relationships(part_name) if load_images else {}
+        for shape in shapes:
+            if shape.tag == f"{P}sp":
+                text = shape_text(shape).strip()
+                if text:
+                    content["texts"] += text + "\n"
+            elif shape.tag == f"{P}pic" and load_images:
+                if shape.find(f"{P}nvPicPr/{P}nvPr/{A}videoFile") is not None:
+                    continue
+                blip = shape.find(f"{P}blipFill/{A}blip")
+                target = targets.get(blip.get(f"{R}embed")) if blip is not None else None
+                if target is not None:
+                    content["images"].append(self.image(target))
+        return content
+
+
+def shape_text(shape):
+    body = shape.find(f"{P}txBody")
+    if body is None:
+        return ""
+    paragraphs = []
+    for paragraph in body.findall(f"{A}p"):
+        parts = []
+        for child in paragraph:
+            if child.tag == f"{A}br":
+                # A soft line break, as python-pptx reports it
+                parts.append("\v")
+            elif child.tag in (f"{A}r", f"{A}fld"):
+                parts.append(child.findtext(f"{A}t") or "")
+        paragraphs.append("".join(parts))
+    return "\n".join(paragraphs)
+
+
+def read_slides(pptx_path, page_range=None, load_images=True):
+    """Returns (slides, selection) for the slides page_range selects, or all of them with selection None.
+
+    Raises PackageError for packages it cannot read, RangeError as page_range.select does.
+    """
+    with PptxPackage(pptx_path) as package:
+        numbers = range(len(package))
+        selection = None
+        if page_range is not None:
+            selection = page_range.select(0, len(package) - 1)
+            numbers = selection.numbers
+        return [package.slide(index, load_images) for index in numbers], selection
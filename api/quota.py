@@ -0,0 +1,164 @@
+import threading
+import time
+
+from decouple import config
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Least
+from django.db.models.lookups import GreaterThanOrEqual
+
+from api import models
+
+# Per-user bucket: burst size and refill rate in image descriptions per hour; a burst of 0 disables it
+QUOTA_USER_BURST = config('QUOTA_USER_BURST', default=50, cast=int)
+QUOTA_USER_PER_HOUR = config('QUOTA_USER_PER_HOUR', default=200, cast=float)
+
+# Shared bucket for all users, sized to stay under the upstream rate limit
+QUOTA_GLOBAL_BURST = config('QUOTA_GLOBAL_BURST', default=500, cast=int)
+QUOTA_GLOBAL_PER_HOUR = config('QUOTA_GLOBAL_PER_HOUR', default=6000, cast=float)
+
+GLOBAL_KEY = "global"
+
+
+class TokenBucket:
+    """A token bucket stored in the QuotaBucket table.
+
+    Every change is one UPDATE that refills and spends in the same statement, so
+    buckets stay correct with any number of threads and worker processes.
+    """
+
+    def __init__(self, key, burst, per_hour):
+        self.key = key
+        self.burst = burst
+        self.rate = per_hour / 3600
+        self.created = False
+
+    @property
+    def unlimited(self):
+        return self.burst <= 0
+
+    def refilled(self, now):
+        return Least(
+            Value(float(self.burst), output_field=FloatField()),
+            F("tokens") + (Value(now, output_field=FloatField()) - F("updated_at")) * Value(self.rate, output_field=FloatField()),
+        )
+
+    def rows(self):
+        return models.QuotaBucket.objects.filter(key=self.key)
+
+    def ensure(self):
+        """Creates the bucket row, full, if it does not exist yet."""
+        if self.created or self.unlimited:
+            return
+        if not self.rows().exists():
+            try:
+                with transaction.atomic():
+                    models.QuotaBucket.objects.create(key=self.key, tokens=float(self.burst), updated_at=time.time())
+            except IntegrityError:
+                # Created concurrently by another request
+                pass
+        self.created = True
+
+    def reserve(self, amount=1):
+        if self.unlimited:
+            return True
+        now = time.time()
+        rows = self.rows().filter(GreaterThanOrEqual(self.refilled(now), amount))
+        return rows.update(tokens=self.refilled(now) - amount, updated_at=now) == 1
+
+    def refund(self, amount=1):
+        if self.unlimited:
+            return
+        self.ensure()
+        self.rows().update(
+            tokens=Least(Value(float(self.burst), output_field=FloatField()), F("tokens") + amount)
+        )
+
+    def remaining(self):
+        if self.unlimited:
+            return None
+        self.ensure()
+        bucket = self.rows().values("tokens", "updated_at").first()
+        if bucket is None:
+            return self.burst
+        return int(min(self.burst, bucket["tokens"] + (time.time() - bucket["updated_at"]) * self.rate))
+
+
+def user_bucket(subject):
+    return TokenBucket(f"user:{subject}", QUOTA_USER_BURST, QUOTA_USER_PER_HOUR)
+
+
+def global_bucket():
+    return TokenBucket(GLOBAL_KEY, QUOTA_GLOBAL_BURST, QUOTA_GLOBAL_PER_HOUR)
+
+
+def reserve_all(buckets, amount=1):
+    """Takes amount from every bucket, or from none of them."""
+    # Rows are created up front: on SQLite a transaction that reads before it
+    # writes fails with "database is locked" instead of waiting for other writers
+    for bucket in buckets:
+        bucket.ensure()
+    with transaction.atomic():
+        for bucket in buckets:
+            if not bucket.reserve(amount):
+                transaction.set_rollback(True)
+                return False
+    return True
+
+
+def quota_subject(request):
+    """Who a request is billed to: the authenticated user, the user it names, or its address."""
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return f"id:{user.pk}"
+    data = getattr(request, "data", request.POST)
+    name = data.get("user") or request.GET.get("user")
+    if name:
+        return f"name:{name}"
+    return f"ip:{request.META.get('REMOTE_ADDR', 'unknown')}"
+
+
+class RequestBudget:
+    """Image description budget for one request.
+
+    decrement() and get_value() match ThreadSafeCounter, so it drops into the
+    existing call sites. Each image needs one unit of the request's own cap
+    (rImages) and one token from both the user's and the global bucket.
+    refund() gives everything back when the upstream call fails.
+    """
+
+    def __init__(self, subject, limit):
+        self.subject = subject
+        self.value = limit
+        self.lock = threading.Lock()
+        self.buckets = [user_bucket(subject), global_bucket()]
+        # Set once a bucket turned an image down, i.e. the result depends on the current quota
+        self.denied = False
+
+    def decrement(self):
+        with self.lock:
+            if self.value <= 0:
+                return False
+            self.value -= 1
+
+        if reserve_all(self.buckets):
+            return True
+
+        with self.lock:
+            self.value += 1
+            self.denied = True
+        return False
+
+    def refund(self):
+        with self.lock:
+            self.value += 1
+        for bucket in self.buckets:
+            bucket.refund()
+
+    def get_value(self):
+        with self.lock:
+            return self.value
+
+    def report(self):
+        user = self.buckets[0]
+        return {"remaining": user.remaining(), "burst": None if user.unlimited else user.burst}
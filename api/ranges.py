@@ -0,0 +1,142 @@
+"""Page and slide selection for partial reads of large documents.
+
+Clients pick pages with "pages" (or "slides"), e.g. "40-60" or "1,3,10-", and cap
+how many are processed with "max_pages". When a cap cuts a read short the
+response carries a continuation token; posting the same file again with
+"continuation" set to it returns the next chunk.
+"""
+from decouple import config
+from django.core import signing
+
+# Server-side cap on pages or slides processed per request; 0 means no cap
+MAX_PAGES_PER_REQUEST = config('MAX_PAGES_PER_REQUEST', default=0, cast=int)
+
+# Continuation tokens stop working after this many seconds
+CONTINUATION_MAX_AGE = config('CONTINUATION_MAX_AGE', default=24 * 60 * 60, cast=int)
+
+TOKEN_SALT = "api.ranges.continuation"
+
+
+class RangeError(ValueError):
+    pass
+
+
+def parse_ranges(spec):
+    """Parses "1-3,7,10-" into [(1, 3), (7, 7), (10, None)]; None is the end of the document."""
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start, dash, end = (value.strip() for value in part.partition("-"))
+        try:
+            start = int(start) if start else None
+            end = (int(end) if end else None) if dash else start
+        except ValueError:
+            raise RangeError(f"Invalid page range: {part!r}")
+        if start is not None and end is not None and start > end:
+            raise RangeError(f"Invalid page range: {part!r}")
+        ranges.append((start, end))
+    return ranges
+
+
+def format_ranges(numbers):
+    """Formats sorted page numbers as "1-3,7"."""
+    parts = []
+    for number in numbers:
+        if parts and parts[-1][1] == number - 1:
+            parts[-1][1] = number
+        else:
+            parts.append([number, number])
+    return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in parts)
+
+
+def parse_max_pages(value):
+    if value in (None, ""):
+        return 0
+    try:
+        max_pages = int(value)
+    except (TypeError, ValueError):
+        raise RangeError("max_pages must be a positive integer.")
+    if max_pages < 1:
+        raise RangeError("max_pages must be a positive integer.")
+    return max_pages
+
+
+class PageRange:
+    """The pages a request asked for, before the document's page count is known."""
+
+    def __init__(self, file_hash, kind, ranges, max_pages):
+        self.file_hash = file_hash
+        self.kind = kind
+        self.ranges = ranges
+        self.max_pages = max_pages
+
+    def key(self):
+        # Identifies the selection in result cache keys; equal keys select equal pages of a file
+        spec = ",".join(
+            "-".join("" if bound is None else str(bound) for bound in bounds) for bounds in self.ranges
+        )
+        return f"{spec or 'all'};max={self.max_pages}"
+
+    def limit(self):
+        limits = [limit for limit in (self.max_pages, MAX_PAGES_PER_REQUEST) if limit > 0]
+        return min(limits) if limits else None
+
+    def select(self, first, last):
+        """Resolves the selection against a document numbered first..last."""
+        numbers = set()
+        for start, end in self.ranges or [(None, None)]:
+            start = first if start is None else max(start, first)
+            end = last if end is None else min(end, last)
+            numbers.update(range(start, end + 1))
+        numbers = sorted(numbers)
+        if not numbers and last >= first:
+            raise RangeError(f"The requested range selects nothing in a document numbered {first}-{last}.")
+
+        limit = self.limit()
+        rest = numbers[limit:] if limit is not None else []
+        numbers = numbers[:limit] if limit is not None else numbers
+        continuation = None
+        if rest:
+            state = {
+                "file": self.file_hash,
+                "kind": self.kind,
+                "ranges": parse_ranges(format_ranges(rest)),
+                "max": self.max_pages,
+            }
+            continuation = signing.dumps(state, salt=TOKEN_SALT, compress=True)
+        return PageSelection(numbers, last - first + 1, continuation)
+
+
+class PageSelection:
+    def __init__(self, numbers, total, continuation):
+        self.numbers = numbers
+        self.total = total
+        self.continuation = continuation
+
+    def report(self):
+        return {"selected": format_ranges(self.numbers), "total": self.total, "continuation": self.continuation}
+
+
+def requested_range(data, param, file_hash, kind):
+    """Returns the PageRange a request asks for, or None when it wants the whole document.
+
+    Raises RangeError for malformed ranges and for continuation tokens that are
+    forged, expired or issued for another file.
+    """
+    token = data.get("continuation")
+    if token:
+        try:
+            state = signing.loads(token, salt=TOKEN_SALT, max_age=CONTINUATION_MAX_AGE)
+        except signing.BadSignature:
+            raise RangeError("Invalid or expired continuation token.")
+        if state["file"] != file_hash or state["kind"] != kind:
+            raise RangeError("The continuation token was issued for a different document.")
+        return PageRange(file_hash, kind, [tuple(bounds) for bounds in state["ranges"]], state["max"])
+
+    ranges = parse_ranges(str(data.get(param, "")))
+    max_pages = parse_max_pages(data.get("max_pages"))
+    if not ranges and not max_pages and not MAX_PAGES_PER_REQUEST:
+        return None
+    return PageRange(file_hash, kind, ranges, max_pages)
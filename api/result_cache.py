@@ -0,0 +1,114 @@
+import datetime
+import hashlib
+import json
+import threading
+
+from decouple import config
+from django.db import DatabaseError
+from django.utils import timezone
+
+from api import metrics, models
+
+# Persistent TTL (seconds) and row cap for whole-document results
+DOCUMENT_CACHE_TTL = config('DOCUMENT_CACHE_TTL', default=60 * 60 * 24 * 7, cast=int)
+DOCUMENT_CACHE_MAX_ROWS = config('DOCUMENT_CACHE_MAX_ROWS', default=5000, cast=int)
+
+# Bump when the stored result layout changes, so old rows stop matching
+RESULT_FORMAT_VERSION = 1
+
+# Run the eviction pass once every this many writes
+EVICTION_INTERVAL = 50
+
+
+def hash_upload(uploaded_file):
+    """sha256 of an uploaded file, read in chunks; the file is rewound afterwards."""
+    digest = hashlib.sha256()
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def make_result_key(file_hash, kind, options, model):
+    key_data = {"file": file_hash, "kind": kind, "options": options, "model": model, "version": RESULT_FORMAT_VERSION}
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class DocumentResultCache:
+    def __init__(self, ttl, max_rows):
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def get(self, key):
+        cutoff = timezone.now() - datetime.timedelta(seconds=self.ttl)
+        try:
+            rows = models.DocumentResult.objects.filter(key=key, created_at__gte=cutoff)
+            result = rows.values_list("result", flat=True).first()
+            if result is not None:
+                rows.update(last_used_at=timezone.now())
+        except DatabaseError:
+            result = None
+
+        with self.lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(result)
+
+    def set(self, key, file_hash, kind, result):
+        with self.lock:
+            self.writes += 1
+            evict = self.writes % EVICTION_INTERVAL == 0
+
+        try:
+            models.DocumentResult.objects.update_or_create(
+                key=key,
+                defaults={
+                    "file_hash": file_hash,
+                    "kind": kind,
+                    "result": json.dumps(result, ensure_ascii=False),
+                    "created_at": timezone.now(),
+                },
+            )
+            if evict:
+                self.evict()
+        except DatabaseError:
+            pass
+
+    def invalidate(self, file_hash=None, kind=None):
+        """Deletes cached results for one document (any options), one kind, or everything."""
+        rows = models.DocumentResult.objects.all()
+        if file_hash is not None:
+            rows = rows.filter(file_hash=file_hash)
+        if kind is not None:
+            rows = rows.filter(kind=kind)
+        deleted, _ = rows.delete()
+        return deleted
+
+    def evict(self):
+        cutoff = timezone.now() - datetime.timedelta(seconds=self.ttl)
+        models.DocumentResult.objects.filter(created_at__lt=cutoff).delete()
+
+        stale_ids = list(
+            models.DocumentResult.objects.order_by("-last_used_at").values_list("id", flat=True)[self.max_rows:]
+        )
+        if stale_ids:
+            models.DocumentResult.objects.filter(id__in=stale_ids).delete()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+document_cache = DocumentResultCache(DOCUMENT_CACHE_TTL, DOCUMENT_CACHE_MAX_ROWS)
+metrics.track_stats(metrics.CACHE_STATS, document_cache.stats, cache="document")
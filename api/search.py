@@ -0,0 +1,114 @@
+import hashlib
+import re
+
+from decouple import config
+from django.db import connection, transaction
+
+from api import models
+from api.storage import split_segments, stored_bytes, unpack_segment
+
+SEARCH_MAX_RESULTS = config('SEARCH_MAX_RESULTS', default=50, cast=int)
+
+# Characters of page text returned around the first match
+SNIPPET_CHARS = 160
+
+# Query terms; a trailing * makes a prefix search
+TERM = re.compile(r"\w+\*?")
+
+
+def search_available():
+    # The index is an SQLite FTS5 table
+    return connection.vendor == "sqlite"
+
+
+def owner_token(user):
+    # One opaque token per user; raw user ids would be split up by the tokenizer
+    return "u" + hashlib.sha1(user.encode("utf-8")).hexdigest()
+
+
+def build_match(user, query):
+    """Returns (FTS5 match expression, terms), or (None, []) when the query has no terms."""
+    terms = TERM.findall(query)
+    if not terms:
+        return None, []
+    phrases = " ".join(f'"{term[:-1]}"*' if term.endswith("*") else f'"{term}"' for term in terms)
+    return f'owner : "{owner_token(user)}" AND body : ({phrases})', terms
+
+
+def index_history(history):
+    """Adds every page or slide of a History response to the search index."""
+    if not search_available():
+        return
+
+    segments = split_segments(history.response)
+    token = owner_token(history.user)
+    with transaction.atomic():
+        rows = models.HistorySegment.objects.bulk_create([
+            models.HistorySegment(history=history, segment=index, label=label)
+            for index, (label, _) in enumerate(segments)
+        ])
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO api_history_fts (rowid, body, owner) VALUES (%s, %s, %s)",
+                [(row.id, text, token) for row, (_, text) in zip(rows, segments)],
+            )
+
+
+def clear_index():
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO api_history_fts (api_history_fts) VALUES ('delete-all')")
+        models.HistorySegment.objects.all().delete()
+
+
+def make_snippet(text, terms):
+    pattern = re.compile(
+        "|".join(re.escape(term[:-1]) if term.endswith("*") else rf"\b{re.escape(term)}\b" for term in terms),
+        re.IGNORECASE,
+    )
+    match = pattern.search(text)
+    center = match.start() if match else 0
+    start = max(0, center - SNIPPET_CHARS // 3)
+    end = min(len(text), start + SNIPPET_CHARS)
+    snippet = " ".join(text[start:end].split())
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
+
+
+def search_history(user, query, limit):
+    """Returns the best matching pages of a user's history, best first."""
+    match, terms = build_match(user, query)
+    if match is None:
+        return []
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT s.history_id, s.segment, s.label, f.rank"
+            f" FROM api_history_fts f JOIN {models.HistorySegment._meta.db_table} s ON s.id = f.rowid"
+            " WHERE api_history_fts MATCH %s ORDER BY f.rank LIMIT %s",
+            [match, limit],
+        )
+        hits = cursor.fetchall()
+
+    # Only the block holding each matching page is decompressed
+    histories = {
+        history["id"]: history
+        for history in models.History.objects.filter(pk__in={hit[0] for hit in hits})
+        .annotate(raw=stored_bytes("response"))
+        .values("id", "used_file", "created_at", "raw")
+    }
+
+    results = []
+    for history_id, segment, label, rank in hits:
+        history = histories.get(history_id)
+        if history is None:
+            continue
+        results.append({
+            "history_id": history_id,
+            "used_file": history["used_file"],
+            "created_at": history["created_at"],
+            "page": label,
+            "segment": segment,
+            "snippet": make_snippet(unpack_segment(history["raw"], segment), terms),
+            "score": -rank,
+        })
+    return results
@@ -8,9 +8,20 @@ class ImageDescriptionSerializer(serializers.Serializer):
 
 
 class HistorySerializer(serializers.ModelSerializer):
+    # Stored compressed, but clients keep sending and receiving plain text
+    response = serializers.CharField()
+
+    class Meta:
+        model = models.History
+        fields = ["id", "user", "used_file", "response", "created_at"]
+
+
+class HistoryListSerializer(serializers.ModelSerializer):
+    """History without the response body."""
+
     class Meta:
         model = models.History
-        fields = "__all__"
+        fields = ["id", "user", "used_file", "created_at", "response_size", "response_preview"]
 
 
 
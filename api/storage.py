@@ -0,0 +1,184 @@
+import json
+import re
+import struct
+import zlib
+
+from decouple import config
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Codec for new bodies, "zlib" or "zstd" (needs the zstandard package); stored per body, so both can be read back
+HISTORY_COMPRESSION = config('HISTORY_COMPRESSION', default='zlib')
+
+# Segment size for text without page or slide markers
+SEGMENT_CHARS = 64 * 1024
+
+# Segments are compressed together in blocks of at least this many characters
+BLOCK_CHARS = 32 * 1024
+
+MAGIC = b"SMZ1"
+HEADER_LENGTH = struct.Struct(">I")
+
+# Extraction output starts every page with "Page N:" and every slide object with "slide_number"
+PAGE_MARKER = re.compile(r"^Page (\d+):$", re.MULTILINE)
+SLIDE_MARKER = re.compile(r'\{\s*"slide_number"\s*:\s*(\d+)')
+
+
+def split_segments(text):
+    """Splits text into (label, segment) pairs that concatenate back to the exact original."""
+    for marker in (PAGE_MARKER, SLIDE_MARKER):
+        matches = list(marker.finditer(text))
+        if matches:
+            starts = [match.start() for match in matches]
+            segments = []
+            if starts[0] > 0:
+                segments.append((None, text[:starts[0]]))
+            for match, start, end in zip(matches, starts, starts[1:] + [len(text)]):
+                segments.append((int(match.group(1)), text[start:end]))
+            return segments
+
+    return [(None, text[start:start + SEGMENT_CHARS]) for start in range(0, len(text), SEGMENT_CHARS)]
+
+
+def compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return zlib.compress(data, 6)
+
+
+def decompress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This body was stored with zstd; install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def pack(text):
+    """Encodes text as MAGIC, a JSON header and independently compressed blocks.
+
+    Segments are grouped into blocks of about BLOCK_CHARS, so short pages still
+    compress well; the header maps every segment to its block and character range.
+    """
+    codec = "zstd" if HISTORY_COMPRESSION == "zstd" and zstandard is not None else "zlib"
+    blocks = []
+    blobs = []
+    block_parts, block_segments, block_chars = [], [], 0
+
+    def flush():
+        block_text = "".join(block_parts)
+        blob = compress(block_text.encode("utf-8"), codec)
+        blocks.append([len(blob), len(block_text), list(block_segments)])
+        blobs.append(blob)
+
+    for label, segment in split_segments(text):
+        block_segments.append([label, block_chars, block_chars + len(segment)])
+        block_parts.append(segment)
+        block_chars += len(segment)
+        if block_chars >= BLOCK_CHARS:
+            flush()
+            block_parts, block_segments, block_chars = [], [], 0
+    if block_parts:
+        flush()
+
+    header = json.dumps({"codec": codec, "blocks": blocks}, separators=(",", ":")).encode("utf-8")
+    return b"".join([MAGIC, HEADER_LENGTH.pack(len(header)), header, *blobs])
+
+
+def read_header(data):
+    header_length, = HEADER_LENGTH.unpack_from(data, len(MAGIC))
+    body_start = len(MAGIC) + HEADER_LENGTH.size + header_length
+    header = json.loads(data[len(MAGIC) + HEADER_LENGTH.size:body_start])
+    return header, body_start
+
+
+def is_packed(data):
+    return isinstance(data, (bytes, bytearray, memoryview)) and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def unpack(data):
+    if isinstance(data, str):
+        return data
+    data = bytes(data)
+    if not is_packed(data):
+        # Rows written before compression was introduced
+        return data.decode("utf-8")
+
+    header, offset = read_header(data)
+    parts = []
+    for compressed_length, _, _ in header["blocks"]:
+        parts.append(decompress(data[offset:offset + compressed_length], header["codec"]).decode("utf-8"))
+        offset += compressed_length
+    return "".join(parts)
+
+
+def segment_index(data):
+    """Returns [{"index", "label", "size"}] for a stored body without decompressing it."""
+    data = bytes(data)
+    if not is_packed(data):
+        return [{"index": 0, "label": None, "size": len(data.decode("utf-8"))}]
+
+    header, _ = read_header(data)
+    segments = [segment for _, _, block_segments in header["blocks"] for segment in block_segments]
+    return [{"index": index, "label": label, "size": end - start} for index, (label, start, end) in enumerate(segments)]
+
+
+def unpack_segment(data, index):
+    """Decodes only the block holding one segment; raises IndexError if there is no such segment."""
+    data = bytes(data)
+    if not is_packed(data):
+        if index != 0:
+            raise IndexError(index)
+        return data.decode("utf-8")
+
+    header, offset = read_header(data)
+    if index >= 0:
+        for compressed_length, _, block_segments in header["blocks"]:
+            if index < len(block_segments):
+                _, start, end = block_segments[index]
+                block = decompress(data[offset:offset + compressed_length], header["codec"]).decode("utf-8")
+                return block[start:end]
+            index -= len(block_segments)
+            offset += compressed_length
+    raise IndexError(index)
+
+
+class CompressedTextField(models.BinaryField):
+    """A text field stored as a compressed, segmented blob; model instances see plain str."""
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("editable", True)
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        if kwargs.get("editable") is True:
+            del kwargs["editable"]
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return unpack(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str):
+            return value
+        return unpack(value)
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if isinstance(value, str):
+            value = pack(value)
+        return super().get_db_prep_value(value, connection, prepared)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+
+def stored_bytes(field_name):
+    """Annotation that reads a CompressedTextField's bytes as stored, skipping the full decode."""
+    return models.ExpressionWrapper(models.F(field_name), output_field=models.BinaryField())
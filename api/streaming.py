@@ -0,0 +1,41 @@
+import json
+
+from django.http import StreamingHttpResponse
+
+# Supported values of the "stream" request parameter
+STREAM_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def requested_stream_format(request):
+    stream_format = str(request.data.get("stream", request.query_params.get("stream", ""))).lower()
+    return stream_format if stream_format in STREAM_FORMATS else None
+
+
+def encode_event(stream_format, event_type, data):
+    if stream_format == "sse":
+        return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"type": event_type, **data}, ensure_ascii=False) + "\n"
+
+
+def streaming_response(stream_format, events):
+    """Streams (event_type, data) pairs; an exception mid-stream becomes a final "error" event."""
+    def generate():
+        try:
+            for event_type, data in events:
+                yield encode_event(stream_format, event_type, data)
+        except Exception as e:
+            yield encode_event(stream_format, "error", {"error": str(e)})
+        finally:
+            # Runs the producer's cleanup right away when the client disconnects
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+
+    response = StreamingHttpResponse(generate(), content_type=STREAM_FORMATS[stream_format])
+    response["Cache-Control"] = "no-cache"
+    # Stop nginx from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,70 @@
+import asyncio
+import io
+from unittest import mock
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from api import async_views
+from api.views import ThreadSafeCounter
+
+
+def png():
+    buffered = io.BytesIO()
+    Image.new("RGB", (32, 32), (10, 120, 200)).save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+class SharedDescriptionTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = 0
+        self.cache = {}
+        cache = mock.Mock(get=self.cache.get, set=self.cache.__setitem__)
+        patcher = mock.patch.object(async_views, "description_cache", cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def describe_concurrently(self, counters, describe):
+        async def run():
+            with mock.patch.object(async_views, "describe_image_with_gpt_async", describe):
+                semaphore = asyncio.Semaphore(4)
+                return await asyncio.gather(
+                    *(async_views.describe_image_async(png(), "Describe", semaphore, counter) for counter in counters),
+                    return_exceptions=True,
+                )
+
+        return asyncio.run(run())
+
+    def test_concurrent_misses_share_one_call_and_one_charge(self):
+        async def describe(base64_image, prompt_text, mime_type):
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return "a blue square"
+
+        counters = [ThreadSafeCounter(5), ThreadSafeCounter(5)]
+        results = self.describe_concurrently(counters, describe)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(sorted(results), [("a blue square", False), ("a blue square", True)])
+        self.assertEqual(sorted(counter.get_value() for counter in counters), [4, 5])
+
+    def test_failed_call_refunds_and_fails_every_waiter(self):
+        async def describe(base64_image, prompt_text, mime_type):
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            raise ConnectionError("upstream went away")
+
+        counters = [ThreadSafeCounter(5), ThreadSafeCounter(5)]
+        results = self.describe_concurrently(counters, describe)
+        self.assertEqual(self.calls, 1)
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+        self.assertEqual([counter.get_value() for counter in counters], [5, 5])
+
+    def test_waiter_goes_ahead_when_the_first_caller_has_no_budget(self):
+        async def describe(base64_image, prompt_text, mime_type):
+            self.calls += 1
+            return "a blue square"
+
+        counters = [ThreadSafeCounter(0), ThreadSafeCounter(5)]
+        results = self.describe_concurrently(counters, describe)
+        self.assertEqual(results, [(None, False), ("a blue square", True)])
+        self.assertEqual(self.calls, 1)
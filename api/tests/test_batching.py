@@ -0,0 +1,151 @@
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.test import SimpleTestCase, TransactionTestCase
+from PIL import Image
+
+from api import batching, deadlines
+from api.quota import RequestBudget, user_bucket
+
+
+def png(width, height, color):
+    buffered = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+class CountingBudget:
+    def __init__(self, value):
+        self.value = value
+        self.refunds = 0
+
+    def decrement(self):
+        if self.value <= 0:
+            return False
+        self.value -= 1
+        return True
+
+    def refund(self):
+        self.value += 1
+        self.refunds += 1
+
+
+class ParseBatchResponseTests(SimpleTestCase):
+    def test_object_and_list_replies(self):
+        self.assertEqual(batching.parse_batch_response('{"descriptions": ["a", " b "]}', 2), ["a", "b"])
+        self.assertEqual(batching.parse_batch_response('["a", "b"]', 2), ["a", "b"])
+
+    def test_fenced_reply(self):
+        reply = '```json\n{"descriptions": ["a", "b"]}\n```'
+        self.assertEqual(batching.parse_batch_response(reply, 2), ["a", "b"])
+
+    def test_replies_that_do_not_fit_are_rejected(self):
+        for reply in (
+            "Image 1 shows a cat. Image 2 shows a dog.",
+            '{"descriptions": ["a"]}',
+            '{"descriptions": ["a", "b", "c"]}',
+            '{"descriptions": ["a", ""]}',
+            '{"descriptions": ["a", 2]}',
+            '{"captions": ["a", "b"]}',
+            '{"descriptions": ["a", "b"',
+            "",
+            None,
+        ):
+            with self.subTest(reply=reply):
+                self.assertIsNone(batching.parse_batch_response(reply, 2))
+
+
+class PlanBatchesTests(SimpleTestCase):
+    def test_image_limit(self):
+        sizes = [(10, 10)] * 5
+        self.assertEqual(batching.plan_batches(sizes, 2, 1000, 1000), [[0, 1], [2, 3], [4]])
+
+    def test_pixel_and_byte_limits(self):
+        self.assertEqual(batching.plan_batches([(60, 1), (50, 1), (40, 1)], 8, 100, 1000), [[0], [1, 2]])
+        self.assertEqual(batching.plan_batches([(1, 600), (1, 300), (1, 300)], 8, 1000, 1000), [[0, 1], [2]])
+
+    def test_oversized_image_gets_a_batch_of_its_own(self):
+        self.assertEqual(batching.plan_batches([(1, 1), (500, 1), (1, 1)], 8, 100, 1000), [[0], [1], [2]])
+
+    def test_nothing_to_plan(self):
+        self.assertEqual(batching.plan_batches([], 8, 100, 100), [])
+
+
+class RunBatchTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(batching, "description_cache", mock.Mock(get=lambda key: None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pending(self, count):
+        batch = []
+        for index in range(count):
+            item = batching.PendingImage(f"key-{index}", b"image")
+            item.payload, item.mime_type = b"payload", "image/png"
+            item.futures.append(batching.Future())
+            batch.append(item)
+        return batch
+
+    def test_failed_batch_refunds_every_image(self):
+        budget = CountingBudget(0)
+        batch = self.pending(3)
+        # One caller gave up on its image already
+        batch[0].futures[0].cancel()
+        with mock.patch.object(batching, "describe_batch", side_effect=ConnectionError("down")):
+            batching.run_batch(batch, "Describe", budget)
+
+        self.assertEqual(budget.refunds, 3)
+        for item in batch[1:]:
+            with self.assertRaises(ConnectionError):
+                item.futures[0].result(timeout=0)
+
+    def test_unparsable_reply_falls_back_to_one_request_per_image(self):
+        budget = CountingBudget(0)
+        batch = self.pending(3)
+        with mock.patch.object(batching, "describe_batch", return_value=None), \
+                mock.patch("api.views.describe_image_with_gpt", side_effect=["one", ConnectionError("down"), "three"]), \
+                self.assertLogs("api.batching", "WARNING"):
+            batching.run_batch(batch, "Describe", budget)
+
+        self.assertEqual(batch[0].futures[0].result(timeout=0), ("one", True))
+        with self.assertRaises(ConnectionError):
+            batch[1].futures[0].result(timeout=0)
+        self.assertEqual(batch[2].futures[0].result(timeout=0), ("three", True))
+        self.assertEqual(budget.refunds, 1)
+
+    def test_repeats_of_an_image_share_one_description_and_one_charge(self):
+        budget = CountingBudget(10)
+        batch = self.pending(2)
+        batch[0].futures.append(batching.Future())
+        with mock.patch.object(batching, "describe_batch", return_value=["first", "second"]):
+            batching.run_batch(batch, "Describe", budget)
+
+        self.assertEqual([future.result(timeout=0) for future in batch[0].futures], [("first", True), ("first", False)])
+        self.assertEqual(batch[1].futures[0].result(timeout=0), ("second", True))
+        self.assertEqual(budget.refunds, 0)
+
+
+class DeadlineRefundTests(TransactionTestCase):
+    # Budget is refunded from executor threads, which need committed rows to see
+
+    def test_batch_failing_after_the_deadline_refunds_every_image(self):
+        budget = RequestBudget("deadline-test", 25)
+        images = [png(64, 64, (index * 20, 90, 200)) for index in range(8)]
+
+        def slow_failure(images, prompt_text):
+            time.sleep(0.4)
+            raise ConnectionError("upstream went away")
+
+        deadline = deadlines.Deadline(0.1)
+        executor = ThreadPoolExecutor(max_workers=2)
+        with mock.patch.object(batching, "describe_batch", slow_failure):
+            futures = batching.submit_descriptions(executor, images, "Describe", budget, deadline=deadline)
+            for future in futures:
+                with self.assertRaises(deadlines.DeadlineExceeded):
+                    deadlines.result(future, deadline)
+            executor.shutdown(wait=True)
+
+        self.assertEqual(budget.get_value(), 25)
+        self.assertEqual(user_bucket("deadline-test").remaining(), user_bucket("deadline-test").burst)
@@ -0,0 +1,84 @@
+import io
+import random
+
+from django.test import SimpleTestCase
+from PIL import Image, ImageDraw
+
+from api.dedup import ImageDeduplicator, image_signature
+
+WORDS = "invoice total amount due payment account balance statement period tax rate net gross".split()
+
+
+def encode(image, image_format="PNG", **options):
+    buffered = io.BytesIO()
+    image.save(buffered, format=image_format, **options)
+    return buffered.getvalue()
+
+
+def text_page(seed, size=(1240, 1754)):
+    """A scanned page: the same layout as every other page, different words."""
+    rng = random.Random(seed)
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(75, size[1] - 150, 25):
+        draw.text((75, y), " ".join(rng.choice(WORDS) for _ in range(14)), fill=0)
+    return image
+
+
+def picture(seed, size=(400, 300)):
+    rng = random.Random(seed)
+    image = Image.linear_gradient("L").resize(size).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse([x, y, x + size[0] // 3, y + size[1] // 3],
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    return image
+
+
+def duplicates(images, near_duplicates=True):
+    deduplicator = ImageDeduplicator(near_duplicates)
+    return [
+        deduplicator.check(None, image_signature(image_bytes), number)
+        for number, image_bytes in enumerate(images, start=1)
+    ]
+
+
+class DeduplicationTests(SimpleTestCase):
+    def test_pages_of_different_text_are_not_duplicates(self):
+        pages = [encode(text_page(seed)) for seed in range(6)]
+        self.assertEqual(duplicates(pages), [None] * 6)
+
+    def test_different_screenshots_are_not_duplicates(self):
+        screenshots = [encode(text_page(seed, (800, 450)).convert("RGB")) for seed in range(5)]
+        self.assertEqual(duplicates(screenshots), [None] * 5)
+
+    def test_different_pictures_are_not_duplicates(self):
+        self.assertEqual(duplicates([encode(picture(seed)) for seed in range(5)]), [None] * 5)
+
+    def test_repeated_bytes_match_the_first_occurrence(self):
+        page = encode(text_page(1))
+        self.assertEqual(duplicates([page, encode(text_page(2)), page]), [None, None, 1])
+        self.assertEqual(duplicates([page, encode(text_page(2)), page], near_duplicates=False), [None, None, 1])
+
+    def test_reencoded_and_resized_pictures_are_near_duplicates(self):
+        image = picture(7)
+        copies = [encode(image), encode(image, "JPEG", quality=75), encode(image.resize((200, 150)))]
+        self.assertEqual(duplicates(copies), [None, 1, 1])
+
+    def test_exact_matching_ignores_near_duplicates(self):
+        image = picture(7)
+        copies = [encode(image), encode(image, "JPEG", quality=75)]
+        self.assertEqual(duplicates(copies, near_duplicates=False), [None, None])
+
+    def test_different_aspect_ratio_is_not_a_duplicate(self):
+        image = picture(7)
+        self.assertEqual(duplicates([encode(image), encode(image.resize((400, 200)))]), [None, None])
+
+    def test_keys_match_without_signatures(self):
+        deduplicator = ImageDeduplicator()
+        self.assertIsNone(deduplicator.check(12, None, 1))
+        self.assertEqual(deduplicator.check(12, None, 3), 1)
+
+    def test_undecodable_images_match_only_exactly(self):
+        self.assertEqual(duplicates([b"not an image", b"not an image", b"not an image either"]), [None, 1, None])
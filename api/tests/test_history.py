@@ -0,0 +1,62 @@
+import base64
+import datetime
+from unittest import mock
+
+from django.test import TestCase
+from django.utils import timezone
+
+from api import models
+from api.pagination import HistoryCursorPagination
+
+
+def cursor_for(position):
+    return base64.b64encode(f"p={position}".encode()).decode()
+
+
+class HistoryListTests(TestCase):
+    def setUp(self):
+        self.start = timezone.now() - datetime.timedelta(days=1)
+        self.ids = [self.create(minutes) for minutes in range(5)]
+
+    def create(self, minutes, user="alice"):
+        history = models.History.objects.create(user=user, used_file="history/report.pdf", response=f"body {minutes}")
+        # created_at is set on insert; spread rows out so their order is known
+        models.History.objects.filter(pk=history.pk).update(created_at=self.start + datetime.timedelta(minutes=minutes))
+        return history.pk
+
+    def list(self, url="/history/alice/list/", **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_stay_stable_across_inserts(self):
+        first = self.list(page_size=2)
+        self.assertEqual([row["id"] for row in first["results"]], self.ids[4:2:-1])
+        self.assertNotIn("response", first["results"][0])
+
+        # Newer rows land before the first page, not in the pages still to come
+        self.create(10)
+        self.create(11)
+        second = self.client.get(first["next"]).json()
+        third = self.client.get(second["next"]).json()
+        self.assertEqual([row["id"] for row in second["results"]], self.ids[2:0:-1])
+        self.assertEqual([row["id"] for row in third["results"]], self.ids[:1])
+        self.assertIsNone(third["next"])
+
+    def test_only_the_users_rows(self):
+        self.create(20, user="bob")
+        self.assertEqual(len(self.list(page_size=100)["results"]), 5)
+
+    def test_page_size_is_clamped(self):
+        with mock.patch.object(HistoryCursorPagination, "max_page_size", 3):
+            self.assertEqual(len(self.list(page_size=1000)["results"]), 3)
+        with mock.patch.object(HistoryCursorPagination, "page_size", 4):
+            for page_size in ("0", "-1", "many"):
+                with self.subTest(page_size=page_size):
+                    self.assertEqual(len(self.list(page_size=page_size)["results"]), 4)
+
+    def test_invalid_cursor(self):
+        # Not base64, then well-formed cursors whose positions are not timestamps
+        for cursor in ("garbage", cursor_for("2024"), cursor_for("2026-13-45 00:00:00")):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.client.get("/history/alice/list/", {"cursor": cursor}).status_code, 404)
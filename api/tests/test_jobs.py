@@ -0,0 +1,115 @@
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TransactionTestCase, override_settings
+from django.utils import timezone
+
+from api import jobs
+from api.models import Job, JobPage
+
+
+class JobTestCase(TransactionTestCase):
+    # The lease is renewed from its own thread, which needs committed rows to see
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, True)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def create_job(self, **fields):
+        return Job.objects.create(kind=Job.KIND_PDF, document=ContentFile(b"%PDF-1.4", name="doc.pdf"), **fields)
+
+    def run_with_units(self, job, units, worker_id="runner"):
+        """Runs a claimed job on units(job, skip, counter), a generator of (number, content, count)."""
+        def iter_job_units(job, skip, remaining_images_counter, payload_stats):
+            return units(job, skip, remaining_images_counter)
+
+        with mock.patch.object(jobs, "iter_job_units", iter_job_units):
+            jobs.run_job(job, worker_id)
+        return Job.objects.get(pk=job.pk)
+
+
+class ClaimTests(JobTestCase):
+    def test_jobs_are_claimed_once_in_order(self):
+        first, second = self.create_job(), self.create_job()
+        self.assertEqual(jobs.claim_next_job("a").pk, first.pk)
+        self.assertEqual(jobs.claim_next_job("b").pk, second.pk)
+        self.assertIsNone(jobs.claim_next_job("c"))
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.locked_by), (Job.RUNNING, "a"))
+
+    def test_stale_running_job_is_claimed_again(self):
+        stale = timezone.now() - timedelta(seconds=jobs.JOB_LEASE_SECONDS + 1)
+        job = self.create_job(status=Job.RUNNING, locked_by="gone", heartbeat_at=stale)
+        self.create_job(status=Job.RUNNING, locked_by="alive", heartbeat_at=timezone.now())
+        self.assertEqual(jobs.claim_next_job("a").pk, job.pk)
+        self.assertIsNone(jobs.claim_next_job("b"))
+
+
+class RunJobTests(JobTestCase):
+    def test_resumes_after_the_last_stored_page(self):
+        job = self.create_job(options={"rImages": 5}, count=3, completed_units=2)
+        JobPage.objects.bulk_create([JobPage(job=job, number=number, content=f"page {number}") for number in (1, 2)])
+        job = jobs.claim_next_job("runner")
+        seen = {}
+
+        def units(job, skip, counter):
+            seen["skip"], seen["budget"] = set(skip), counter.get_value()
+            for number in range(1, 5):
+                if number not in skip:
+                    yield number, f"page {number}", 1
+
+        job = self.run_with_units(job, units)
+        self.assertEqual(seen, {"skip": {1, 2}, "budget": 2})
+        self.assertEqual(job.status, Job.DONE)
+        self.assertEqual((job.completed_units, job.count), (4, 5))
+        self.assertEqual(list(job.pages.values_list("number", flat=True)), [1, 2, 3, 4])
+        self.assertFalse(job.document.storage.exists(job.document.name))
+
+    def test_runner_stops_when_another_takes_the_job_over(self):
+        self.create_job()
+        job = jobs.claim_next_job("runner")
+
+        def units(job, skip, counter):
+            yield 1, "page 1", 0
+            Job.objects.filter(pk=job.pk).update(locked_by="other", heartbeat_at=timezone.now())
+            yield 2, "page 2", 0
+
+        job = self.run_with_units(job, units)
+        self.assertEqual((job.status, job.locked_by), (Job.RUNNING, "other"))
+        self.assertEqual(list(job.pages.values_list("number", flat=True)), [1])
+        self.assertTrue(job.document.storage.exists(job.document.name))
+
+    def test_failed_job_removes_its_upload(self):
+        self.create_job()
+        job = jobs.claim_next_job("runner")
+
+        def units(job, skip, counter):
+            yield 1, "page 1", 0
+            raise RuntimeError("conversion failed")
+
+        job = self.run_with_units(job, units)
+        self.assertEqual((job.status, job.error, job.locked_by), (Job.FAILED, "conversion failed", ""))
+        self.assertFalse(job.document.storage.exists(job.document.name))
+
+    def test_lease_is_renewed_while_a_page_is_slow(self):
+        self.create_job()
+        job = jobs.claim_next_job("runner")
+        stolen = []
+
+        def units(job, skip, counter):
+            # Longer than the lease, with no page stored in between
+            time.sleep(0.5)
+            stolen.append(jobs.claim_next_job("other"))
+            yield 1, "page 1", 0
+
+        with mock.patch.object(jobs, "JOB_LEASE_SECONDS", 0.3):
+            job = self.run_with_units(job, units)
+        self.assertEqual(stolen, [None])
+        self.assertEqual(job.status, Job.DONE)
@@ -0,0 +1,77 @@
+import asyncio
+from unittest import mock
+
+from asgiref.sync import iscoroutinefunction
+from django.core.handlers.base import BaseHandler
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, override_settings
+from django.urls import path
+
+from api import metrics
+from api.description_cache import description_cache
+from api.office import office_pool
+from api.result_cache import document_cache
+
+
+class StatsGaugeTests(SimpleTestCase):
+    def test_cache_and_office_stats_are_exported(self):
+        rendered = metrics.render()
+        for cache, stats in (("description", description_cache.stats()), ("document", document_cache.stats())):
+            for name in stats:
+                self.assertIn(f'scribe_cache_stats{{cache="{cache}",stat="{name}"}}', rendered)
+        for name in office_pool.stats.snapshot():
+            self.assertIn(f'scribe_office_stats{{stat="{name}"}}', rendered)
+
+    def test_stats_are_read_at_scrape_time(self):
+        gauge = metrics.Gauge("scribe_test_stats", "Test stats.", ["stat"])
+        self.addCleanup(metrics.REGISTRY.remove, gauge)
+        stats = {"hits": 1}
+        metrics.track_stats(gauge, lambda: dict(stats))
+        stats["hits"] = 5
+        self.assertIn('scribe_test_stats{stat="hits"} 5', metrics.render())
+
+
+async def async_view(request):
+    with metrics.stage("async-work"):
+        await asyncio.sleep(0)
+    return HttpResponse("done")
+
+
+async def async_stream_view(request):
+    async def chunks():
+        for number in range(3):
+            with metrics.stage("async-chunk"):
+                await asyncio.sleep(0)
+            yield f"{number}".encode()
+
+    return StreamingHttpResponse(chunks())
+
+
+urlpatterns = [
+    path("async-view/", async_view, name="async_view"),
+    path("async-stream/", async_stream_view, name="async_stream"),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncMiddlewareTests(SimpleTestCase):
+    @override_settings(DEBUG=True)
+    def test_async_chain_is_not_adapted(self):
+        handler = BaseHandler()
+        with self.assertNoLogs("django.request", "DEBUG"):
+            handler.load_middleware(is_async=True)
+        self.assertTrue(iscoroutinefunction(handler._middleware_chain))
+
+    async def test_async_view_is_traced(self):
+        response = await self.async_client.get("/async-view/")
+        self.assertEqual(response.content, b"done")
+        self.assertIn("async-work;dur=", response["Server-Timing"])
+
+    async def test_async_stream_is_traced_until_exhausted(self):
+        with mock.patch.object(metrics, "finish_request") as finish_request:
+            response = await self.async_client.get("/async-stream/")
+            body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body, b"012")
+        finish_request.assert_called_once()
+        trace = finish_request.call_args.args[1]
+        self.assertEqual(trace.totals()["async-chunk"][1], 3)
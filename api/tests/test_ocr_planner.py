@@ -0,0 +1,82 @@
+import io
+from unittest import mock
+
+from django.test import SimpleTestCase
+from PIL import Image, ImageDraw
+
+from api import ocr_planner
+from api.ocr_planner import OcrStats, needs_page_ocr, plan_page, skip_reason
+
+
+def encode(image):
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+def text_image(size=(600, 200)):
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    for y in range(10, size[1] - 20, 20):
+        draw.text((10, y), "Total amount due 1,234.56 before the end of the month", fill=0)
+    return encode(image)
+
+
+def photo(size=(400, 300)):
+    # A smooth gradient: no flat background and no sharp edges
+    return encode(Image.linear_gradient("L").resize(size).convert("RGB"))
+
+
+class SkipReasonTests(SimpleTestCase):
+    def test_text_is_ocred(self):
+        self.assertIsNone(skip_reason(text_image()))
+
+    def test_small_images(self):
+        self.assertEqual(skip_reason(encode(Image.new("RGB", (16, 16), "black"))), "too_small")
+        # A rule: long but too thin
+        self.assertEqual(skip_reason(encode(Image.new("RGB", (800, 4), "black"))), "too_small")
+        self.assertEqual(skip_reason(encode(Image.new("RGB", (60, 60), "black"))), "too_small")
+
+    def test_images_without_text(self):
+        self.assertEqual(skip_reason(photo()), "no_text")
+        self.assertEqual(skip_reason(encode(Image.new("RGB", (300, 300), "white"))), "no_text")
+
+    def test_undecodable_images_are_left_to_tesseract(self):
+        self.assertIsNone(skip_reason(b"not an image"))
+
+
+class PlanPageTests(SimpleTestCase):
+    def test_pages_without_a_text_layer(self):
+        self.assertTrue(needs_page_ocr(""))
+        self.assertTrue(needs_page_ocr("  12 \n 3 "))
+        self.assertFalse(needs_page_ocr("A page with a real text layer"))
+
+    def test_images_are_planned_one_by_one(self):
+        images = [(0, {"image": text_image()}), (2, {"image": photo()})]
+        self.assertEqual(plan_page({"page_number": 1}, images), (None, {0: None, 2: "no_text"}))
+
+    def test_rendered_page_covers_its_images(self):
+        page = {"page_number": 1, "page_image": b"rendered"}
+        self.assertEqual(plan_page(page, [(0, {"image": text_image()})]), (b"rendered", {0: "page_ocr"}))
+
+    def test_planner_disabled(self):
+        page = {"page_number": 1, "page_image": b"rendered"}
+        images = [(0, {"image": photo()}), (1, {"image": encode(Image.new("RGB", (8, 8)))})]
+        with mock.patch.object(ocr_planner, "OCR_PLANNER", False):
+            self.assertFalse(needs_page_ocr(""))
+            self.assertEqual(plan_page(page, images), (None, {0: None, 1: None}))
+
+    def test_stats(self):
+        stats = OcrStats()
+        stats.record(2, None, {0: None, 1: "no_text", 2: "too_small"})
+        stats.record(1, b"rendered", {0: "page_ocr"})
+        self.assertEqual(stats.report(), {
+            "pages_ocred": 1,
+            "images_ocred": 1,
+            "skipped_counts": {"no_text": 1, "too_small": 1, "page_ocr": 1},
+            "skipped": [
+                {"page": 1, "image": 0, "reason": "page_ocr"},
+                {"page": 2, "image": 1, "reason": "no_text"},
+                {"page": 2, "image": 2, "reason": "too_small"},
+            ],
+        })
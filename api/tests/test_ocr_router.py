@@ -0,0 +1,144 @@
+import io
+import time
+from concurrent.futures import Future
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+from PIL import Image
+
+from api import deadlines, ocr_router, upstream
+
+
+def image_bytes(width=200, height=100, image_format="PNG"):
+    buffered = io.BytesIO()
+    Image.new("RGB", (width, height), (255, 255, 255)).save(buffered, format=image_format)
+    return buffered.getvalue()
+
+
+def response(status_code=200, headers=None, body=None):
+    reply = mock.Mock(status_code=status_code, headers=headers or {})
+    reply.json.return_value = body
+    return reply
+
+
+def accepted():
+    return response(202, {"Operation-Location": "https://azure.test/operations/1"})
+
+
+def succeeded(*lines):
+    return response(body={
+        "status": "succeeded",
+        "analyzeResult": {"readResults": [{"lines": [{"text": line} for line in lines]}]},
+    })
+
+
+def local_result(image, lang):
+    future = Future()
+    future.set_result("local text")
+    return future
+
+
+class RouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.azure = ocr_router.AzureReadBackend("https://azure.test/", "key", 2, 0.01, 5.0)
+        self.addCleanup(self.azure.shutdown)
+        self.router = ocr_router.OcrRouter("auto", ["ara"], self.azure, 30.0)
+        patcher = mock.patch.object(ocr_router.ocr_engine, "submit", side_effect=local_result)
+        self.local = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def submit(self, post, get=None, deadline=None):
+        with mock.patch.object(upstream, "post", **post), mock.patch.object(upstream, "get", **(get or {})), \
+                deadlines.applied(deadline):
+            future = self.router.submit(image_bytes(), "ara")
+            try:
+                return future.result(timeout=5)
+            finally:
+                # Let the poller thread finish before the mocks go away
+                while self.azure.poller is not None:
+                    time.sleep(0.01)
+
+
+class RouteTests(RouterTestCase):
+    def test_language_picks_the_backend(self):
+        image = image_bytes()
+        self.assertEqual(self.router.route(image, "ara"), "azure")
+        self.assertEqual(self.router.route(image, "ara+eng"), "azure")
+        self.assertEqual(self.router.route(image, "eng"), "local")
+        self.router.backend = "azure"
+        self.assertEqual(self.router.route(image, "eng"), "azure")
+        self.router.backend = "local"
+        self.assertEqual(self.router.route(image, "ara"), "local")
+
+    def test_no_key_keeps_ocr_local(self):
+        self.azure.subscription_key = ""
+        self.assertEqual(self.router.route(image_bytes(), "ara"), "local")
+
+    def test_images_azure_rejects_stay_local(self):
+        for image in (image_bytes(40, 40), image_bytes(image_format="GIF"), b"not an image"):
+            with self.subTest(image=image[:8]):
+                self.assertEqual(self.router.route(image, "ara"), "local")
+        with mock.patch.object(ocr_router, "AZURE_READ_MAX_BYTES", 100):
+            self.assertEqual(self.router.route(image_bytes(), "ara"), "local")
+
+
+class ReadTests(RouterTestCase):
+    def test_submit_and_poll(self):
+        get = {"side_effect": [response(body={"status": "running"}), succeeded("first line", "second line")]}
+        with mock.patch.object(ocr_router.metrics.OCR_FALLBACKS, "inc") as fallbacks:
+            text = self.submit({"return_value": accepted()}, get)
+        self.assertEqual(text, "first line\nsecond line")
+        fallbacks.assert_not_called()
+        self.local.assert_not_called()
+
+    def test_language_is_passed_on(self):
+        with mock.patch.object(upstream, "post", return_value=accepted()) as post, \
+                mock.patch.object(upstream, "get", return_value=succeeded("text")):
+            self.router.submit(image_bytes(), "ara").result(timeout=5)
+            while self.azure.poller is not None:
+                time.sleep(0.01)
+        self.assertEqual(post.call_args.kwargs["params"], {"language": "ar"})
+        self.assertEqual(post.call_args.kwargs["headers"]["Ocp-Apim-Subscription-Key"], "key")
+
+    def test_failures_fall_back_to_local_ocr(self):
+        for post, get in (
+            ({"side_effect": requests.ConnectionError("down")}, None),
+            ({"return_value": response(500)}, None),
+            ({"return_value": accepted()}, {"return_value": response(body={"status": "failed"})}),
+        ):
+            with self.subTest(post=post, get=get):
+                self.router.azure_resumes_at = 0.0
+                with self.assertLogs("api.ocr_router", "WARNING"):
+                    self.assertEqual(self.submit(post, get), "local text")
+                self.assertEqual(self.router.route(image_bytes(), "ara"), "local")
+
+    def test_slow_operation_falls_back_to_local_ocr(self):
+        self.azure.timeout = 0.0
+        with self.assertLogs("api.ocr_router", "WARNING"):
+            text = self.submit({"return_value": accepted()}, {"return_value": response(body={"status": "running"})})
+        self.assertEqual(text, "local text")
+
+    def test_cooldown_window(self):
+        with self.assertLogs("api.ocr_router", "WARNING"):
+            self.submit({"side_effect": requests.ConnectionError("down")})
+        now = time.monotonic()
+        with mock.patch.object(ocr_router.time, "monotonic", return_value=now + 29):
+            self.assertEqual(self.router.route(image_bytes(), "ara"), "local")
+        with mock.patch.object(ocr_router.time, "monotonic", return_value=now + 31):
+            self.assertEqual(self.router.route(image_bytes(), "ara"), "azure")
+
+
+class DeadlineTests(RouterTestCase):
+    def test_expired_deadline_neither_falls_back_nor_cools_down(self):
+        for post in (
+            {"side_effect": deadlines.DeadlineExceeded()},
+            {"side_effect": lambda *args, **kwargs: time.sleep(0.05) or accepted()},
+        ):
+            with self.subTest(post=post):
+                deadline = deadlines.Deadline(0.02)
+                get = {"side_effect": requests.ReadTimeout("clamped to the deadline")}
+                with self.assertRaises(deadlines.DeadlineExceeded):
+                    self.submit(post, get, deadline)
+                self.local.assert_not_called()
+                self.assertEqual(self.router.route(image_bytes(), "ara"), "azure")
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from api import office
+
+
+class ForkedWorkerTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, True)
+        patcher = mock.patch.object(office, "OFFICE_PROFILE_ROOT", root)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_profile_and_pipe_follow_the_process(self):
+        instance = office.OfficeInstance(0)
+        with mock.patch.object(office.os, "getpid", return_value=100):
+            instance.bind()
+            os.makedirs(instance.profile_dir)
+            parent_profile, parent_pipe = instance.profile_dir, instance.pipe_name
+            instance.process = mock.Mock()
+
+        with mock.patch.object(office.os, "getpid", return_value=200):
+            # The worker neither kills the parent's soffice nor deletes its profile
+            instance.stop()
+            instance.remove_profile()
+            instance.process.poll.assert_not_called()
+            self.assertTrue(os.path.isdir(parent_profile))
+
+            instance.bind()
+            self.assertIsNone(instance.process)
+            self.assertNotEqual(instance.profile_dir, parent_profile)
+            self.assertNotEqual(instance.pipe_name, parent_pipe)
+            self.assertIn("200-0", instance.profile_dir)
+
+    def test_pool_created_before_a_fork_converts_with_the_worker_profile(self):
+        with mock.patch.object(office.os, "getpid", return_value=100):
+            pool = office.OfficePool(1)
+
+        process = mock.Mock(returncode=0)
+        with mock.patch.object(office.os, "getpid", return_value=200), \
+                mock.patch.object(office, "load_uno", return_value=None), \
+                mock.patch.object(office.subprocess, "Popen", return_value=process) as popen, \
+                self.assertLogs("api.office", "WARNING"):
+            with self.assertRaises(RuntimeError):
+                # Nothing writes the .pptx, the command line is what matters here
+                pool.convert(os.path.join(tempfile.gettempdir(), "deck.ppt"))
+            pool.shutdown()
+
+        command = popen.call_args.args[0]
+        profile = os.path.join(office.OFFICE_PROFILE_ROOT, "200-0")
+        self.assertIn(f"-env:UserInstallation={office.pathlib.Path(profile).as_uri()}", command)
+        self.assertFalse(os.path.exists(profile))
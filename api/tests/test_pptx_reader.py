@@ -0,0 +1,95 @@
+import io
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase
+from PIL import Image
+from pptx import Presentation
+from pptx.util import Inches
+
+from api import pptx_reader
+from api.ranges import PageRange
+from api.views import extract_content_from_slide
+
+
+def png(color):
+    buffered = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffered, format="PNG")
+    return io.BytesIO(buffered.getvalue())
+
+
+def build_deck(path):
+    presentation = Presentation()
+    title_layout, blank_layout = presentation.slide_layouts[1], presentation.slide_layouts[6]
+
+    slide = presentation.slides.add_slide(title_layout)
+    slide.shapes.title.text = "Quarterly report"
+    body = slide.placeholders[1].text_frame
+    body.text = "First point"
+    body.add_paragraph().text = "Second point"
+    slide.shapes.add_picture(png((200, 30, 30)), Inches(1), Inches(4))
+
+    slide = presentation.slides.add_slide(blank_layout)
+    box = slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1)).text_frame
+    box.text = "Line one\vstill line one"
+    box.add_paragraph().text = "   "
+    table = slide.shapes.add_table(2, 2, Inches(1), Inches(3), Inches(4), Inches(1)).table
+    table.cell(0, 0).text = "Region"
+    table.cell(1, 1).text = "42"
+    # The same picture again, and a second one
+    slide.shapes.add_picture(png((200, 30, 30)), Inches(5), Inches(1))
+    slide.shapes.add_picture(png((30, 200, 30)), Inches(5), Inches(3))
+
+    presentation.slides.add_slide(blank_layout)
+
+    slide = presentation.slides.add_slide(title_layout)
+    slide.shapes.title.text = "Appendix"
+
+    # Move the last slide to the front: order comes from sldIdLst, not part names
+    slide_ids = presentation.slides._sldIdLst
+    slide_ids.insert(0, slide_ids[-1])
+    presentation.save(path)
+
+
+class ParityTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        cls.path = os.path.join(cls.directory, "deck.pptx")
+        build_deck(cls.path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def python_pptx(self, load_images=True):
+        slides = Presentation(self.path).slides
+        return [extract_content_from_slide(slide, index, load_images) for index, slide in enumerate(slides)]
+
+    def test_same_text_tables_and_images_as_python_pptx(self):
+        slides, selection = pptx_reader.read_slides(self.path)
+        self.assertIsNone(selection)
+        self.assertEqual(slides, self.python_pptx())
+        self.assertEqual(slides[0]["texts"], "Appendix\n")
+        self.assertEqual(len(slides[2]["images"]), 2)
+        self.assertEqual(slides[1]["images"][0]["key"], slides[2]["images"][0]["key"])
+
+    def test_without_images(self):
+        slides, _ = pptx_reader.read_slides(self.path, load_images=False)
+        self.assertEqual(slides, self.python_pptx(load_images=False))
+        self.assertTrue(all(slide["images"] == [] for slide in slides))
+
+    def test_selected_slides(self):
+        slides, selection = pptx_reader.read_slides(self.path, PageRange("file", "slides", [(1, 2)], 0))
+        self.assertEqual(selection.numbers, [1, 2])
+        self.assertEqual(slides, self.python_pptx()[1:3])
+
+    def test_unreadable_package(self):
+        not_a_deck = os.path.join(self.directory, "broken.pptx")
+        with open(not_a_deck, "wb") as file:
+            file.write(b"not a zip")
+        with self.assertRaises(pptx_reader.PackageError):
+            pptx_reader.read_slides(not_a_deck)
@@ -0,0 +1,98 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from api import models, quota
+
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class QuotaTestCase(TestCase):
+    def setUp(self):
+        self.clock = Clock()
+        patcher = mock.patch.object(quota.time, "time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tokens(self, bucket):
+        return models.QuotaBucket.objects.get(key=bucket.key).tokens
+
+
+class TokenBucketTests(QuotaTestCase):
+    def test_reserve_fails_without_enough_tokens(self):
+        bucket = quota.TokenBucket("test", 3, 3600)
+        bucket.ensure()
+        self.assertTrue(bucket.reserve(2))
+        self.assertFalse(bucket.reserve(2))
+        self.assertEqual(self.tokens(bucket), 1)
+        self.assertTrue(bucket.reserve())
+        self.assertFalse(bucket.reserve())
+        self.assertEqual(self.tokens(bucket), 0)
+
+    def test_tokens_refill_up_to_the_burst(self):
+        bucket = quota.TokenBucket("test", 5, 3600)
+        bucket.ensure()
+        self.assertTrue(bucket.reserve(5))
+        self.clock.now += 2
+        self.assertEqual(bucket.remaining(), 2)
+        self.assertTrue(bucket.reserve(2))
+        self.assertFalse(bucket.reserve())
+
+        self.clock.now += 3600
+        self.assertEqual(bucket.remaining(), 5)
+        self.assertTrue(bucket.reserve())
+        self.assertEqual(self.tokens(bucket), 4)
+
+    def test_refund_is_capped_at_the_burst(self):
+        bucket = quota.TokenBucket("test", 2, 3600)
+        bucket.ensure()
+        self.assertTrue(bucket.reserve())
+        bucket.refund()
+        bucket.refund()
+        self.assertEqual(self.tokens(bucket), 2)
+
+    def test_missing_row_is_created_full(self):
+        bucket = quota.TokenBucket("test", 4, 3600)
+        self.assertEqual(bucket.remaining(), 4)
+        self.assertEqual(self.tokens(bucket), 4)
+
+    def test_zero_burst_is_unlimited(self):
+        bucket = quota.TokenBucket("test", 0, 0)
+        self.assertTrue(all(bucket.reserve() for _ in range(100)))
+        self.assertIsNone(bucket.remaining())
+        self.assertFalse(models.QuotaBucket.objects.exists())
+
+
+class ReserveAllTests(QuotaTestCase):
+    def test_takes_from_every_bucket(self):
+        buckets = [quota.TokenBucket("user", 3, 0), quota.TokenBucket("global", 3, 0)]
+        self.assertTrue(quota.reserve_all(buckets, 2))
+        self.assertEqual([self.tokens(bucket) for bucket in buckets], [1, 1])
+
+    def test_rolls_back_when_a_later_bucket_is_empty(self):
+        first, second = quota.TokenBucket("user", 3, 0), quota.TokenBucket("global", 1, 0)
+        self.assertTrue(quota.reserve_all([first, second]))
+        self.assertFalse(quota.reserve_all([first, second]))
+        self.assertEqual(self.tokens(first), 2)
+        self.assertEqual(self.tokens(second), 0)
+
+
+class RequestBudgetTests(QuotaTestCase):
+    def test_denied_image_keeps_the_request_cap(self):
+        with mock.patch.object(quota, "QUOTA_USER_BURST", 1):
+            budget = quota.RequestBudget("alice", 3)
+        self.assertTrue(budget.decrement())
+        self.assertFalse(budget.decrement())
+        self.assertEqual(budget.get_value(), 2)
+        self.assertTrue(budget.denied)
+        self.assertEqual(budget.report(), {"remaining": 0, "burst": 1})
+
+        budget.refund()
+        self.assertEqual(budget.get_value(), 3)
+        self.assertEqual(budget.report(), {"remaining": 1, "burst": 1})
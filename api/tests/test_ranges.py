@@ -0,0 +1,87 @@
+from unittest import mock
+
+from django.core import signing
+from django.test import SimpleTestCase
+
+from api import ranges
+from api.ranges import PageRange, RangeError, format_ranges, parse_max_pages, parse_ranges, requested_range
+
+
+class ParseRangesTests(SimpleTestCase):
+    def test_specs(self):
+        self.assertEqual(parse_ranges("1-3,7,10-"), [(1, 3), (7, 7), (10, None)])
+        self.assertEqual(parse_ranges(" -5 , 8 ,,"), [(None, 5), (8, 8)])
+        self.assertEqual(parse_ranges(""), [])
+
+    def test_invalid_specs(self):
+        for spec in ("a", "1-b", "5-2", "1--3", "1.5"):
+            with self.subTest(spec=spec), self.assertRaises(RangeError):
+                parse_ranges(spec)
+
+    def test_format_ranges(self):
+        self.assertEqual(format_ranges([1, 2, 3, 7, 9, 10]), "1-3,7,9-10")
+        self.assertEqual(format_ranges([]), "")
+
+    def test_max_pages(self):
+        self.assertEqual(parse_max_pages(None), 0)
+        self.assertEqual(parse_max_pages(""), 0)
+        self.assertEqual(parse_max_pages("12"), 12)
+        for value in ("0", "-3", "many", "2.5"):
+            with self.subTest(value=value), self.assertRaises(RangeError):
+                parse_max_pages(value)
+
+
+class SelectTests(SimpleTestCase):
+    def test_ranges_are_clipped_to_the_document(self):
+        selection = PageRange("file", "pages", [(None, 2), (4, 6), (9, None)], 0).select(1, 10)
+        self.assertEqual(selection.numbers, [1, 2, 4, 5, 6, 9, 10])
+        self.assertIsNone(selection.continuation)
+        self.assertEqual(selection.report(), {"selected": "1-2,4-6,9-10", "total": 10, "continuation": None})
+
+    def test_selection_outside_the_document(self):
+        with self.assertRaises(RangeError):
+            PageRange("file", "pages", [(20, 30)], 0).select(1, 10)
+
+    def test_slides_numbered_from_zero(self):
+        self.assertEqual(PageRange("file", "slides", [], 2).select(0, 4).numbers, [0, 1])
+
+    def test_server_cap_applies_below_the_request_cap(self):
+        with mock.patch.object(ranges, "MAX_PAGES_PER_REQUEST", 3):
+            self.assertEqual(PageRange("file", "pages", [], 0).limit(), 3)
+            self.assertEqual(PageRange("file", "pages", [], 2).limit(), 2)
+            self.assertEqual(PageRange("file", "pages", [], 5).select(1, 10).numbers, [1, 2, 3])
+        self.assertIsNone(PageRange("file", "pages", [], 0).limit())
+
+
+class ContinuationTests(SimpleTestCase):
+    def test_tokens_walk_through_the_selection(self):
+        chunks = []
+        data = {"pages": "2-5,8-", "max_pages": "3"}
+        while True:
+            selection = requested_range(data, "pages", "file", "pages").select(1, 12)
+            chunks.append(selection.numbers)
+            if selection.continuation is None:
+                break
+            data = {"continuation": selection.continuation}
+        self.assertEqual(chunks, [[2, 3, 4], [5, 8, 9], [10, 11, 12]])
+
+    def test_token_is_bound_to_the_file_and_kind(self):
+        token = PageRange("file", "pages", [], 1).select(1, 3).continuation
+        self.assertEqual(requested_range({"continuation": token}, "pages", "file", "pages").ranges, [(2, 3)])
+        for file_hash, kind in (("other", "pages"), ("file", "slides")):
+            with self.subTest(file_hash=file_hash, kind=kind), self.assertRaises(RangeError):
+                requested_range({"continuation": token}, "pages", file_hash, kind)
+
+    def test_forged_and_expired_tokens_are_rejected(self):
+        token = PageRange("file", "pages", [], 1).select(1, 3).continuation
+        forged = signing.dumps({"file": "file", "kind": "pages", "ranges": [[1, None]], "max": 0}, salt="other")
+        for bad in (token[:-2] + "xx", forged):
+            with self.subTest(token=bad), self.assertRaises(RangeError):
+                requested_range({"continuation": bad}, "pages", "file", "pages")
+        with mock.patch.object(ranges, "CONTINUATION_MAX_AGE", -1), self.assertRaises(RangeError):
+            requested_range({"continuation": token}, "pages", "file", "pages")
+
+    def test_whole_document_needs_no_range(self):
+        self.assertIsNone(requested_range({}, "pages", "file", "pages"))
+        with mock.patch.object(ranges, "MAX_PAGES_PER_REQUEST", 5):
+            self.assertIsNotNone(requested_range({}, "pages", "file", "pages"))
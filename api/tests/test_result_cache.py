@@ -0,0 +1,150 @@
+import datetime
+from unittest import mock
+
+import fitz
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from api import models, views
+from api.ranges import PageRange
+from api.result_cache import DocumentResultCache
+from api.views import document_cache_key
+
+
+def pdf(pages=3):
+    document = fitz.open()
+    for number in range(1, pages + 1):
+        document.new_page().insert_text((72, 72), f"page {number}")
+    return document.tobytes()
+
+
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        self.cache = DocumentResultCache(ttl=60, max_rows=2)
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("key"))
+        self.cache.set("key", "file", "pdf", {"pages": [{"page_number": 1, "text": "é"}]})
+        self.assertEqual(self.cache.get("key"), {"pages": [{"page_number": 1, "text": "é"}]})
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1, "hit_rate": 0.5})
+
+    def test_expired_rows_miss(self):
+        self.cache.set("key", "file", "pdf", {"pages": []})
+        models.DocumentResult.objects.update(created_at=timezone.now() - datetime.timedelta(seconds=61))
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_invalidate(self):
+        for key, file_hash, kind in (("a", "one", "pdf"), ("b", "one", "pptx"), ("c", "two", "pdf")):
+            self.cache.set(key, file_hash, kind, {})
+        self.assertEqual(self.cache.invalidate(file_hash="one", kind="pptx"), 1)
+        self.assertEqual(self.cache.invalidate(file_hash="one"), 1)
+        self.assertEqual(self.cache.get("c"), {})
+        self.assertEqual(self.cache.invalidate(), 1)
+        self.assertFalse(models.DocumentResult.objects.exists())
+
+    def test_eviction_keeps_the_most_recently_used_rows(self):
+        for key in ("a", "b", "c"):
+            self.cache.set(key, "file", "pdf", {})
+        now = timezone.now()
+        models.DocumentResult.objects.filter(key="a").update(last_used_at=now + datetime.timedelta(seconds=5))
+        models.DocumentResult.objects.filter(key="b").update(last_used_at=now - datetime.timedelta(seconds=5))
+        self.cache.evict()
+        self.assertEqual(sorted(models.DocumentResult.objects.values_list("key", flat=True)), ["a", "c"])
+
+    def test_invalidate_command(self):
+        self.cache.set("a", "one", "pdf", {})
+        self.cache.set("b", "two", "pdf", {})
+        with self.assertRaises(CommandError):
+            call_command("invalidate_document_cache")
+        call_command("invalidate_document_cache", hash="one", stdout=mock.Mock())
+        self.assertEqual(list(models.DocumentResult.objects.values_list("key", flat=True)), ["b"])
+
+
+class CacheKeyTests(TestCase):
+    def key(self, **changes):
+        arguments = {
+            "file_hash": "file", "kind": "pdf", "ocr_option": True, "image_description_option": True,
+            "language": "English", "remaining_images": 25, "page_range": None, **changes,
+        }
+        return document_cache_key(**arguments)
+
+    def test_options_that_change_the_output_change_the_key(self):
+        keys = [
+            self.key(),
+            self.key(file_hash="other"),
+            self.key(kind="pptx"),
+            self.key(language="Arabic"),
+            self.key(ocr_option=False),
+            self.key(image_description_option=False),
+            self.key(remaining_images=5),
+            self.key(page_range=PageRange("file", "pages", [(1, 2)], 0)),
+            self.key(page_range=PageRange("file", "pages", [(1, 2)], 1)),
+            self.key(page_range=PageRange("file", "pages", [], 0)),
+        ]
+        self.assertEqual(len(set(keys)), len(keys))
+        with mock.patch.object(views, "OPENAI_MODEL", "another-model"):
+            self.assertNotIn(self.key(), keys)
+
+    def test_options_that_cannot_change_the_output_do_not(self):
+        plain = self.key(ocr_option=False, image_description_option=False)
+        self.assertEqual(plain, self.key(ocr_option=False, image_description_option=False, language="Arabic"))
+        self.assertEqual(plain, self.key(ocr_option=False, image_description_option=False, remaining_images=5))
+        self.assertEqual(self.key(image_description_option=False),
+                         self.key(image_description_option=False, remaining_images=5))
+
+
+class CachedExtractionTests(TestCase):
+    def setUp(self):
+        self.document = pdf()
+        self.runs = 0
+        self.cut_short = None
+
+    def iter_processed_pages(self, pdf_path, ocr_option, image_description_option, language, counter,
+                             payload_stats=None, ocr_stats=None, pages=None, deadline=None):
+        self.runs += 1
+        if self.cut_short == "deadline":
+            deadline.skip(3)
+        elif self.cut_short == "quota":
+            counter.denied = True
+        for number in pages or (1, 2, 3):
+            yield number, f"Page {number}:\n{language}\n", 0
+
+    def extract(self, **data):
+        upload = SimpleUploadedFile("doc.pdf", self.document, content_type="application/pdf")
+        with mock.patch.object(views, "iter_processed_pages", self.iter_processed_pages):
+            response = self.client.post("/extract_text_from_pdf/", {"pdf_file": upload, "ocr": "true", **data})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_repeated_request_is_served_from_the_cache(self):
+        first = self.extract()
+        second = self.extract()
+        self.assertEqual(self.runs, 1)
+        self.assertTrue(second["cached"])
+        self.assertEqual(second["text_content"], first["text_content"])
+
+        self.extract(refresh="true")
+        self.assertEqual(self.runs, 2)
+
+    def test_other_options_miss(self):
+        self.extract()
+        self.assertEqual(self.extract(language="Arabic")["text_content"], "".join(
+            f"Page {number}:\nArabic\n" for number in (1, 2, 3)
+        ))
+        self.extract(image_description="true")
+        ranged = self.extract(pages="2-3")
+        self.assertEqual(self.runs, 4)
+        self.assertEqual(ranged["text_content"], "Page 2:\nEnglish\nPage 3:\nEnglish\n")
+        self.assertTrue(self.extract(pages="2-3")["cached"])
+
+    def test_partial_results_are_not_cached(self):
+        for reason in ("deadline", "quota"):
+            with self.subTest(reason=reason):
+                self.cut_short = reason
+                self.extract()
+                self.cut_short = None
+                self.assertNotIn("cached", self.extract())
+                models.DocumentResult.objects.all().delete()
+        self.assertEqual(self.runs, 4)
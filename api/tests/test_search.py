@@ -0,0 +1,24 @@
+from django.test import TestCase
+
+from api import models, search
+
+
+class SearchLimitTests(TestCase):
+    def setUp(self):
+        history = models.History.objects.create(
+            user="alice", used_file="history/report.pdf",
+            response="Page 1:\nalpha beta\n\nPage 2:\nalpha gamma\n\nPage 3:\nalpha delta\n",
+        )
+        search.index_history(history)
+
+    def search(self, limit):
+        return self.client.get("/history/alice/search/", {"q": "alpha", "limit": limit})
+
+    def test_limit_must_be_an_integer(self):
+        self.assertEqual(self.search("abc").status_code, 400)
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.search("-1").json()["results"]), 1)
+        self.assertEqual(len(self.search("0").json()["results"]), 1)
+        self.assertEqual(len(self.search("2").json()["results"]), 2)
+        self.assertEqual(len(self.search(str(search.SEARCH_MAX_RESULTS + 100)).json()["results"]), 3)
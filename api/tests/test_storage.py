@@ -0,0 +1,93 @@
+from unittest import mock
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from api import models, storage
+
+
+def pages(count, words=40):
+    return "".join(f"Page {number}:\n" + f"words on page {number} " * words + "\n\n" for number in range(1, count + 1))
+
+
+class PackTests(SimpleTestCase):
+    def test_round_trip(self):
+        for text in ("", "plain text", "prefix\n" + pages(3), '[{"slide_number": 1}, {"slide_number": 2}]',
+                     "x" * (storage.SEGMENT_CHARS * 2 + 5), "ünïcödé " * 100):
+            with self.subTest(text=text[:20]):
+                data = storage.pack(text)
+                self.assertTrue(storage.is_packed(data))
+                self.assertEqual(storage.unpack(data), text)
+
+    def test_segments_decode_one_at_a_time(self):
+        text = pages(600)
+        data = storage.pack(text)
+        index = storage.segment_index(data)
+        self.assertGreater(len(storage.read_header(data)[0]["blocks"]), 1)
+        self.assertEqual([entry["label"] for entry in index], list(range(1, 601)))
+        segments = [storage.unpack_segment(data, entry["index"]) for entry in index]
+        self.assertEqual("".join(segments), text)
+        self.assertEqual([len(segment) for segment in segments], [entry["size"] for entry in index])
+        for bad_index in (-1, len(index)):
+            with self.assertRaises(IndexError):
+                storage.unpack_segment(data, bad_index)
+
+    def test_unpacked_rows_are_read_as_text(self):
+        self.assertEqual(storage.unpack(b"stored before compression"), "stored before compression")
+        self.assertEqual(storage.segment_index(b"abc"), [{"index": 0, "label": None, "size": 3}])
+        self.assertEqual(storage.unpack_segment(b"abc", 0), "abc")
+
+    def test_codec_is_stored_with_the_body(self):
+        with mock.patch.object(storage, "HISTORY_COMPRESSION", "zlib"):
+            data = storage.pack(pages(2))
+        self.assertEqual(storage.read_header(data)[0]["codec"], "zlib")
+        with mock.patch.object(storage, "HISTORY_COMPRESSION", "zstd"):
+            self.assertEqual(storage.unpack(data), pages(2))
+
+
+class CompressedTextFieldTests(TestCase):
+    def test_model_round_trip(self):
+        text = pages(3)
+        history = models.History.objects.create(user="alice", used_file="history/report.pdf", response=text)
+        stored = models.History.objects.annotate(raw=storage.stored_bytes("response")).get(pk=history.pk).raw
+        self.assertTrue(storage.is_packed(stored))
+        self.assertLess(len(stored), len(text))
+        self.assertEqual(models.History.objects.get(pk=history.pk).response, text)
+
+
+class HistoryMigrationTests(TransactionTestCase):
+    before = [("api", "0005_history_user_created_index")]
+    after = [("api", "0007_history_search")]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        self.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_responses_are_compressed_and_restored(self):
+        text = pages(3)
+        History = self.migrate(self.before).get_model("api", "History")
+        pk = History.objects.create(user="alice", used_file="history/report.pdf", response=text).pk
+
+        History = self.migrate(self.after).get_model("api", "History")
+        history = History.objects.get(pk=pk)
+        self.assertEqual(history.response, text)
+        self.assertEqual(history.response_size, len(text))
+        self.assertEqual(history.response_preview, text[:200])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT response FROM api_history WHERE id = %s", [pk])
+            self.assertTrue(storage.is_packed(cursor.fetchone()[0]))
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'api_history_fts'")
+            self.assertIsNotNone(cursor.fetchone())
+
+        History = self.migrate(self.before).get_model("api", "History")
+        self.assertEqual(History.objects.get(pk=pk).response, text)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name = 'api_history_fts'")
+            self.assertIsNone(cursor.fetchone())
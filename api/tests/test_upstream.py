@@ -0,0 +1,136 @@
+import asyncio
+import collections
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import httpx
+import requests
+from django.test import SimpleTestCase
+from urllib3.exceptions import NewConnectionError, ReadTimeoutError
+
+from api import deadlines, upstream
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/busy answers 503 once, then 200; /slow answers after 0.3 seconds."""
+
+    def respond(self):
+        hits = self.server.hits
+        hits[self.command, self.path] += 1
+        if self.path == "/slow":
+            time.sleep(0.3)
+        status_code = 503 if self.path == "/busy" and hits[self.command, self.path] == 1 else 200
+        self.send_response(status_code)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    do_GET = do_POST = respond
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # The client gave up on a slow response
+        pass
+
+
+class RetryTests(SimpleTestCase):
+    def setUp(self):
+        self.server = StubServer(("127.0.0.1", 0), StubHandler)
+        self.server.hits = collections.Counter()
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+        with mock.patch.object(upstream, "UPSTREAM_BACKOFF_FACTOR", 0.0):
+            adapter = upstream.InstrumentedAdapter(max_retries=upstream.build_retry())
+        session = requests.Session()
+        session.mount("http://", adapter)
+        self.addCleanup(session.close)
+        patcher = mock.patch.object(upstream, "get_session", return_value=session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.server.server_address[1]}{path}"
+
+    def test_retryable_status_is_retried(self):
+        self.assertEqual(upstream.post(self.url("/busy")).status_code, 200)
+        self.assertEqual(self.server.hits["POST", "/busy"], 2)
+
+    def test_post_is_not_sent_again_after_a_read_timeout(self):
+        with self.assertRaises(requests.ReadTimeout):
+            upstream.post(self.url("/slow"), timeout=(1, 0.1))
+        self.assertEqual(self.server.hits["POST", "/slow"], 1)
+
+    def test_get_is_retried_after_a_read_timeout(self):
+        with self.assertRaises(requests.ConnectionError):
+            upstream.get(self.url("/slow"), timeout=(1, 0.1))
+        self.assertEqual(self.server.hits["GET", "/slow"], upstream.UPSTREAM_MAX_RETRIES + 1)
+
+    def test_connection_errors_are_retried_for_posts(self):
+        retry = upstream.build_retry()
+        error = NewConnectionError(None, "refused")
+        self.assertEqual(retry.increment("POST", "/", error=error).total, retry.total - 1)
+        with self.assertRaises(ReadTimeoutError):
+            retry.increment("POST", "/", error=ReadTimeoutError(None, "/", "timed out"))
+
+    def test_timeouts_are_clamped_to_the_deadline(self):
+        started = time.monotonic()
+        with deadlines.applied(deadlines.Deadline(0.1)), self.assertRaises(requests.ReadTimeout):
+            upstream.post(self.url("/slow"))
+        self.assertLess(time.monotonic() - started, 0.3)
+
+    def test_nothing_is_sent_after_the_deadline(self):
+        with deadlines.applied(deadlines.Deadline(0.0)), self.assertRaises(deadlines.DeadlineExceeded):
+            upstream.post(self.url("/busy"))
+        self.assertEqual(self.server.hits["POST", "/busy"], 0)
+
+    def test_retries_stop_at_the_deadline(self):
+        retry = upstream.build_retry()
+        self.assertFalse(retry.is_exhausted())
+        with deadlines.applied(deadlines.Deadline(0.0)):
+            self.assertTrue(retry.is_exhausted())
+
+
+class AsyncRetryTests(SimpleTestCase):
+    def post(self, errors):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) <= len(errors):
+                raise errors[len(calls) - 1]("failed", request=request)
+            return httpx.Response(200, json={})
+
+        async def run():
+            client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            try:
+                with mock.patch.object(upstream, "get_async_client", return_value=client):
+                    return await upstream.async_post("https://upstream.test/v1/chat/completions", json={})
+            finally:
+                await client.aclose()
+
+        with mock.patch.object(upstream, "UPSTREAM_BACKOFF_FACTOR", 0.0):
+            try:
+                return asyncio.run(run()), len(calls)
+            except httpx.TransportError as e:
+                return e, len(calls)
+
+    def test_connection_errors_are_retried(self):
+        response, calls = self.post([httpx.ConnectError, httpx.ConnectTimeout])
+        self.assertEqual((response.status_code, calls), (200, 3))
+
+    def test_post_is_not_sent_again_after_a_read_timeout(self):
+        for error in (httpx.ReadTimeout, httpx.RemoteProtocolError):
+            with self.subTest(error=error):
+                result, calls = self.post([error])
+                self.assertIsInstance(result, error)
+                self.assertEqual(calls, 1)
@@ -0,0 +1,217 @@
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit
+
+import requests
+from decouple import config
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from api import deadlines, metrics
+
+# Base URL for the OpenAI API, overridable so tests can point it at a local stub
+OPENAI_BASE_URL = config('OPENAI_BASE_URL', default='https://api.openai.com/v1')
+
+# Connection pool size, defaults to the ThreadPoolExecutor worker count used by the views
+UPSTREAM_POOL_SIZE = config('UPSTREAM_POOL_SIZE', default=min(32, (os.cpu_count() or 1) + 4), cast=int)
+
+# Timeouts in seconds
+UPSTREAM_CONNECT_TIMEOUT = config('UPSTREAM_CONNECT_TIMEOUT', default=5.0, cast=float)
+UPSTREAM_READ_TIMEOUT = config('UPSTREAM_READ_TIMEOUT', default=60.0, cast=float)
+
+# Retries on connection errors and retryable statuses, with jittered exponential backoff
+UPSTREAM_MAX_RETRIES = config('UPSTREAM_MAX_RETRIES', default=4, cast=int)
+UPSTREAM_BACKOFF_FACTOR = config('UPSTREAM_BACKOFF_FACTOR', default=0.5, cast=float)
+UPSTREAM_BACKOFF_MAX = config('UPSTREAM_BACKOFF_MAX', default=30.0, cast=float)
+
+# Connection limit for the async client, shared by every in-flight request of a worker process
+UPSTREAM_ASYNC_POOL_SIZE = config('UPSTREAM_ASYNC_POOL_SIZE', default=100, cast=int)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+TIMEOUT = (UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT)
+
+_lock = threading.Lock()
+_adapter = None
+_session = None
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class DeadlineRetry(Retry):
+    """Retries connection errors and RETRY_STATUSES for every method, read errors only for idempotent ones.
+
+    A POST that timed out while reading may still complete upstream, so sending it
+    again would run (and bill) the same completion twice.
+    """
+
+    # Retries run in the calling thread, so they can see its request deadline
+    def is_exhausted(self):
+        return deadlines.expired() or super().is_exhausted()
+
+    def increment(self, method=None, url=None, response=None, error=None, *args, **kwargs):
+        if error is not None and self._is_read_error(error) and method not in Retry.DEFAULT_ALLOWED_METHODS:
+            raise error
+        return super().increment(method, url, response, error, *args, **kwargs)
+
+
+def build_retry():
+    return DeadlineRetry(
+        total=UPSTREAM_MAX_RETRIES,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=None,  # upstream calls are POSTs; DeadlineRetry keeps their read errors from being retried
+        backoff_factor=UPSTREAM_BACKOFF_FACTOR,
+        backoff_max=UPSTREAM_BACKOFF_MAX,
+        backoff_jitter=UPSTREAM_BACKOFF_FACTOR,
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def upstream_service(url):
+    # Metric label for an upstream URL; everything that is not OpenAI is labelled by host
+    if url.startswith(OPENAI_BASE_URL.rstrip("/")):
+        return "openai"
+    return urlsplit(url).hostname or "unknown"
+
+
+def record_call(service, started, status_code=None, retries=0):
+    metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - started, service=service)
+    outcome = "error" if status_code is None else f"{status_code // 100}xx"
+    metrics.UPSTREAM_REQUESTS.inc(service=service, outcome=outcome)
+    if retries:
+        metrics.UPSTREAM_RETRIES.inc(retries, service=service)
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """Records every call through the shared pool, to OpenAI and Azure alike."""
+
+    def send(self, request, *args, **kwargs):
+        service = upstream_service(request.url)
+        started = time.perf_counter()
+        try:
+            response = super().send(request, *args, **kwargs)
+        except Exception:
+            record_call(service, started)
+            raise
+        retry = getattr(response.raw, "retries", None)
+        record_call(service, started, response.status_code, len(retry.history) if retry else 0)
+        return response
+
+
+def get_adapter():
+    global _adapter
+    with _lock:
+        if _adapter is None:
+            _adapter = InstrumentedAdapter(
+                pool_connections=UPSTREAM_POOL_SIZE,
+                pool_maxsize=UPSTREAM_POOL_SIZE,
+                max_retries=build_retry(),
+            )
+        return _adapter
+
+
+def get_session():
+    global _session
+    adapter = get_adapter()
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def openai_url(path):
+    return f"{OPENAI_BASE_URL.rstrip('/')}/{path.lstrip('/')}"
+
+
+def request(method, url, **kwargs):
+    kwargs.setdefault("timeout", TIMEOUT)
+    remaining = deadlines.remaining()
+    if remaining is not None:
+        # Nothing is sent once the request's deadline has passed, and nothing waits beyond it
+        if remaining <= 0:
+            raise deadlines.DeadlineExceeded()
+        connect_timeout, read_timeout = kwargs["timeout"]
+        kwargs["timeout"] = (min(connect_timeout, remaining), min(read_timeout, remaining))
+    return get_session().request(method, url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def backoff_delay(attempt, retry_after=None):
+    delay = min(UPSTREAM_BACKOFF_MAX, UPSTREAM_BACKOFF_FACTOR * (2 ** attempt))
+    delay += random.uniform(0, UPSTREAM_BACKOFF_FACTOR)
+    retry_after = parse_retry_after(retry_after)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def get_async_client():
+    # httpx clients are bound to the event loop they were first used on
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_ASYNC_POOL_SIZE,
+                max_keepalive_connections=UPSTREAM_ASYNC_POOL_SIZE,
+            ),
+            timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def async_post(url, **kwargs):
+    import httpx
+
+    client = get_async_client()
+    service = upstream_service(url)
+    started = time.perf_counter()
+    for attempt in range(UPSTREAM_MAX_RETRIES + 1):
+        try:
+            response = await client.post(url, **kwargs)
+        except httpx.TransportError as e:
+            # Only errors from before the request went out are retried, as in DeadlineRetry
+            sent = not isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+            if sent or attempt == UPSTREAM_MAX_RETRIES:
+                record_call(service, started, retries=attempt)
+                raise
+            await asyncio.sleep(backoff_delay(attempt))
+            continue
+
+        if response.status_code in RETRY_STATUSES and attempt < UPSTREAM_MAX_RETRIES:
+            await asyncio.sleep(backoff_delay(attempt, response.headers.get("Retry-After")))
+            continue
+        record_call(service, started, response.status_code, attempt)
+        return response
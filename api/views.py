@@ -1,74 +1,127 @@
 import base64
-import datetime
+import collections
 import tempfile
-from PIL import Image
-from PyPDF2 import PdfReader
-import concurrent
 from concurrent.futures import ThreadPoolExecutor
-from pdf2image import convert_from_path
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from pptx import Presentation
-from fitz import open as open_pdf
 import os
-import io
-import pytesseract
-import requests
+import logging
 from rest_framework.decorators import api_view
-from azure.cognitiveservices.vision.computervision import ComputerVisionClient
-from azure.cognitiveservices.vision.computervision.models import OperationStatusCodes
-from msrest.authentication import CognitiveServicesCredentials
-import subprocess
 from rest_framework.parsers import MultiPartParser
-from api import models, serializers
+from api import deadlines, metrics, models, search, serializers, upstream
+from api.batching import submit_descriptions
+from api.dedup import ImageDeduplicator, image_signature
+from api.description_cache import description_cache, make_key
+from api.imaging import PayloadStats, normalize_image
+from api.office import ConversionTimeout, office_pool
+from api.ocr_planner import OcrStats, plan_page
+from api.ocr_router import ocr_router
+from api.pagination import HistoryCursorPagination
+from api.pdf_engine import page_count, pdf_engine
+from api.pptx_reader import PPTX_FAST_EXTRACTOR, PackageError, read_slides
+from api.quota import RequestBudget, quota_subject
+from api.ranges import RangeError, requested_range
+from api.result_cache import document_cache, hash_upload, make_result_key
+from api.storage import segment_index, stored_bytes, unpack_segment
+from api.streaming import requested_stream_format, streaming_response
 from decouple import config
+from django.http import Http404
 import threading
 
-# Global image description count and last recharge time
-image_description_count = 20
-last_recharge_time = datetime.datetime.now()
+logger = logging.getLogger(__name__)
 
-# Tesseract OCR configuration
-pytesseract.pytesseract.tesseract_cmd = 'C:\\Program Files\\Tesseract-OCR\\tesseract.exe' if os.name == 'nt' else '/usr/bin/tesseract'
+# Threads doing OCR and descriptions for one request's pages or slides
+PAGE_THREADS = config('PAGE_THREADS', default=min(32, (os.cpu_count() or 1) + 4), cast=int)
 
+# OpenAI vision model, also part of the description cache key
+OPENAI_MODEL = config('OPENAI_MODEL', default='gpt-4o-2024-08-06')
 
-# Azure Cognitive Services configuration
-# subscription_key = os.getenv("AZURE_SUBSCRIPTION_KEY", "default")
-subscription_key = config('AZURE_SUBSCRIPTION_KEY', default='default')
-endpoint = os.getenv("AZURE_ENDPOINT", "https://scribemeocr.cognitiveservices.azure.com/")
-computervision_client = ComputerVisionClient(endpoint, CognitiveServicesCredentials(subscription_key))
 
+# Prompt per supported language for image descriptions
+PROMPT_TEXTS = {
+    "English": "Describe this image in detail.",
+    "Arabic": "صف هذه الصورة بالتفصيل.",
+    "Spanish": "Describe esta imagen en detalle."
+}
 
-def describe_image_with_gpt(base64_image, prompt_text="Describe this image"):
+# Tesseract language codes per supported language
+OCR_LANGUAGES = {"English": "eng", "Spanish": "spa", "Arabic": "ara"}
+
+
+def get_prompt_text(language):
+    return PROMPT_TEXTS.get(language, "Describe this image in detail.")
+
+
+def openai_headers():
     # api_key = os.getenv("OPENAI_API_KEY")  # Ensure this is set in your environment variables
     api_key = config('OPENAI_API_KEY', default='default')  # Ensure this is set in your environment variables
-    headers = {
+    return {
         "Content-Type": "application/json",
         "Authorization": f"Bearer {api_key}",
     }
 
+
+def build_description_request(base64_image, prompt_text, mime_type="image/jpeg"):
+    headers = openai_headers()
+
     payload = {
-        "model": "gpt-4o-2024-08-06",
+        "model": OPENAI_MODEL,
         "messages": [
             {
                 "role": "user",
                 "content": [
                     {"type": "text", "text": prompt_text},
-                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}}
+                    {"type": "image_url", "image_url": {"url": f"data:{mime_type};base64,{base64_image}"}}
                 ]
             }
         ],
         "max_tokens": 325
     }
+    return headers, payload
 
-    response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-    print(response)
+
+def describe_image_with_gpt(base64_image, prompt_text="Describe this image", mime_type="image/jpeg"):
+    headers, payload = build_description_request(base64_image, prompt_text, mime_type)
+    with metrics.stage("describe"):
+        response = upstream.post(upstream.openai_url("chat/completions"), headers=headers, json=payload)
     response.raise_for_status()
     response_json = response.json()
     return response_json["choices"][0]["message"]["content"]
 
 
+def describe_image(image_bytes, prompt_text, remaining_images_counter=None, payload_stats=None):
+    """Describes raw image bytes, serving repeated images from the description cache.
+
+    Returns (description, billed). Cache hits are not billed against the counter;
+    description is None when the image budget is exhausted. Images are normalized
+    before upload and the size difference is recorded on payload_stats.
+    """
+    key = make_key(image_bytes, prompt_text, OPENAI_MODEL)
+    description = description_cache.get(key)
+    if description is not None:
+        return description, False
+
+    if remaining_images_counter is not None and not remaining_images_counter.decrement():
+        return None, False
+
+    with metrics.stage("normalize"):
+        payload, mime_type = normalize_image(image_bytes)
+    if payload_stats is not None:
+        payload_stats.add(len(image_bytes), len(payload))
+    metrics.BYTES_PROCESSED.inc(len(payload), kind="upstream_payload")
+
+    try:
+        description = describe_image_with_gpt(base64.b64encode(payload).decode("utf-8"), prompt_text, mime_type)
+    except Exception:
+        # Nothing was described, so the reserved budget goes back
+        if remaining_images_counter is not None:
+            remaining_images_counter.refund()
+        raise
+    description_cache.set(key, description)
+    return description, True
+
+
 # class DescribeImageView(APIView):
 #     def post(self, request):
 #         image_file = request.FILES.get("image")
@@ -98,51 +151,54 @@ def describe_image_with_gpt(base64_image, prompt_text="Describe this image"):
 
 class DescribeImageView(APIView):
     def post(self, request):
-        image_files = request.FILES.getlist("images")  # Get multiple images
+        with metrics.stage("upload"):
+            image_files = request.FILES.getlist("images")  # Get multiple images
         language = request.data.get("language", "English")
         print(image_files)
         if not image_files:
             return Response({"error": "At least one image file is required."}, status=status.HTTP_400_BAD_REQUEST)
 
-        prompt_texts = {
-            "English": "Describe this image in detail.",
-            "Arabic": "صف هذه الصورة بالتفصيل.",
-            "Spanish": "Describe esta imagen en detalle."
-        }
-        prompt_text = prompt_texts.get(language, "Describe this image in detail.")
+        prompt_text = get_prompt_text(language)
+
+        try:
+            deadline = deadlines.requested_deadline(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         descriptions = []
+        payload_stats = PayloadStats()
+        budget = RequestBudget(quota_subject(request), len(image_files))
 
+        # Several images go upstream in each request, see api/batching.py
+        executor = ThreadPoolExecutor(max_workers=PAGE_THREADS)
         try:
-            for image_file in image_files:
-                image = Image.open(image_file)
-                buffered = io.BytesIO()
-                image.save(buffered, format="JPEG")
-                base64_image = base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-                description = describe_image_with_gpt(base64_image, prompt_text)
+            futures = submit_descriptions(
+                executor, [image_file.read() for image_file in image_files], prompt_text, budget, payload_stats,
+                deadline
+            )
+            for index, (image_file, future) in enumerate(zip(image_files, futures)):
+                try:
+                    description, _ = deadlines.result(future, deadline, deadlines.DEADLINE_GRACE_SECONDS)
+                except Exception:
+                    if deadline is None or not deadline.expired():
+                        raise
+                    deadline.skip_item(image=index, filename=image_file.name)
+                    description = None
                 descriptions.append({
                     "filename": image_file.name,
                     "description": description
                 })
 
-            return Response({"descriptions": descriptions}, status=status.HTTP_200_OK)
+            data = {"descriptions": descriptions, "bytes_saved": payload_stats.bytes_saved, "quota": budget.report()}
+            if deadline is not None and deadline.partial():
+                data["deadline"] = deadline.report()
+            return Response(data, status=status.HTTP_200_OK)
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-def perform_ocr(image_path, lang="eng"):
-    image = Image.open(image_path)
-    return pytesseract.image_to_string(image, lang=lang)
-
-
-def analyze_image_with_ocr_with_arabic(image_path):
-    try:
-        with open(image_path, "rb") as image_stream:
-            ocr_result = computervision_client.recognize_printed_text_in_stream(image=image_stream, language="ar")
-        return "\n".join(" ".join(word.text for word in line.words) for region in ocr_result.regions for line in region.lines)
-    except Exception as e:
-        return f"Error: {e}"
+        finally:
+            executor.shutdown(wait=deadline is None or not deadline.expired(), cancel_futures=True)
 
 
 # class ExtractTextFromPDFView(APIView):
@@ -302,93 +358,302 @@ class ThreadSafeCounter:
                 self.value -= 1
                 return True
             return False
-        
+
+    def refund(self):
+        with self.lock:
+            self.value += 1
+
     def get_value(self):
         with self.lock:
             return self.value
 
-def process_page(page, page_number, ocr_option, image_description_option, language, remaining_images_counter):
-    text_content = f"Page {page_number}:\n{page.get_text('text')}\n"
+def mark_duplicate_images(extracted_page, deduplicator):
+    # Must be called on pages in page order so back-references point at the first occurrence
+    for image in extracted_page["images"]:
+        image["duplicate_of"] = deduplicator.check(image["xref"], image["signature"], extracted_page["page_number"])
+
+
+def process_page(extracted_page, ocr_option, image_description_option, language, remaining_images_counter,
+                 payload_stats=None, ocr_stats=None):
+    """Renders one page produced by pdf_engine, running OCR and image descriptions on its images.
+
+    OCR follows the plan from api.ocr_planner: icons and images without text are
+    skipped, and pages without a text layer are OCRed whole. Under a deadline,
+    OCR and descriptions not done in time are left out and recorded on it.
+    """
+    page_number = extracted_page["page_number"]
+    text_content = f"Page {page_number}:\n{extracted_page['text']}\n"
     image_description_count = 0
 
     if ocr_option or image_description_option:
-        for img in page.get_images(full=True):
-            xref = img[0]
-            image_bytes = page.parent.extract_image(xref)["image"]
-
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_image:
-                temp_image.write(image_bytes)
-                temp_image_path = temp_image.name
-
-            if ocr_option:
-                lang_map = {"English": "eng", "Spanish": "spa", "Arabic": "ara"}
-                lang_code = lang_map.get(language, "eng")
-                text_content += f"\n OCR Text from image on page {page_number}: {perform_ocr(temp_image_path, lang_code)}\n"
-
-            if image_description_option and remaining_images_counter.decrement():
-                prompt_texts = {
-                    "English": "Describe this image in detail.",
-                    "Arabic": "صف هذه الصورة بالتفصيل.",
-                    "Spanish": "Describe esta imagen en detalle."
-                }
-                prompt_text = prompt_texts.get(language, "Describe this image in detail.")
-                gpt_description = describe_image_with_gpt(
-                    base64.b64encode(image_bytes).decode("utf-8"),
-                    prompt_text
-                )
-                text_content += f"\n Image description on page {page_number}: {gpt_description}\n"
-                image_description_count += 1
-
-            os.remove(temp_image_path)
+        # Extracted images stay in memory; OCR workers receive the bytes directly
+        images = [(index, image) for index, image in enumerate(extracted_page["images"])
+                  if image.get("duplicate_of") is None]
+        repeated = [image for image in extracted_page["images"] if image.get("duplicate_of") is not None]
+        metrics.BYTES_PROCESSED.inc(sum(len(image["image"]) for _, image in images), kind="image")
+
+        # OCR runs in the worker pool while descriptions run here
+        ocr_futures = {}
+        if ocr_option:
+            lang_code = OCR_LANGUAGES.get(language, "eng")
+            page_image, reasons = plan_page(extracted_page, images)
+            if ocr_stats is not None:
+                ocr_stats.record(page_number, page_image, reasons)
+            page_ocr = ocr_router.submit(page_image, lang_code) if page_image is not None else None
+            ocr_futures = {
+                index: ocr_router.submit(image["image"], lang_code)
+                for index, image in images if reasons[index] is None
+            }
+            if page_ocr is not None:
+                try:
+                    text_content += f"\n OCR Text from page {page_number}: {deadlines.result(page_ocr)}\n"
+                except deadlines.DeadlineExceeded:
+                    deadlines.skip_item(page=page_number, work="page_ocr")
+
+        for index, image in images:
+            image_bytes = image["image"]
+            if index in ocr_futures:
+                try:
+                    ocr_text = deadlines.result(ocr_futures[index])
+                    text_content += f"\n OCR Text from image on page {page_number}: {ocr_text}\n"
+                except deadlines.DeadlineExceeded:
+                    deadlines.skip_item(page=page_number, image=index, work="ocr")
+
+            if image_description_option:
+                if deadlines.expired():
+                    deadlines.skip_item(page=page_number, image=index, work="description")
+                    continue
+                prompt_text = get_prompt_text(language)
+                try:
+                    gpt_description, billed = describe_image(
+                        image_bytes, prompt_text, remaining_images_counter, payload_stats
+                    )
+                except Exception:
+                    # A call cut off by the deadline is skipped; anything else is a real failure
+                    if not deadlines.expired():
+                        raise
+                    deadlines.skip_item(page=page_number, image=index, work="description")
+                    continue
+                if gpt_description is not None:
+                    text_content += f"\n Image description on page {page_number}: {gpt_description}\n"
+                if billed:
+                    image_description_count += 1
+
+        for image in repeated:
+            text_content += f"\n Repeated image on page {page_number}: see page {image['duplicate_of']}\n"
 
     return text_content, image_description_count
 
+def iter_processed_pages(pdf_path, ocr_option, image_description_option, language, remaining_images_counter,
+                         payload_stats=None, skip_pages=(), ocr_stats=None, pages=None, deadline=None):
+    """Yields (page_number, page_text, img_count) in page order.
+
+    Text and images are pulled out by pdf_engine (sharded across processes for large
+    documents); OCR and descriptions for each page run on a thread pool, with a bounded
+    number of pages in flight so memory does not grow with the document.
+
+    Pages in skip_pages still go through deduplication but are not processed or yielded;
+    pages outside pages (when given) are not even extracted.
+
+    Once deadline expires no more pages are started, pages still running get
+    DEADLINE_GRACE_SECONDS to finish, and every page not yielded is recorded on it.
+    """
+    # OCR text is only reused for identical images
+    deduplicator = ImageDeduplicator(near_duplicates=not ocr_option)
+    pending = collections.deque()
+    done = set()
+    executor = ThreadPoolExecutor(max_workers=PAGE_THREADS)
+
+    def collect(page_number, future):
+        try:
+            result = deadlines.result(future, deadline, deadlines.DEADLINE_GRACE_SECONDS)
+        except deadlines.DeadlineExceeded:
+            return None
+        done.add(page_number)
+        return (page_number, *result)
+
+    try:
+        extracted_pages = pdf_engine.iter_pages(
+            pdf_path, ocr_option or image_description_option, render_textless=ocr_option, pages=pages
+        )
+        for extracted_page in metrics.timed_iter("extract", extracted_pages):
+            if deadline is not None and deadline.expired():
+                break
+            mark_duplicate_images(extracted_page, deduplicator)
+            if extracted_page["page_number"] in skip_pages:
+                continue
+            pending.append((extracted_page["page_number"], metrics.track_future(executor.submit(
+                deadlines.bind(metrics.bind(process_page), deadline), extracted_page, ocr_option,
+                image_description_option, language, remaining_images_counter, payload_stats, ocr_stats
+            ), "pages")))
+
+            if len(pending) >= PAGE_THREADS * 2:
+                page = collect(*pending.popleft())
+                if page is not None:
+                    yield page
+
+        while pending:
+            page = collect(*pending.popleft())
+            if page is not None:
+                yield page
+    finally:
+        for _, future in pending:
+            future.cancel()
+        expired = deadline is not None and deadline.expired()
+        # Pages still running skip their remaining work past the deadline, so they are not waited for
+        executor.shutdown(wait=not expired, cancel_futures=True)
+        if expired:
+            for page_number in pages if pages is not None else range(1, page_count(pdf_path) + 1):
+                if page_number not in done and page_number not in skip_pages:
+                    deadline.skip(page_number)
+
+
+def document_cache_key(file_hash, kind, ocr_option, image_description_option, language, remaining_images,
+                       page_range=None):
+    # Only options that can change the output are part of the key
+    options = {
+        "ocr": ocr_option,
+        "image_description": image_description_option,
+        "language": language if ocr_option or image_description_option else None,
+        "rImages": remaining_images if image_description_option else 0,
+    }
+    if page_range is not None:
+        options["pages"] = page_range.key()
+    return make_result_key(file_hash, kind, options, OPENAI_MODEL)
+
+
+def cached_document_response(stream_format, event_type, items, data, budget, extra=None):
+    """Replays a cached document result; nothing was billed, so count is 0."""
+    summary = {"count": 0, "bytes_saved": 0, "cached": True, "quota": budget.report(), **(extra or {})}
+    if stream_format:
+        events = [(event_type, {**item, "count": 0}) for item in items]
+        events.append(("summary", summary))
+        return streaming_response(stream_format, iter(events))
+    return Response({**data, **summary}, status=status.HTTP_200_OK)
+
+
 class ExtractTextFromPDFView(APIView):
     def post(self, request):
-        pdf_file = request.FILES.get("pdf_file")
+        with metrics.stage("upload"):
+            pdf_file = request.FILES.get("pdf_file")
         ocr_option = str(request.data.get("ocr", "false")).lower() == "true"
         image_description_option = str(request.data.get("image_description", "false")).lower() == "true"
         remaining_images = int(request.data.get("rImages", 25))
         language = request.data.get("language", "English")
-        batch_size = 5  
+        stream_format = requested_stream_format(request)
+        refresh = str(request.data.get("refresh", "false")).lower() == "true"
 
         if not pdf_file:
             return Response({"error": "PDF file is required."}, status=status.HTTP_400_BAD_REQUEST)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
+        try:
+            deadline = deadlines.requested_deadline(request.data, "pages")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Shared per-user and global limits on top of the client's own rImages cap
+        remaining_images_counter = RequestBudget(quota_subject(request), remaining_images)
+
+        metrics.BYTES_PROCESSED.inc(pdf_file.size, kind="upload")
+        with metrics.stage("cache_lookup"):
+            file_hash = hash_upload(pdf_file)
+            try:
+                page_range = requested_range(request.data, "pages", file_hash, "pdf")
+            except RangeError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            cache_key = document_cache_key(
+                file_hash, "pdf", ocr_option, image_description_option, language, remaining_images, page_range
+            )
+            cached = None if refresh else document_cache.get(cache_key)
+        if cached is not None:
+            # The selection is resolved again so the continuation token is freshly signed
+            extra = {"range": page_range.select(1, cached["total"]).report()} if page_range is not None else None
+            return cached_document_response(
+                stream_format, "page", cached["pages"],
+                {"text_content": "".join(page["text"] for page in cached["pages"])}, remaining_images_counter, extra
+            )
+
+        with metrics.stage("spool"), tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as temp_pdf:
             temp_pdf.write(pdf_file.read())
             temp_pdf_path = temp_pdf.name
 
+        selection = None
+        if page_range is not None:
+            try:
+                selection = page_range.select(1, page_count(temp_pdf_path))
+            except RangeError as e:
+                os.remove(temp_pdf_path)
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except Exception as e:
+                os.remove(temp_pdf_path)
+                return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        def cache_result(processed_pages):
+            # A result cut short by the shared quota or the deadline would be wrong on a retry
+            if remaining_images_counter.denied or (deadline is not None and deadline.partial()):
+                return
+            result = {"pages": processed_pages}
+            if selection is not None:
+                result["total"] = selection.total
+            document_cache.set(cache_key, file_hash, "pdf", result)
+
+        def add_reports(data):
+            if ocr_stats is not None:
+                data["ocr"] = ocr_stats.report()
+            if selection is not None:
+                data["range"] = selection.report()
+            if deadline is not None and deadline.partial():
+                data["deadline"] = deadline.report()
+            return data
+
+        payload_stats = PayloadStats()
+        ocr_stats = OcrStats() if ocr_option else None
+        pages = iter_processed_pages(
+            temp_pdf_path, ocr_option, image_description_option, language, remaining_images_counter, payload_stats,
+            ocr_stats=ocr_stats, pages=selection.numbers if selection is not None else None, deadline=deadline
+        )
+
+        if stream_format:
+            def events():
+                image_description_count = 0
+                processed_pages = []
+                try:
+                    for page_number, page_text, img_count in pages:
+                        image_description_count += img_count
+                        processed_pages.append({"page_number": page_number, "text": page_text})
+                        yield "page", {"page_number": page_number, "text": page_text, "count": img_count}
+                    cache_result(processed_pages)
+                    yield "summary", add_reports({
+                        "count": image_description_count, "bytes_saved": payload_stats.bytes_saved,
+                        "quota": remaining_images_counter.report(),
+                    })
+                finally:
+                    pages.close()
+                    if os.path.exists(temp_pdf_path):
+                        os.remove(temp_pdf_path)
+
+            return streaming_response(stream_format, events())
+
         try:
-            text_content = ""
+            processed_pages = []
             image_description_count = 0
 
-            # Create a thread-safe counter for remaining images
-            remaining_images_counter = ThreadSafeCounter(remaining_images)
-
-            with open_pdf(temp_pdf_path) as pdf_document:
-                num_pages = len(pdf_document)
-                with ThreadPoolExecutor() as executor:
-                    futures = []
-                    for i in range(0, num_pages, batch_size):
-                        batch_pages = [pdf_document[j] for j in range(i, min(i + batch_size, num_pages))]
-                        for page_number, page in enumerate(batch_pages, start=i + 1):
-                            futures.append(executor.submit(
-                                process_page, page, page_number, ocr_option, image_description_option, language, remaining_images_counter
-                            ))
-
-                    for future in futures:
-                        page_text, img_count = future.result()
-                        text_content += page_text
-                        image_description_count += img_count
+            for page_number, page_text, img_count in pages:
+                processed_pages.append({"page_number": page_number, "text": page_text})
+                image_description_count += img_count
 
-            os.remove(temp_pdf_path)
-            return Response({"text_content": text_content, "count": image_description_count}, status=status.HTTP_200_OK)
+            cache_result(processed_pages)
+            text_content = "".join(page["text"] for page in processed_pages)
+            return Response(add_reports({
+                "text_content": text_content, "count": image_description_count,
+                "bytes_saved": payload_stats.bytes_saved, "quota": remaining_images_counter.report(),
+            }), status=status.HTTP_200_OK)
 
         except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        finally:
             if os.path.exists(temp_pdf_path):
                 os.remove(temp_pdf_path)
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 def save_temporary_ppt(uploaded_file):
     with tempfile.NamedTemporaryFile(delete=False, suffix=".ppt") as temp_file:
@@ -401,51 +666,15 @@ def convert_ppt_to_pptx(ppt_path):
         if not os.path.exists(ppt_path):
             raise RuntimeError(f"Input file not found: {ppt_path}")
 
-        output_dir = os.path.dirname(ppt_path)
-        libreoffice_path = "C:\\Program Files\\LibreOffice\\program\\soffice.exe" if os.name == 'nt' else "libreoffice"
-
-        command = [
-            libreoffice_path,
-            "--headless",
-            "--convert-to", "pptx",
-            "--outdir", output_dir,
-            ppt_path
-        ]
-        subprocess.run(command, check=True)
-
-        pptx_path = ppt_path.replace(".ppt", ".pptx")
-        if not os.path.exists(pptx_path):
-            raise RuntimeError(f"Conversion failed: .pptx file not found at {pptx_path}")
-
-        return pptx_path
-    except subprocess.CalledProcessError as e:
+        # Runs on a warm LibreOffice instance with its own profile, see api/office.py
+        with metrics.stage("convert"):
+            return office_pool.convert(ppt_path)
+    except ConversionTimeout as e:
         raise RuntimeError(f"LibreOffice conversion failed: {e}")
     except Exception as e:
         raise RuntimeError(f"Error converting PPT to PPTX: {e}")
 
 
-def extract_content_from_pptx(presentation):
-    slides_content = []
-    try:
-        for slide_index, slide in enumerate(presentation.slides, start=1):
-            slide_data = {"slide_number": slide_index, "texts": [], "images": []}
-
-            for shape in slide.shapes:
-                if shape.has_text_frame:
-                    slide_data["texts"].extend(paragraph.text.strip() for paragraph in shape.text_frame.paragraphs)
-
-                if hasattr(shape, "image"):
-                    image_stream = shape.image.blob
-                    slide_data["images"].append(base64.b64encode(image_stream).decode("utf-8"))
-
-            slides_content.append(slide_data)
-
-    except Exception as e:
-        raise Exception(f"Error extracting content from slides: {e}")
-
-    return slides_content
-
-
 # class PptxProcessorAPIView(APIView):
 #     parser_classes = [MultiPartParser]
 
@@ -493,77 +722,247 @@ def extract_content_from_pptx(presentation):
 #         except Exception as e:
 #             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def extract_content_from_slide(slide, slide_number, load_images=True):
+    slide_content = {"slide_number": slide_number, "texts": "", "images": []}
+
+    for shape in slide.shapes:
+        if hasattr(shape, "text") and shape.text.strip():
+            slide_content["texts"] += shape.text.strip() + "\n"
+        # Image bytes are only read when they are going to be described
+        if load_images and hasattr(shape, "image"):
+            slide_content["images"].append({"key": shape.image.sha1, "image": shape.image.blob})
+
+    return slide_content
+
+
+def mark_duplicate_slide_images(slides_content, map_func=map):
+    # Signatures are computed once per distinct image part, optionally in parallel
+    blobs = {}
+    for slide_content in slides_content:
+        for image in slide_content["images"]:
+            blobs.setdefault(image["key"], image["image"])
+    signatures = dict(zip(blobs, map_func(image_signature, blobs.values())))
+
+    deduplicator = ImageDeduplicator()
+    for slide_content in slides_content:
+        for image in slide_content["images"]:
+            image["duplicate_of"] = deduplicator.check(
+                image["key"], signatures[image["key"]], slide_content["slide_number"]
+            )
+
+
+def extract_slides(pptx_path, load_images=True):
+    return extract_slide_range(pptx_path, None, load_images)[0]
+
+
+def extract_slide_range(pptx_path, page_range, load_images=True):
+    """Extracts the slides page_range selects, or all of them; returns (slides, selection).
+
+    Decks are read straight from the package unless PPTX_FAST_EXTRACTOR is off or
+    the package is beyond the fast reader, in which case python-pptx reads them.
+    Without load_images slides come back with no images.
+    """
+    with metrics.stage("extract"):
+        if PPTX_FAST_EXTRACTOR:
+            try:
+                return read_slides(pptx_path, page_range, load_images)
+            except PackageError as e:
+                logger.warning("Reading %s with python-pptx: %s", pptx_path, e)
+
+        from pptx import Presentation
+
+        slides = Presentation(pptx_path).slides
+        if page_range is None:
+            return [extract_content_from_slide(slide, i, load_images) for i, slide in enumerate(slides)], None
+        # Slides are numbered from 0, as in the slide_number of every response
+        selection = page_range.select(0, len(slides) - 1)
+        return [extract_content_from_slide(slides[i], i, load_images) for i in selection.numbers], selection
+
+
+def process_slide(extracted_content, image_description, language, remaining_images_counter, payload_stats=None):
+    billed_count = 0
+
+    if image_description:
+        prompt_text = get_prompt_text(language)
+        described_images = []
+        for index, image in enumerate(extracted_content["images"]):
+            if image["duplicate_of"] is not None:
+                described_images.append(f"(same image as slide {image['duplicate_of']})")
+                continue
+
+            try:
+                if "description" in image:
+                    # Already submitted in a batch by iter_processed_slides
+                    description, billed = deadlines.result(image["description"])
+                elif deadlines.expired():
+                    raise deadlines.DeadlineExceeded()
+                else:
+                    # Cached descriptions are free, so keep going after the budget runs out
+                    description, billed = describe_image(
+                        image["image"], prompt_text, remaining_images_counter, payload_stats
+                    )
+            except Exception:
+                # A description cut off by the deadline is skipped; anything else is a real failure
+                if not deadlines.expired():
+                    raise
+                deadlines.skip_item(slide=extracted_content["slide_number"], image=index, work="description")
+                continue
+            if description is not None:
+                described_images.append(description)
+            if billed:
+                billed_count += 1
+        extracted_content["images"] = described_images
+    else:
+        extracted_content.pop("images", None)
+
+    return extracted_content, billed_count
+
+
+def iter_processed_slides(slides, image_description, language, remaining_images_counter, payload_stats=None,
+                          skip_slides=(), deadline=None):
+    """Yields (slide_content, billed_count) in slide order, skipping slide numbers in skip_slides.
+
+    Distinct images are described in batches, in slide order, on their own executor
+    so slides waiting for a batch cannot hold up the batch itself. Slides not done
+    by the deadline (plus DEADLINE_GRACE_SECONDS) are recorded on it and left out.
+    """
+    executor = ThreadPoolExecutor(max_workers=PAGE_THREADS)
+    describe_executor = ThreadPoolExecutor(max_workers=PAGE_THREADS)
+    futures = []
+    try:
+        if image_description:
+            mark_duplicate_slide_images(slides, executor.map)
+            images = [
+                image for slide in slides if slide["slide_number"] not in skip_slides
+                for image in slide["images"] if image["duplicate_of"] is None
+            ]
+            description_futures = submit_descriptions(
+                describe_executor, [image["image"] for image in images], get_prompt_text(language),
+                remaining_images_counter, payload_stats, deadline
+            )
+            for image, future in zip(images, description_futures):
+                image["description"] = future
+
+        futures = [
+            (slide["slide_number"], metrics.track_future(executor.submit(
+                deadlines.bind(metrics.bind(process_slide), deadline), slide, image_description, language,
+                remaining_images_counter, payload_stats
+            ), "pages"))
+            for slide in slides if slide["slide_number"] not in skip_slides
+        ]
+        for slide_number, future in futures:
+            try:
+                result = deadlines.result(future, deadline, deadlines.DEADLINE_GRACE_SECONDS)
+            except deadlines.DeadlineExceeded:
+                deadline.skip(slide_number)
+                continue
+            yield result
+    finally:
+        for _, future in futures:
+            future.cancel()
+        # Unsent batches are dropped; their images' futures are cancelled with them
+        describe_executor.shutdown(wait=False, cancel_futures=True)
+        executor.shutdown(wait=deadline is None or not deadline.expired(), cancel_futures=True)
+
+
 class PptxProcessorAPIView(APIView):
     parser_classes = [MultiPartParser]
 
     def post(self, request, *args, **kwargs):
-        pptx_file = request.FILES.get("file")
+        with metrics.stage("upload"):
+            pptx_file = request.FILES.get("file")
         language = request.data.get("language", "English")
         image_description = str(request.data.get("image_description", "true")).lower() == "true"
         remaining_images = int(request.data.get("rImages", 25))
+        stream_format = requested_stream_format(request)
+        refresh = str(request.data.get("refresh", "false")).lower() == "true"
 
         if not pptx_file:
             return Response({"error": "No file uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            deadline = deadlines.requested_deadline(request.data, "slides")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        remaining_images_counter = RequestBudget(quota_subject(request), remaining_images)
+
+        metrics.BYTES_PROCESSED.inc(pptx_file.size, kind="upload")
+        with metrics.stage("cache_lookup"):
+            file_hash = hash_upload(pptx_file)
+            try:
+                page_range = requested_range(request.data, "slides", file_hash, "pptx")
+            except RangeError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            cache_key = document_cache_key(
+                file_hash, "pptx", False, image_description, language, remaining_images, page_range
+            )
+            cached = None if refresh else document_cache.get(cache_key)
+        if cached is not None:
+            extra = {"range": page_range.select(0, cached["total"] - 1).report()} if page_range is not None else None
+            return cached_document_response(
+                stream_format, "slide", cached["slides"], {"slides": cached["slides"]}, remaining_images_counter, extra
+            )
 
         try:
-            temp_file_path = save_temporary_ppt(pptx_file)
+            with metrics.stage("spool"):
+                temp_file_path = save_temporary_ppt(pptx_file)
             pptx_file_path = convert_ppt_to_pptx(temp_file_path) if pptx_file.name.lower().endswith(".ppt") else temp_file_path
 
-            presentation = Presentation(pptx_file_path)
-            slides = list(presentation.slides)
+            selection = None
+            if page_range is not None:
+                slides, selection = extract_slide_range(pptx_file_path, page_range, image_description)
+            else:
+                slides = extract_slides(pptx_file_path, image_description)
+
+            def cache_result():
+                if remaining_images_counter.denied or (deadline is not None and deadline.partial()):
+                    return
+                result = {"slides": slides_content}
+                if selection is not None:
+                    result["total"] = selection.total
+                document_cache.set(cache_key, file_hash, "pptx", result)
+
+            def add_reports(data):
+                if selection is not None:
+                    data["range"] = selection.report()
+                if deadline is not None and deadline.partial():
+                    data["deadline"] = deadline.report()
+                return data
 
             slides_content = []
             image_description_count = 0
-            remaining_images_counter = ThreadSafeCounter(remaining_images)
-
-            def extract_content_from_slide(slide, slide_number):
-                slide_content = {"slide_number": slide_number, "texts": "", "images": []}
-
-                # Extract text from slide
-                for shape in slide.shapes:
-                    if hasattr(shape, "text") and shape.text.strip():
-                        slide_content["texts"] += shape.text.strip() + "\n"
-
-                # Extract images from slide
-                for shape in slide.shapes:
-                    if hasattr(shape, "image"):
-                        image_stream = shape.image.blob
-                        image_base64 = base64.b64encode(image_stream).decode("utf-8")
-                        slide_content["images"].append(image_base64)
-
-                return slide_content
-
-            def process_slide(slide, slide_number):
-                extracted_content = extract_content_from_slide(slide, slide_number)
-
-                if image_description and remaining_images_counter.get_value() > 0:
-                    described_images = []
-                    for image_base64 in extracted_content["images"]:
-                        if remaining_images_counter.decrement():
-                            prompt_texts = {
-                                "English": "Describe this image in detail.",
-                                "Arabic": "صف هذه الصورة بالتفصيل.",
-                                "Spanish": "Describe esta imagen en detalle."
-                            }
-                            prompt_text = prompt_texts.get(language, "Describe this image in detail.")
-                            described_images.append(describe_image_with_gpt(image_base64, prompt_text))
-                        else:
-                            break
-                    extracted_content["images"] = described_images
-                else:
-                    extracted_content.pop("images", None)
-
-                return extracted_content
-
-            with ThreadPoolExecutor() as executor:
-                futures = {executor.submit(process_slide, slide, i): i for i, slide in enumerate(slides)}
-
-                for future in futures:
-                    slide_content = future.result()
-                    slides_content.append(slide_content)
-                    image_description_count += len(slide_content.get("images", []))
-
-            return Response({"slides": slides_content, "count": image_description_count}, status=status.HTTP_200_OK)
+            payload_stats = PayloadStats()
+            processed_slides = iter_processed_slides(
+                slides, image_description, language, remaining_images_counter, payload_stats, deadline=deadline
+            )
+
+            if stream_format:
+                def events():
+                    total_count = 0
+                    for slide_content, billed_count in processed_slides:
+                        total_count += billed_count
+                        slides_content.append(slide_content)
+                        yield "slide", {**slide_content, "count": billed_count}
+                    cache_result()
+                    yield "summary", add_reports({
+                        "count": total_count, "bytes_saved": payload_stats.bytes_saved,
+                        "quota": remaining_images_counter.report(),
+                    })
+
+                return streaming_response(stream_format, events())
+
+            for slide_content, billed_count in processed_slides:
+                slides_content.append(slide_content)
+                image_description_count += billed_count
+
+            cache_result()
+            return Response(add_reports({
+                "slides": slides_content, "count": image_description_count,
+                "bytes_saved": payload_stats.bytes_saved, "quota": remaining_images_counter.report(),
+            }), status=status.HTTP_200_OK)
+
+        except RangeError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -573,16 +972,20 @@ class PptxProcessorAPIView(APIView):
 def create_history(request):
     serializer = serializers.HistorySerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save()
+        history = serializer.save()
+        search.index_history(history)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(["GET"])
 def get_history(request, user_id):
-    history = models.History.objects.filter(user=user_id)
-    serializer = serializers.HistorySerializer(history, many=True)
-    return Response(serializer.data)
+    # Size and preview are stored columns, so the compressed response bodies are never loaded
+    history = models.History.objects.filter(user=user_id).defer("response")
+    paginator = HistoryCursorPagination()
+    page = paginator.paginate_queryset(history, request)
+    serializer = serializers.HistoryListSerializer(page, many=True)
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(["GET"])
@@ -591,3 +994,40 @@ def get_history_by_id(request, pk):
     serializer = serializers.HistorySerializer(history)
     return Response(serializer.data)
 
+
+def get_stored_response(pk):
+    stored = models.History.objects.filter(pk=pk).annotate(raw=stored_bytes("response")).values_list("raw", flat=True).first()
+    if stored is None:
+        raise Http404
+    return stored
+
+
+@api_view(["GET"])
+def get_history_segments(request, pk):
+    return Response(segment_index(get_stored_response(pk)))
+
+
+@api_view(["GET"])
+def get_history_segment(request, pk, index):
+    stored = get_stored_response(pk)
+    try:
+        text = unpack_segment(stored, index)
+    except IndexError:
+        return Response({"error": "No such segment."}, status=status.HTTP_404_NOT_FOUND)
+    return Response({"index": index, "text": text})
+
+
+@api_view(["GET"])
+def search_history(request, user_id):
+    query = request.query_params.get("q", "").strip()
+    if not query:
+        return Response({"error": "Query parameter q is required."}, status=status.HTTP_400_BAD_REQUEST)
+    if not search.search_available():
+        return Response({"error": "Search needs the SQLite database."}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+    try:
+        limit = int(request.query_params.get("limit", 20))
+    except ValueError:
+        return Response({"error": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+    limit = max(1, min(limit, search.SEARCH_MAX_RESULTS))
+    return Response({"results": search.search_history(user_id, query, limit)})
@@ -0,0 +1,67 @@
+import time
+
+from decouple import config
+
+# Load the heavy backends when the WSGI/ASGI application is created instead of on first use
+WARM_UP_BACKENDS = config('WARM_UP_BACKENDS', default=False, cast=bool)
+
+
+def load_pdf():
+    import fitz  # noqa: F401
+
+
+def load_pptx():
+    import pptx  # noqa: F401
+
+
+def load_images():
+    from PIL import Image
+
+    # Registers every image plugin now rather than on the first unusual format
+    Image.init()
+
+
+def load_ocr():
+    import pytesseract  # noqa: F401
+
+    try:
+        import tesserocr  # noqa: F401
+    except ImportError:
+        pass
+
+
+def load_upstream():
+    from api import upstream
+
+    upstream.get_session()
+
+
+def load_views():
+    import api.async_views  # noqa: F401
+    import api.views  # noqa: F401
+
+
+BACKENDS = (
+    ("views", load_views),
+    ("pdf", load_pdf),
+    ("pptx", load_pptx),
+    ("images", load_images),
+    ("ocr", load_ocr),
+    ("upstream", load_upstream),
+)
+
+
+def warm_up():
+    """Imports and builds everything the request path loads lazily; returns seconds per backend.
+
+    Meant for pre-fork servers: call it in the master (e.g. gunicorn --preload with
+    WARM_UP_BACKENDS=true) so workers share the loaded modules, or from a post_fork
+    hook to take the cost before the first request. Process pools and LibreOffice
+    are left alone, since they must not be started before forking.
+    """
+    timings = {}
+    for name, load in BACKENDS:
+        started = time.perf_counter()
+        load()
+        timings[name] = round(time.perf_counter() - started, 4)
+    return timings
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'back.settings')
 
 application = get_asgi_application()
+
+from api.warmup import WARM_UP_BACKENDS, warm_up  # noqa: E402
+
+if WARM_UP_BACKENDS:
+    warm_up()
@@ -17,7 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
-from api import views
+from api import async_views, job_views, metrics, views
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -30,8 +30,24 @@ urlpatterns = [
     # just image description
     path('extract_text_from_pptx/', views.PptxProcessorAPIView.as_view(), name='extract_text_from_pptx'),
 
+    # Async variants of the above, for ASGI deployments
+    path('async/describe_image/', async_views.DescribeImageAsyncView.as_view(), name='describe_image_async'),
+    path('async/extract_text_from_pdf/', async_views.ExtractTextFromPDFAsyncView.as_view(), name='extract_text_from_pdf_async'),
+    path('async/extract_text_from_pptx/', async_views.PptxProcessorAsyncAPIView.as_view(), name='extract_text_from_pptx_async'),
+
+    # Background jobs for large documents
+    path('jobs/extract_text_from_pdf/', job_views.PdfJobView.as_view(), name='pdf_job'),
+    path('jobs/extract_text_from_pptx/', job_views.PptxJobView.as_view(), name='pptx_job'),
+    path('jobs/<uuid:pk>/', job_views.JobDetailView.as_view(), name='job_detail'),
+
     # History
     path('history/create/', views.create_history, name='create_history'),
     path('history/<str:user_id>/list/', views.get_history, name='get_history'),
+    path('history/<str:user_id>/search/', views.search_history, name='search_history'),
     path('history/<int:pk>/', views.get_history_by_id, name='get_history_by_id'),
+    path('history/<int:pk>/segments/', views.get_history_segments, name='get_history_segments'),
+    path('history/<int:pk>/segments/<int:index>/', views.get_history_segment, name='get_history_segment'),
+
+    # Prometheus metrics for this worker process
+    path('metrics/', metrics.metrics_view, name='metrics'),
 ]
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'back.settings')
 
 application = get_wsgi_application()
+
+from api.warmup import WARM_UP_BACKENDS, warm_up  # noqa: E402
+
+if WARM_UP_BACKENDS:
+    warm_up()
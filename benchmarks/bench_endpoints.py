@@ -0,0 +1,278 @@
+"""End-to-end benchmarks for the describe, PDF and PPTX endpoints, fully offline.
+
+Each scenario runs in its own process against a throwaway SQLite database and
+a local upstream stub (stub_upstream.py), posting synthetic documents
+(documents.py) through the Django test client from --concurrency threads.
+Prints one JSON report with throughput, p50/p99 latency and peak RSS per
+scenario; save it with --output and compare runs across commits.
+
+    python benchmarks/bench_endpoints.py --requests 20 --concurrency 4 --latency-ms 300
+    python benchmarks/bench_endpoints.py --scenario pdf_images --warm --output before.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+
+def describe_images(args, salt):
+    from documents import build_image
+
+    images = [("images", (f"image{index}.png", build_image((args.size, args.size), salt * 1000 + index)))
+              for index in range(args.images)]
+    return "/describe_image/", images, {}, args.images
+
+
+def pdf_text(args, salt):
+    from documents import build_text_pdf
+
+    return "/extract_text_from_pdf/", [("pdf_file", ("text.pdf", build_text_pdf(args.pages, salt)))], {}, args.pages
+
+
+def pdf_images(args, salt):
+    from documents import build_image_pdf
+
+    document = build_image_pdf(args.pages, args.images, args.size, salt)
+    fields = {"image_description": "true", "rImages": str(args.pages * args.images)}
+    return "/extract_text_from_pdf/", [("pdf_file", ("images.pdf", document))], fields, args.pages
+
+
+def pdf_scanned(args, salt):
+    from documents import build_scanned_pdf
+
+    return "/extract_text_from_pdf/", [("pdf_file", ("scanned.pdf", build_scanned_pdf(args.pages, salt)))], \
+        {"ocr": "true"}, args.pages
+
+
+def pptx_images(args, salt):
+    from documents import build_pptx
+
+    document = build_pptx(args.pages, args.images, args.size, salt)
+    fields = {"image_description": "true", "rImages": str(args.pages * args.images)}
+    return "/extract_text_from_pptx/", [("file", ("deck.pptx", document))], fields, args.pages
+
+
+SCENARIOS = {
+    "describe_images": describe_images,
+    "pdf_text": pdf_text,
+    "pdf_images": pdf_images,
+    "pdf_scanned": pdf_scanned,
+    "pptx_images": pptx_images,
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def peak_rss_bytes(who):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def setup_django(stub_url, database_path):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "back.settings")
+    os.environ["OPENAI_BASE_URL"] = f"{stub_url}/v1"
+    os.environ["OPENAI_API_KEY"] = "benchmark"
+    os.environ["AZURE_ENDPOINT"] = stub_url
+    os.environ["AZURE_SUBSCRIPTION_KEY"] = "benchmark"
+    # Quotas would stop a long run part way; the cost being measured is the extraction
+    os.environ["QUOTA_USER_BURST"] = "0"
+    os.environ["QUOTA_GLOBAL_BURST"] = "0"
+    sys.path.insert(0, REPO_ROOT)
+
+    import django
+    from django.db import connection
+    from django.test.utils import setup_databases, setup_test_environment
+
+    django.setup()
+    setup_test_environment(debug=False)
+    connection.settings_dict["TEST"]["NAME"] = database_path
+    return setup_databases(verbosity=0, interactive=False)
+
+
+def run_scenario(args):
+    from stub_upstream import StubUpstream
+
+    stub = StubUpstream(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                        seed=args.seed).start()
+    database_dir = tempfile.mkdtemp(prefix="scribe-bench-")
+    old_config = setup_django(stub.url, os.path.join(database_dir, "bench.sqlite3"))
+
+    from django.db import connections
+    from django.test import Client
+    from django.test.utils import teardown_databases
+
+    build = SCENARIOS[args.scenario]
+    # Documents are built up front so generation never counts towards latency
+    if args.warm:
+        payloads = [build(args, 0)] * args.requests
+    else:
+        payloads = [build(args, index + 1) for index in range(args.requests)]
+    if args.warm:
+        # One untimed request fills the caches
+        path, files, fields, _ = payloads[0]
+        Client().post(path, form_data(files, fields))
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    pending = iter(payloads)
+
+    def worker():
+        client = Client()
+        while True:
+            with lock:
+                payload = next(pending, None)
+            if payload is None:
+                break
+            path, files, fields, _ = payload
+            data = form_data(files, fields)
+            started = time.perf_counter()
+            response = client.post(path, data)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed * 1000)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        connections.close_all()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+
+    teardown_databases(old_config, verbosity=0)
+    shutil.rmtree(database_dir, ignore_errors=True)
+    stub.shutdown()
+
+    units = sum(payload[3] for payload in payloads)
+    return {
+        "scenario": args.scenario,
+        "requests": len(latencies),
+        "concurrency": args.concurrency,
+        "warm": args.warm,
+        "statuses": {str(code): count for code, count in sorted(statuses.items())},
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(latencies) / wall_seconds, 3) if wall_seconds else None,
+        "units_per_second": round(units / wall_seconds, 3) if wall_seconds else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 1),
+            "p99": round(percentile(latencies, 0.99), 1),
+            "max": round(max(latencies), 1),
+            "mean": round(sum(latencies) / len(latencies), 1),
+        },
+        "peak_rss_bytes": peak_rss_bytes(resource.RUSAGE_SELF),
+        "peak_rss_children_bytes": peak_rss_bytes(resource.RUSAGE_CHILDREN),
+        "upstream": stub.stats.snapshot(),
+    }
+
+
+def form_data(files, fields):
+    from django.core.files.uploadedfile import SimpleUploadedFile
+
+    data = dict(fields)
+    for field_name, (file_name, content) in files:
+        data.setdefault(field_name, []).append(SimpleUploadedFile(file_name, content))
+    return data
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, repeatable; defaults to all of them")
+    parser.add_argument("--requests", type=int, default=10, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=10, help="pages per PDF, slides per deck")
+    parser.add_argument("--images", type=int, default=2, help="images per page, slide or describe request")
+    parser.add_argument("--size", type=int, default=400, help="edge of each image in pixels")
+    parser.add_argument("--warm", action="store_true", help="repeat one document, so caches answer")
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="stub upstream latency")
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream calls that fail")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.scenario = args.scenario[0]
+        print(json.dumps(run_scenario(args)))
+        return
+
+    results = []
+    for scenario in args.scenario or sorted(SCENARIOS):
+        # A fresh process per scenario keeps peak RSS and warm state from leaking between them
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--scenario", scenario]
+        command += strip_options(sys.argv[1:], ("--scenario", "--output"))
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            results.append({"scenario": scenario, "error": completed.stderr.strip().splitlines()[-1:]})
+            continue
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    report = {
+        "benchmark": "endpoints",
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "settings": {
+            "requests": args.requests, "concurrency": args.concurrency, "pages": args.pages,
+            "images": args.images, "size": args.size, "warm": args.warm,
+            "latency_ms": args.latency_ms, "jitter_ms": args.jitter_ms, "error_rate": args.error_rate,
+        },
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+
+
+def strip_options(arguments, names):
+    """Drops the given options and their values from an argv list."""
+    kept = []
+    skip = False
+    for argument in arguments:
+        if skip:
+            skip = False
+            continue
+        if argument in names:
+            skip = True
+            continue
+        if any(argument.startswith(name + "=") for name in names):
+            continue
+        kept.append(argument)
+    return kept
+
+
+if __name__ == "__main__":
+    main()
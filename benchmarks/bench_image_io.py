@@ -0,0 +1,104 @@
+"""Compares the old temp-file image handoff in process_page with the in-memory one.
+
+Builds a synthetic PDF with embedded images, extracts them with PyMuPDF and
+decodes each one with PIL, either through a NamedTemporaryFile (the previous
+pipeline) or straight from memory. Prints a JSON report with wall time and the
+write syscalls/bytes charged to the process (Linux /proc/self/io).
+
+    python benchmarks/bench_image_io.py --pages 300 --images-per-page 3
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import time
+
+import fitz
+from PIL import Image
+
+
+def build_pdf(pages, images_per_page, size):
+    document = fitz.open()
+    for page_number in range(pages):
+        page = document.new_page()
+        for index in range(images_per_page):
+            # Distinct pixels per image so PyMuPDF does not share xrefs
+            pixels = Image.effect_noise(size, 40 + (page_number * images_per_page + index) % 50).convert("RGB")
+            buffered = io.BytesIO()
+            pixels.save(buffered, format="PNG")
+            top = 50 + index * (size[1] // 2 + 10)
+            page.insert_image(fitz.Rect(50, top, 50 + size[0] // 2, top + size[1] // 2), stream=buffered.getvalue())
+    return document.tobytes()
+
+
+def read_io_counters():
+    counters = {}
+    try:
+        with open("/proc/self/io") as proc_io:
+            for line in proc_io:
+                name, value = line.split(":")
+                counters[name] = int(value)
+    except OSError:
+        pass
+    return counters
+
+
+def decode_via_temp_file(image_bytes):
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_image:
+        temp_image.write(image_bytes)
+        temp_image_path = temp_image.name
+    try:
+        with Image.open(temp_image_path) as image:
+            image.load()
+    finally:
+        os.remove(temp_image_path)
+
+
+def decode_in_memory(image_bytes):
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image.load()
+
+
+def run(pdf_bytes, decode):
+    before = read_io_counters()
+    started = time.perf_counter()
+    images = 0
+    with fitz.open(stream=pdf_bytes, filetype="pdf") as document:
+        for page in document:
+            for img in page.get_images(full=True):
+                decode(document.extract_image(img[0])["image"])
+                images += 1
+    elapsed = time.perf_counter() - started
+    after = read_io_counters()
+    return {
+        "images": images,
+        "seconds": round(elapsed, 4),
+        "write_syscalls": after.get("syscw", 0) - before.get("syscw", 0),
+        "bytes_written": after.get("wchar", 0) - before.get("wchar", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--images-per-page", type=int, default=2)
+    parser.add_argument("--size", type=int, default=400, help="edge of each embedded image in pixels")
+    args = parser.parse_args()
+
+    pdf_bytes = build_pdf(args.pages, args.images_per_page, (args.size, args.size))
+    temp_file = run(pdf_bytes, decode_via_temp_file)
+    in_memory = run(pdf_bytes, decode_in_memory)
+
+    print(json.dumps({
+        "benchmark": "image_io",
+        "pages": args.pages,
+        "images_per_page": args.images_per_page,
+        "temp_file": temp_file,
+        "in_memory": in_memory,
+        "speedup": round(temp_file["seconds"] / in_memory["seconds"], 2) if in_memory["seconds"] else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measures worker startup: wall time, peak RSS and which heavy backends get imported.
+
+Every sample is a fresh interpreter, so nothing is shared between runs. The
+"warm" scenario also runs api.warmup.warm_up(), i.e. what a pre-forked worker
+pays up front when WARM_UP_BACKENDS is on.
+
+    python benchmarks/bench_startup.py --repeat 7 --output startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARK_DIR)
+
+HEAVY_MODULES = ("fitz", "pptx", "PIL", "pytesseract", "azure", "msrest", "PyPDF2", "pdf2image", "requests")
+
+PRELUDE = """
+import json, os, sys
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "back.settings")
+import django
+django.setup()
+"""
+
+REPORT = """
+print(json.dumps({{"loaded": [name for name in {heavy!r} if name in sys.modules], "modules": len(sys.modules)}}))
+"""
+
+SCENARIOS = {
+    # Settings and apps only, what most management commands need
+    "setup": "",
+    # The URL conf, which imports every view module; loaded by runserver and on a worker's first request
+    "urls": "import back.urls\n",
+    "warm": "import back.urls\nfrom api.warmup import warm_up\nwarm_up()\n",
+}
+
+
+def run_once(code):
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", code], cwd=REPO_ROOT, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True)
+    output = process.stdout.read()
+    # wait4 gives this child's own resource usage, unlike RUSAGE_CHILDREN which accumulates
+    _, wait_status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(wait_status)
+    elapsed = time.perf_counter() - started
+    if process.returncode != 0:
+        raise RuntimeError(f"Startup sample exited with status {process.returncode}")
+    peak = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return elapsed, peak, json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run, repeatable; defaults to all of them")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.scenario or list(SCENARIOS):
+        code = PRELUDE + SCENARIOS[name] + REPORT.format(heavy=HEAVY_MODULES)
+        samples = [run_once(code) for _ in range(args.repeat)]
+        seconds = [elapsed for elapsed, _, _ in samples]
+        peaks = [peak for _, peak, _ in samples]
+        results.append({
+            "scenario": name,
+            "samples": args.repeat,
+            "wall_ms": {
+                "median": round(statistics.median(seconds) * 1000, 1),
+                "min": round(min(seconds) * 1000, 1),
+                "max": round(max(seconds) * 1000, 1),
+            },
+            "peak_rss_bytes": int(statistics.median(peaks)),
+            "modules": samples[-1][2]["modules"],
+            "heavy_modules_loaded": samples[-1][2]["loaded"],
+        })
+
+    output = json.dumps({"benchmark": "startup", "python": sys.version.split()[0], "results": results}, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
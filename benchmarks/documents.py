@@ -0,0 +1,97 @@
+"""Synthetic PDFs, decks and images for the benchmarks.
+
+Every builder takes a salt that varies the text and shapes. Image noise is
+random on every call, so no two builds share bytes (or file hashes) and
+repeated requests bypass the document and description caches.
+"""
+import io
+import random
+
+import fitz
+from PIL import Image, ImageDraw
+from pptx import Presentation
+from pptx.util import Inches
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua enim ad minim veniam quis nostrud"
+).split()
+
+
+def paragraph(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def build_image(size, salt=0, image_format="PNG"):
+    """A noisy image with a few shapes; noise keeps it from compressing to nothing."""
+    rng = random.Random(salt)
+    image = Image.effect_noise(size, 30 + salt % 40).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(6):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle([x, y, x + size[0] // 4, y + size[1] // 4],
+                       fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buffered = io.BytesIO()
+    image.save(buffered, format=image_format)
+    return buffered.getvalue()
+
+
+def build_text_pdf(pages, salt=0, words_per_page=400):
+    rng = random.Random(salt)
+    document = fitz.open()
+    for page_number in range(pages):
+        page = document.new_page()
+        text = f"Document {salt} page {page_number + 1}\n\n" + paragraph(rng, words_per_page)
+        page.insert_textbox(fitz.Rect(50, 50, 545, 790), text, fontsize=9)
+    return document.tobytes()
+
+
+def build_scanned_pdf(pages, salt=0, dpi=150):
+    """Pages that are a single full-page picture of text, like a scanner's output."""
+    rng = random.Random(salt)
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    document = fitz.open()
+    for page_number in range(pages):
+        image = Image.new("L", (width, height), 255)
+        draw = ImageDraw.Draw(image)
+        y = dpi // 2
+        draw.text((dpi // 2, y), f"Scanned document {salt} page {page_number + 1}", fill=0)
+        while y < height - dpi:
+            y += dpi // 6
+            draw.text((dpi // 2, y), paragraph(rng, 12), fill=0)
+        buffered = io.BytesIO()
+        image.save(buffered, format="PNG")
+        page = document.new_page()
+        page.insert_image(page.rect, stream=buffered.getvalue())
+    return document.tobytes()
+
+
+def build_image_pdf(pages, images_per_page=3, size=400, salt=0):
+    """Pages with a paragraph of text and several distinct embedded images."""
+    rng = random.Random(salt)
+    document = fitz.open()
+    for page_number in range(pages):
+        page = document.new_page()
+        page.insert_textbox(fitz.Rect(50, 30, 545, 120), paragraph(rng, 60), fontsize=9)
+        for index in range(images_per_page):
+            top = 130 + index * (size // 2 + 10)
+            image_bytes = build_image((size, size), salt * 100003 + page_number * images_per_page + index)
+            page.insert_image(fitz.Rect(50, top, 50 + size // 2, top + size // 2), stream=image_bytes)
+    return document.tobytes()
+
+
+def build_pptx(slides, images_per_slide=2, size=400, salt=0):
+    rng = random.Random(salt)
+    presentation = Presentation()
+    layout = presentation.slide_layouts[5]  # title only
+    for slide_number in range(slides):
+        slide = presentation.slides.add_slide(layout)
+        slide.shapes.title.text = f"Deck {salt} slide {slide_number + 1}"
+        body = slide.shapes.add_textbox(Inches(0.5), Inches(1.5), Inches(9), Inches(1.5))
+        body.text_frame.text = paragraph(rng, 40)
+        for index in range(images_per_slide):
+            image_bytes = build_image((size, size), salt * 100003 + slide_number * images_per_slide + index)
+            slide.shapes.add_picture(io.BytesIO(image_bytes), Inches(0.5 + index * 3), Inches(3.5), width=Inches(2.5))
+    buffered = io.BytesIO()
+    presentation.save(buffered)
+    return buffered.getvalue()
@@ -0,0 +1,168 @@
+"""Local stand-in for the OpenAI and Azure Computer Vision endpoints the API calls.
+
+Serves POST /v1/chat/completions, POST /vision/v3.2/ocr and the Azure Read pair
+(POST /vision/v3.2/read/analyze, GET /vision/v3.2/read/analyzeResults/<id>),
+with configurable latency and error rate, so benchmarks never leave the machine.
+Read operations report "running" for the first --read-polls polls.
+Chat requests asking for a JSON object (batched descriptions) get one
+description per image in the request.
+
+    python benchmarks/stub_upstream.py --port 8089 --latency-ms 300 --error-rate 0.05
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+OCR_TEXT = "The quick brown fox jumps over the lazy dog"
+
+
+class UpstreamStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.errors = 0
+
+    def record(self, route, failed):
+        with self.lock:
+            self.calls[route] = self.calls.get(route, 0) + 1
+            self.errors += failed
+
+    def snapshot(self):
+        with self.lock:
+            return {"calls": dict(self.calls), "injected_errors": self.errors}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, data, headers=()):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def simulate(self, route):
+        """Sleeps for the configured latency; returns True if this call should fail."""
+        server = self.server
+        delay = server.latency_ms + server.random.uniform(-server.jitter_ms, server.jitter_ms)
+        time.sleep(max(0.0, delay) / 1000)
+        failed = server.random.random() < server.error_rate
+        server.stats.record(route, failed)
+        if failed:
+            # Alternate between a rate limit and a server error, the two retryable cases
+            if server.random.random() < 0.5:
+                self.send_json(429, {"error": {"message": "Rate limit reached"}}, [("Retry-After", "0")])
+            else:
+                self.send_json(500, {"error": {"message": "Injected failure"}})
+        return failed
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        path = self.path.split("?", 1)[0]
+
+        if path.endswith("/chat/completions"):
+            if not self.simulate("chat"):
+                number = next(self.server.counter)
+                content = f"Stub description {number}"
+                request = json.loads(body or b"{}")
+                if request.get("response_format", {}).get("type") == "json_object":
+                    parts = [part for message in request["messages"] for part in message["content"]]
+                    images = sum(part.get("type") == "image_url" for part in parts)
+                    content = json.dumps(
+                        {"descriptions": [f"Stub description {number}.{index}" for index in range(1, images + 1)]}
+                    )
+                self.send_json(200, {
+                    "id": f"chatcmpl-{number}",
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}],
+                })
+        elif path.endswith("/vision/v3.2/ocr"):
+            if not self.simulate("ocr"):
+                words = [{"boundingBox": "0,0,10,10", "text": word} for word in OCR_TEXT.split()]
+                self.send_json(200, {
+                    "language": "en",
+                    "regions": [{"boundingBox": "0,0,10,10", "lines": [{"boundingBox": "0,0,10,10", "words": words}]}],
+                })
+        elif path.endswith("/vision/v3.2/read/analyze"):
+            if not self.simulate("read"):
+                operation = next(self.server.counter)
+                location = f"http://{self.headers.get('Host')}/vision/v3.2/read/analyzeResults/{operation}"
+                self.send_response(202)
+                self.send_header("Operation-Location", location)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+        else:
+            self.send_json(404, {"error": {"message": f"No stub for {path}"}})
+
+    def do_GET(self):
+        if "/vision/v3.2/read/analyzeResults/" in self.path:
+            if self.simulate("read_result"):
+                return
+            operation = self.path.rsplit("/", 1)[-1]
+            with self.server.stats.lock:
+                polls = self.server.read_polls_seen[operation] = self.server.read_polls_seen.get(operation, 0) + 1
+            if polls <= self.server.read_polls:
+                self.send_json(200, {"status": "running"})
+                return
+            words = [{"boundingBox": [0] * 8, "text": word, "confidence": 0.99} for word in OCR_TEXT.split()]
+            self.send_json(200, {
+                "status": "succeeded",
+                "analyzeResult": {"readResults": [{"page": 1, "lines": [{"text": OCR_TEXT, "words": words}]}]},
+            })
+        else:
+            self.send_json(404, {"error": {"message": f"No stub for {self.path}"}})
+
+
+class StubUpstream(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=None, read_polls=0):
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.counter = itertools.count(1)
+        self.stats = UpstreamStats()
+        self.read_polls = read_polls
+        self.read_polls_seen = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--read-polls", type=int, default=1)
+    args = parser.parse_args()
+
+    server = StubUpstream(args.port, args.latency_ms, args.jitter_ms, args.error_rate, read_polls=args.read_polls)
+    print(f"OPENAI_BASE_URL={server.url}/v1 AZURE_ENDPOINT={server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()